@@ -0,0 +1,175 @@
+"""Due and overdue task alerts, computed in the background.
+
+An AlertScheduler thread (or `python alerts.py`) ticks on an interval.
+Triggers queue every task written since the previous tick in
+alert_queue, and a tick records alerts in task_alerts for the queued
+tasks due today or earlier. On the first tick of a day it also
+range-scans the (completed, due_date) index over the days since the
+previous tick, and expands recurring series over them, so every missed
+repeat gets its own alert. Queued series are expanded over their whole
+past. The (task_id, due_date) key makes alerts already recorded a no-op.
+The same triggers drop alerts for tasks that are completed or
+rescheduled, so the app counts open alerts off an index, whatever the
+number of tasks. The first tick ever scans every task due so far.
+
+    python alerts.py --once
+    python alerts.py --every-seconds 60
+"""
+import argparse
+import logging
+import threading
+from datetime import date, datetime, timedelta
+
+from db import Database
+from migrations import migrate
+from recurrence import expand
+
+
+INTERVAL_SECONDS = 60
+# Most alerts the app lists at once; the rest are only counted
+SHOW_LIMIT = 20
+
+_log = logging.getLogger(__name__)
+
+# Where an alert's occurrence is still pending: a one-off task still due
+# that day, or a recurring series that hasn't moved past it
+_PENDING = """t.completed = 0 AND (a.due_date = t.due_date
+              OR (t.is_recurring = 1 AND a.due_date > t.due_date))"""
+
+
+def _last_tick(conn):
+    # The day of the last tick; older versions stored a full timestamp
+    row = conn.execute("SELECT value FROM job_state WHERE name = 'alerts_last_tick'").fetchone()
+    return date.fromisoformat(row[0][:10]) if row else None
+
+
+# A due alert turns into an overdue one the day after, and shows again
+# even if it was dismissed while only due
+_UPSERT = """ON CONFLICT (task_id, due_date) DO UPDATE SET kind = excluded.kind, dismissed = 0
+             WHERE task_alerts.kind != excluded.kind"""
+
+
+def _record(conn, today, now, source="tasks", where="1", params=()):
+    # Alerts for the pending tasks in `source` due by `today`; a task is
+    # overdue from the day after its due date
+    conn.execute(f"""INSERT INTO task_alerts (task_id, due_date, kind, created_at)
+                     SELECT id, due_date, CASE WHEN due_date = ? THEN 'due' ELSE 'overdue' END, ? FROM {source}
+                     WHERE completed = 0 AND due_date <= ? AND {where} {_UPSERT}""",
+                 (str(today), now, str(today), *params))
+
+
+def prune_alerts(conn):
+    """Drop alerts whose task was completed, rescheduled or deleted.
+
+    The alert_queue triggers do this as tasks are written; loads that
+    bypass triggers call it afterwards.
+    """
+    conn.execute(f"""DELETE FROM task_alerts AS a WHERE NOT EXISTS
+                     (SELECT 1 FROM tasks t WHERE t.id = a.task_id AND {_PENDING})""")
+
+
+def run_tick(db, today=None):
+    """Record alerts for everything due today or earlier that lacks one.
+
+    Returns the number of alerts added or escalated to overdue.
+    """
+    today = today or date.today()
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    # CROSS JOIN keeps SQLite walking the short queue rather than every
+    # open task
+    queued = "alert_queue q CROSS JOIN tasks t ON t.id = q.task_id"
+    with db.transaction() as conn:
+        last = _last_tick(conn)
+        before = conn.total_changes
+        # Tasks added or rescheduled since the last tick
+        _record(conn, today, now, queued)
+        queued_series = [row[0] for row in conn.execute(f"""SELECT q.task_id FROM {queued}
+                                                             WHERE t.is_recurring = 1 AND t.completed = 0""")]
+        # Queued series get an alert for every repeat they have missed
+        repeats = list(expand(db, date.min, today, queued_series))
+        if last is None:
+            _record(conn, today, now)
+            repeats += expand(db, today - timedelta(days=1), today)
+        elif last < today:
+            # A new day: tasks due since the last tick's day, whose alerts
+            # that day were only 'due', and every repeat that fell since
+            _record(conn, today, now, where="due_date >= ?", params=(str(last),))
+            repeats += expand(db, last, today)
+        conn.executemany(f"""INSERT INTO task_alerts (task_id, due_date, kind, created_at)
+                             VALUES (?, ?, ?, ?) {_UPSERT}""",
+                         [(task_id, str(day), "due" if day == today else "overdue", now)
+                          for task_id, day in repeats])
+        new = conn.total_changes - before
+        conn.execute("DELETE FROM alert_queue")
+        if last is None:
+            prune_alerts(conn)
+        conn.execute("INSERT OR REPLACE INTO job_state (name, value) VALUES ('alerts_last_tick', ?)", (str(today),))
+    return new
+
+
+def open_alerts(db, limit=SHOW_LIMIT):
+    """Return (count, rows) of undismissed alerts, oldest due date first.
+
+    Rows are (task_id, title, category, due_date, kind).
+    """
+    # Stale alerts are already gone, so the count needn't look at tasks
+    count = db.fetchone("SELECT COUNT(*) FROM task_alerts WHERE dismissed = 0")[0]
+    rows = db.fetchall(f"""SELECT a.task_id, t.title, t.category, a.due_date, a.kind
+                           FROM task_alerts a JOIN tasks t ON t.id = a.task_id
+                           WHERE a.dismissed = 0 AND {_PENDING}
+                           ORDER BY a.due_date, a.task_id LIMIT ?""", (limit,))
+    return count, rows
+
+
+def dismiss_alert(db, task_id, due_date):
+    db.execute("UPDATE task_alerts SET dismissed = 1 WHERE task_id = ? AND due_date = ?", (task_id, due_date))
+
+
+def dismiss_all(db):
+    db.execute("UPDATE task_alerts SET dismissed = 1 WHERE dismissed = 0")
+
+
+class AlertScheduler(threading.Thread):
+    def __init__(self, db, interval=INTERVAL_SECONDS):
+        super().__init__(name="alerts", daemon=True)
+        self.db = db
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            # A failed tick (a bad row, a locked database) is logged and
+            # retried on the next one rather than ending the thread
+            try:
+                run_tick(self.db)
+            except Exception:
+                _log.exception("Alert tick failed")
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record due and overdue task alerts.")
+    parser.add_argument("--db", default="tasks.db", help="database file (default: tasks.db)")
+    parser.add_argument("--once", action="store_true", help="run one tick and exit")
+    parser.add_argument("--every-seconds", type=float, default=INTERVAL_SECONDS)
+    args = parser.parse_args(argv)
+
+    db = Database(args.db)
+    with db.connection() as conn:
+        migrate(conn)
+    if args.once:
+        print(f"{run_tick(db)} new alerts")
+        return
+    scheduler = AlertScheduler(db, args.every_seconds)
+    scheduler.start()
+    try:
+        scheduler.join()
+    except KeyboardInterrupt:
+        scheduler.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+"""Local HTTP API over the service layer.
+
+Scripts and other tools can read and write tasks here without going
+through a Streamlit session. Handlers are async and run the service
+calls on Starlette's thread pool, against one pooled Database shared by
+all requests. List and detail responses carry a weak ETag derived from
+the table's generation counter, so a client repeating a request with
+If-None-Match gets 304 Not Modified without the query being run.
+
+    python api.py --db tasks.db --port 8502
+"""
+import argparse
+import hashlib
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import FileResponse, JSONResponse, Response
+from starlette.routing import Route
+
+import services
+from blobstore import BlobStore
+from db import Database
+from migrations import migrate
+from models import Expense, Meeting, VoiceNote
+
+
+DB_PATH = "tasks.db"
+BLOB_DIR = "voice_notes"
+MAX_PAGE_SIZE = 200
+
+
+def _dicts(rows):
+    return [row._asdict() for row in rows]
+
+
+def _error(status, message):
+    return JSONResponse({"error": message}, status_code=status)
+
+
+async def _conditional(request, table, load):
+    # The generation is read before the data: a write landing in between
+    # only costs the client one extra full response, never a stale 304
+    db = request.app.state.db
+    generation = await run_in_threadpool(services.table_generation, db, table)
+    key = hashlib.sha1(f"{request.url.path}?{request.url.query}".encode()).hexdigest()[:16]
+    etag = f'W/"{generation}-{key}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    body = await run_in_threadpool(load, db)
+    if body is None:
+        return _error(404, "Not found")
+    return JSONResponse(body, headers=headers)
+
+
+async def _body(request):
+    # Malformed JSON raises ValueError too, which the app turns into a 400
+    body = await request.json()
+    if not isinstance(body, dict):
+        raise ValueError("The request body must be a JSON object")
+    return body
+
+
+def _int_param(request, name, default=None):
+    value = request.query_params.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a whole number")
+
+
+async def _newest_page(request, key, table, column, model):
+    # Newest first, paged like /tasks: pass the `next` object's values back
+    # as after_<column> and after_id for the following page
+    limit = min(max(_int_param(request, "limit", services.PAGE_SIZE), 1), MAX_PAGE_SIZE)
+    after_id = _int_param(request, "after_id")
+    after = (request.query_params.get(f"after_{column}") or None, after_id) if after_id is not None else None
+
+    def load(db):
+        rows = services.fetch_newest_page(db, table, column, model, after, limit + 1)
+        next_page = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_page = {f"after_{column}": getattr(rows[-1], column), "after_id": rows[-1].id}
+        return {key: _dicts(rows), "next": next_page}
+
+    return await _conditional(request, table, load)
+
+
+# Tasks
+
+async def list_tasks(request):
+    query = request.query_params
+    where, params = services.task_filter(
+        completed=_int_param(request, "completed"), category=query.get("category"), project=query.get("project"),
+        area=query.get("area"), resource=query.get("resource"), search=query.get("search"))
+    limit = min(max(_int_param(request, "limit", services.PAGE_SIZE), 1), MAX_PAGE_SIZE)
+    after_id = _int_param(request, "after_id")
+    after = (query.get("after_due") or None, after_id) if after_id is not None else None
+
+    def load(db):
+        rows = services.fetch_task_page(db, where, params, after, limit + 1)
+        next_page = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_page = {"after_due": rows[-1].due_date, "after_id": rows[-1].id}
+        return {"tasks": _dicts(rows), "next": next_page}
+
+    return await _conditional(request, "tasks", load)
+
+
+async def get_task(request):
+    task_id = request.path_params["task_id"]
+
+    def load(db):
+        row = services.get_task(db, task_id)
+        return row._asdict() if row else None
+
+    return await _conditional(request, "tasks", load)
+
+
+async def create_task(request):
+    body = await _body(request)
+    if not body.get("title"):
+        return _error(400, "title is required")
+    if body.get("category") not in services.CATEGORIES:
+        return _error(400, f"category must be one of {', '.join(services.CATEGORIES)}")
+    priority = body.get("priority")
+    if priority is not None and (type(priority) is not int or priority not in services.PRIORITIES):
+        return _error(400, f"priority must be one of {', '.join(map(str, services.PRIORITIES))}")
+    fields = ["description", "project", "area", "resource", "due_date", "priority", "recurrence", "interval", "until",
+              "media_type", "year", "director", "rating"]
+    task_id = await run_in_threadpool(services.add_task, request.app.state.db, body["title"], body["category"],
+                                      **{field: body[field] for field in fields if body.get(field) is not None})
+    return JSONResponse({"id": task_id}, status_code=201)
+
+
+async def delete_task(request):
+    await run_in_threadpool(services.delete_tasks, request.app.state.db, [request.path_params["task_id"]])
+    return Response(status_code=204)
+
+
+async def complete_task(request):
+    db, task_id = request.app.state.db, request.path_params["task_id"]
+    if await run_in_threadpool(services.get_task, db, task_id) is None:
+        return _error(404, "Not found")
+    await run_in_threadpool(services.complete_tasks, db, [task_id])
+    return Response(status_code=204)
+
+
+async def skip_occurrence(request):
+    if not await run_in_threadpool(services.skip_occurrence, request.app.state.db, request.path_params["task_id"]):
+        return _error(404, "Not found")
+    return Response(status_code=204)
+
+
+async def bulk_update(request):
+    body = await _body(request)
+    db, ids, action = request.app.state.db, body.get("ids", []), body.get("action")
+    if not isinstance(ids, list) or any(type(task_id) is not int for task_id in ids):
+        return _error(400, "ids must be a list of task ids")
+    if action == "complete":
+        await run_in_threadpool(services.complete_tasks, db, ids)
+    elif action == "delete":
+        await run_in_threadpool(services.delete_tasks, db, ids)
+    elif action == "move":
+        if body.get("category") not in services.CATEGORIES:
+            return _error(400, f"category must be one of {', '.join(services.CATEGORIES)}")
+        await run_in_threadpool(services.move_tasks, db, ids, body["category"])
+    elif action == "shift":
+        days = body.get("days", 0)
+        if type(days) is not int:
+            return _error(400, "days must be a whole number")
+        await run_in_threadpool(services.shift_due_dates, db, ids, days)
+    else:
+        return _error(400, "action must be one of complete, delete, move, shift")
+    return JSONResponse({"updated": len(ids)})
+
+
+# Subtasks
+
+async def list_subtasks(request):
+    task_id = request.path_params["task_id"]
+    return await _conditional(request, "subtasks",
+                              lambda db: _dicts(services.subtasks_for(db, task_id)))
+
+
+async def create_subtask(request):
+    body = await _body(request)
+    if not body.get("title"):
+        return _error(400, "title is required")
+    db, task_id = request.app.state.db, request.path_params["task_id"]
+    if await run_in_threadpool(services.get_task, db, task_id) is None:
+        return _error(404, "Not found")
+    subtask_id = await run_in_threadpool(services.add_subtask, db, task_id, body["title"])
+    return JSONResponse({"id": subtask_id}, status_code=201)
+
+
+async def update_subtask(request):
+    body = await _body(request)
+    await run_in_threadpool(services.set_subtask_completed, request.app.state.db,
+                            request.path_params["subtask_id"], bool(body.get("completed")))
+    return Response(status_code=204)
+
+
+# Meetings, expenses and voice notes
+
+async def list_meetings(request):
+    return await _newest_page(request, "meetings", "meetings", "date", Meeting)
+
+
+async def create_meeting(request):
+    body = await _body(request)
+    if not body.get("title"):
+        return _error(400, "title is required")
+    fields = ["summary", "attendees", "action_items", "date", "duration", "location"]
+    meeting_id = await run_in_threadpool(services.add_meeting, request.app.state.db, body["title"],
+                                         **{field: body.get(field) for field in fields})
+    return JSONResponse({"id": meeting_id}, status_code=201)
+
+
+async def list_expenses(request):
+    return await _newest_page(request, "expenses", "expenses", "date", Expense)
+
+
+async def create_expense(request):
+    # Receipts are uploaded through the app; the API records the expense only
+    body = await _body(request)
+    if not body.get("description") or not isinstance(body.get("amount"), (int, float)):
+        return _error(400, "description and a numeric amount are required")
+    expense_id = await run_in_threadpool(services.add_expense, request.app.state.db, None, body["description"],
+                                         body["amount"], body.get("category"), body.get("date"))
+    return JSONResponse({"id": expense_id}, status_code=201)
+
+
+async def list_voice_notes(request):
+    return await _newest_page(request, "voice_notes", "voice_notes", "created_at", VoiceNote)
+
+
+async def voice_note_audio(request):
+    # Served from disk; FileResponse answers Range requests, so players can
+    # seek and start playing without downloading the whole recording
+    note = await run_in_threadpool(services.get_voice_note, request.app.state.db, request.path_params["note_id"])
+    if note is None or not note.audio_hash:
+        return _error(404, "Not found")
+    return FileResponse(request.app.state.store.path(note.audio_hash), media_type=note.audio_format or "audio/wav",
+                        headers={"Cache-Control": "private, max-age=31536000, immutable"})
+
+
+async def delete_voice_note(request):
+    await run_in_threadpool(services.delete_voice_note, request.app.state.db, request.path_params["note_id"])
+    return Response(status_code=204)
+
+
+async def search(request):
+    term = request.query_params.get("q", "")
+    limit = min(max(_int_param(request, "limit", 20), 1), MAX_PAGE_SIZE)
+    results = await run_in_threadpool(services.search_everything, request.app.state.db, term, limit)
+    return JSONResponse([{"kind": kind, "id": row_id, "title": title, "snippet": snippet}
+                         for _, kind, row_id, title, snippet in results])
+
+
+async def _value_error(request, exc):
+    return _error(400, str(exc))
+
+
+def create_app(db_path=DB_PATH, blob_dir=BLOB_DIR):
+    @asynccontextmanager
+    async def lifespan(app):
+        app.state.db = Database(db_path)
+        app.state.store = BlobStore(blob_dir)
+        with app.state.db.connection() as conn:
+            migrate(conn)
+        yield
+        app.state.db.close()
+
+    routes = [
+        Route("/tasks", list_tasks, methods=["GET"]),
+        Route("/tasks", create_task, methods=["POST"]),
+        Route("/tasks/bulk", bulk_update, methods=["POST"]),
+        Route("/tasks/{task_id:int}", get_task, methods=["GET"]),
+        Route("/tasks/{task_id:int}", delete_task, methods=["DELETE"]),
+        Route("/tasks/{task_id:int}/complete", complete_task, methods=["POST"]),
+        Route("/tasks/{task_id:int}/skip", skip_occurrence, methods=["POST"]),
+        Route("/tasks/{task_id:int}/subtasks", list_subtasks, methods=["GET"]),
+        Route("/tasks/{task_id:int}/subtasks", create_subtask, methods=["POST"]),
+        Route("/subtasks/{subtask_id:int}", update_subtask, methods=["PATCH"]),
+        Route("/meetings", list_meetings, methods=["GET"]),
+        Route("/meetings", create_meeting, methods=["POST"]),
+        Route("/expenses", list_expenses, methods=["GET"]),
+        Route("/expenses", create_expense, methods=["POST"]),
+        Route("/voice-notes", list_voice_notes, methods=["GET"]),
+        Route("/voice-notes/{note_id:int}/audio", voice_note_audio, methods=["GET"]),
+        Route("/voice-notes/{note_id:int}", delete_voice_note, methods=["DELETE"]),
+        Route("/search", search, methods=["GET"]),
+    ]
+    return Starlette(routes=routes, lifespan=lifespan, exception_handlers={ValueError: _value_error})
+
+
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve the task API over HTTP.")
+    parser.add_argument("--db", default=DB_PATH, help="database file (default: tasks.db)")
+    parser.add_argument("--blobs", default=BLOB_DIR, help="blob store directory (default: voice_notes)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    args = parser.parse_args(argv)
+    uvicorn.run(create_app(args.db, args.blobs), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Voice-note audio encoding.
+
+The recorder hands over uncompressed WAV. Before it is stored, a
+recording is mixed down to mono, resampled to 16 kHz (wideband speech,
+and what speech-to-text models expect) and encoded as Opus in an Ogg
+container, which takes around a twentieth of the space of the WAV.
+Decoding and encoding go through libsndfile (the soundfile package).
+
+Notes saved before this keep their original encoding; they can be
+compressed in place with
+
+    python audio.py --db tasks.db
+"""
+import argparse
+import io
+
+import numpy as np
+import soundfile as sf
+
+from blobstore import BlobStore
+from db import Database
+from migrations import migrate
+
+
+STORED_FORMAT = "audio/ogg"
+STORED_RATE = 16000
+# Taps of the low-pass filter applied before downsampling
+FILTER_TAPS = 63
+
+
+def decode(data):
+    """Return (mono float32 samples, sample rate) for any format libsndfile reads.
+
+    Raises ValueError for audio it can't decode.
+    """
+    try:
+        samples, rate = sf.read(io.BytesIO(data), dtype="float32", always_2d=True)
+    except sf.LibsndfileError as e:
+        raise ValueError(f"Can't decode the recording: {e.error_string}")
+    return samples.mean(axis=1), rate
+
+
+def resample(samples, rate, target=STORED_RATE):
+    if rate == target or not len(samples):
+        return samples
+    if rate > target:
+        # Windowed-sinc low-pass at the new Nyquist frequency, so nothing
+        # above it folds back into the audible range
+        cutoff = target / rate
+        n = np.arange(FILTER_TAPS) - (FILTER_TAPS - 1) / 2
+        taps = np.sinc(cutoff * n) * cutoff * np.hamming(FILTER_TAPS)
+        samples = np.convolve(samples, taps.astype(np.float32), mode="same")
+        if rate % target == 0:
+            return samples[::rate // target]
+    positions = np.arange(int(len(samples) * target / rate)) * (rate / target)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def compress(data):
+    """Encode a recording for storage and return (bytes, duration in seconds)."""
+    samples, rate = decode(data)
+    samples = resample(samples, rate)
+    out = io.BytesIO()
+    sf.write(out, samples, STORED_RATE, format="OGG", subtype="OPUS")
+    return out.getvalue(), len(samples) / STORED_RATE
+
+
+def compress_voice_notes(db, store):
+    """Re-encode voice notes saved before compression. Returns how many were.
+
+    The original blobs stay in the store, since snapshots and backups of
+    the database may still refer to them.
+    """
+    notes = db.fetchall("SELECT id, audio_hash FROM voice_notes WHERE audio_format IS NULL AND audio_hash IS NOT NULL")
+    compressed = 0
+    for note_id, audio_hash in notes:
+        try:
+            data, duration = compress(store.read(audio_hash))
+        except (OSError, ValueError):
+            continue
+        digest, size = store.put(data)
+        db.execute("""UPDATE voice_notes SET audio_hash = ?, audio_size = ?, audio_format = ?, duration = ?
+                      WHERE id = ?""", (digest, size, STORED_FORMAT, duration, note_id))
+        compressed += 1
+    return compressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compress voice notes saved as uncompressed audio.")
+    parser.add_argument("--db", default="tasks.db", help="database file (default: tasks.db)")
+    parser.add_argument("--blobs", default="voice_notes", help="blob store directory (default: voice_notes)")
+    args = parser.parse_args(argv)
+
+    db = Database(args.db)
+    with db.connection() as conn:
+        migrate(conn)
+    print(f"{compress_voice_notes(db, BlobStore(args.blobs))} voice notes compressed")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+"""Benchmarks for the app's hot paths.
+
+    python -m benchmarks.generate bench.db --scale 100000
+    python -m benchmarks.run --scale 100000 --output results.json
+"""
@@ -0,0 +1,149 @@
+"""Seeded synthetic data for benchmarking.
+
+`generate` fills a fresh database with `scale` tasks and proportional
+numbers of subtasks, meetings, expenses and voice notes. The same seed and
+anchor date always give the same rows. Text is drawn from a fixed
+vocabulary with a skewed word distribution, so search terms range from
+very common to rare the way real notes do.
+
+    python -m benchmarks.generate bench.db --scale 100000
+"""
+import argparse
+import os
+import random
+from datetime import date, timedelta
+from itertools import accumulate
+
+from db import Database
+from migrations import FTS_TABLES, migrate
+from recurrence import PATTERNS
+from services import CATEGORIES
+
+
+SCALES = [1_000, 10_000, 100_000, 1_000_000]
+# Rows of each table per task
+SUBTASKS_PER_TASK = 1.0
+MEETINGS_PER_TASK = 0.1
+EXPENSES_PER_TASK = 1.0
+VOICE_NOTES_PER_TASK = 0.01
+
+_SYLLABLES = ["ka", "lo", "mi", "ra", "te", "su", "no", "vi", "de", "pa", "zu", "ri", "on", "el", "ta", "go"]
+# Every two-syllable word, plus some three-syllable ones for a long tail
+VOCABULARY = ([a + b for a in _SYLLABLES for b in _SYLLABLES]
+              + [a + b + c for a in _SYLLABLES[:8] for b in _SYLLABLES for c in _SYLLABLES[:4]])
+PROJECTS = [f"Project {word.title()}" for word in VOCABULARY[:40]]
+AREAS = ["Health", "Finance", "Career", "Home", "Learning", "Family"]
+RESOURCES = ["Book", "Course", "Website", "Article", "Video", None]
+EXPENSE_CATEGORIES = ["Travel", "Food", "Office", "Software", "Hardware", "Training", None]
+LOCATIONS = ["Room A", "Room B", "Online", "Cafe", None]
+
+
+class _Text:
+    def __init__(self, rng):
+        self.rng = rng
+        # Zipf-like weights: the first words are far more common than the last
+        self.cum_weights = list(accumulate(1 / (rank + 1) for rank in range(len(VOCABULARY))))
+
+    def words(self, low, high):
+        return " ".join(self.rng.choices(VOCABULARY, cum_weights=self.cum_weights,
+                                         k=self.rng.randint(low, high))).capitalize()
+
+
+def _insert(db, table, columns, rows):
+    # One transaction per table, with its per-row triggers dropped for the
+    # load and their work (search index, generation counter) done once after
+    with db.transaction() as conn:
+        triggers = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = ?",
+                                (table,)).fetchall()
+        for name, _ in triggers:
+            conn.execute(f"DROP TRIGGER {name}")
+        conn.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                         rows)
+        for _, sql in triggers:
+            conn.execute(sql)
+        if table in FTS_TABLES:
+            conn.execute(f"INSERT INTO {table}_fts ({table}_fts) VALUES ('rebuild')")
+        conn.execute("UPDATE table_generations SET generation = generation + 1 WHERE name = ?", (table,))
+
+
+def _day(anchor, offset):
+    return str(anchor + timedelta(days=offset))
+
+
+def _tasks(rng, text, scale, anchor):
+    for task_id in range(1, scale + 1):
+        category = rng.choice(CATEGORIES)
+        due = _day(anchor, rng.randint(-365, 365)) if rng.random() < 0.9 else None
+        recurrence = rng.choice(PATTERNS) if due and rng.random() < 0.02 else None
+        media = category == "Media"
+        yield (task_id, text.words(2, 6), text.words(5, 20) if rng.random() < 0.5 else None, category,
+               rng.choice(PROJECTS) if rng.random() < 0.6 else None, rng.choice(AREAS), rng.choice(RESOURCES),
+               f"{_day(anchor, rng.randint(-730, 0))} 09:00:00", due, rng.randint(1, 3),
+               1 if recurrence else 0, recurrence, 1 if not recurrence and rng.random() < 0.4 else 0,
+               rng.choice(["Movie", "Book", "TV Show"]) if media else None,
+               str(rng.randint(1970, 2024)) if media else None, text.words(2, 2) if media else None,
+               rng.randint(1, 5) if media else None)
+
+
+def generate(path, scale, seed=0, anchor=None):
+    """Create a database at `path` (replacing any there) and return its row counts."""
+    anchor = anchor or date.today()
+    for suffix in ["", "-wal", "-shm"]:
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    rng = random.Random(seed)
+    text = _Text(rng)
+    db = Database(path)
+    with db.connection() as conn:
+        migrate(conn)
+
+    _insert(db, "tasks", ["id", "title", "description", "category", "project", "area", "resource", "created_at",
+                          "due_date", "priority", "is_recurring", "recurrence_pattern", "completed", "media_type",
+                          "year", "director", "rating"], _tasks(rng, text, scale, anchor))
+    db.execute("""INSERT INTO recurrence_rules (task_id, freq, dtstart)
+                  SELECT id, recurrence_pattern, due_date FROM tasks WHERE is_recurring = 1""")
+
+    subtasks = int(scale * SUBTASKS_PER_TASK)
+    _insert(db, "subtasks", ["task_id", "title", "completed"],
+            ((rng.randint(1, scale), text.words(2, 5), int(rng.random() < 0.5)) for _ in range(subtasks)))
+
+    meetings = int(scale * MEETINGS_PER_TASK)
+    _insert(db, "meetings", ["title", "summary", "attendees", "action_items", "date", "duration", "location",
+                             "created_at"],
+            ((text.words(2, 5), text.words(10, 40), text.words(2, 6), text.words(3, 12),
+              _day(anchor, rng.randint(-365, 60)), rng.choice([15, 30, 45, 60, 90]), rng.choice(LOCATIONS),
+              f"{_day(anchor, rng.randint(-365, 0))} 10:00:00") for _ in range(meetings)))
+
+    # Expenses are mostly entered around the day they happen, so ids
+    # roughly follow dates as they do in real use
+    expenses = int(scale * EXPENSES_PER_TASK)
+    _insert(db, "expenses", ["description", "amount", "category", "date", "created_at"],
+            ((text.words(1, 4), round(rng.lognormvariate(3, 1), 2), rng.choice(EXPENSE_CATEGORIES), day,
+              f"{day} 12:00:00")
+             for day in (_day(anchor, -730 + i * 730 // max(expenses, 1) + rng.randint(-3, 3))
+                         for i in range(expenses))))
+
+    # Metadata and transcripts only; there is no audio behind them
+    voice_notes = int(scale * VOICE_NOTES_PER_TASK)
+    _insert(db, "voice_notes", ["title", "transcript", "audio_format", "duration", "created_at"],
+            ((text.words(2, 4), text.words(20, 120), "audio/ogg", rng.uniform(5, 300),
+              f"{_day(anchor, rng.randint(-365, 0))} 08:00:00") for _ in range(voice_notes)))
+
+    db.close()
+    return {"tasks": scale, "subtasks": subtasks, "meetings": meetings, "expenses": expenses,
+            "voice_notes": voice_notes}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic database for benchmarks.")
+    parser.add_argument("path")
+    parser.add_argument("--scale", type=int, default=10_000, help="number of tasks (default: 10000)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--anchor", type=date.fromisoformat, help="date generated dates center on (default: today)")
+    args = parser.parse_args(argv)
+    counts = generate(args.path, args.scale, args.seed, args.anchor)
+    print(", ".join(f"{count} {table}" for table, count in counts.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,496 @@
+"""Headless benchmarks of the app's hot paths.
+
+Each benchmark makes the same service, stats, timeline, report and backup
+calls task_manager.py makes to prepare one page, against a database from
+benchmarks.generate; no browser or Streamlit session is involved.
+Datasets are generated once per (scale, seed, anchor) and reused, and the
+benchmarks run on a working copy, so the ones that write never change the
+next run's input.
+
+Results are written as JSON. Passing an earlier results file as
+--compare reports every benchmark whose median got slower by more than
+--tolerance, and exits with status 1 if any did.
+
+    python -m benchmarks.run --scale 10000 --output results.json
+    python -m benchmarks.run --scale 100000 --memory --plans --compare baseline.json
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import pickle
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+import expense_report
+import services
+import stats
+import timeline
+from alerts import open_alerts, run_tick
+from backup import export_backup, import_backup
+from db import Database
+from importer import import_tasks
+from migrations import migrate
+from models import Task, TaskCard, columns, row_factory
+from recurrence import load_rules
+
+from benchmarks.generate import generate
+
+
+RESULTS_VERSION = 1
+REPEAT = 5
+TOLERANCE = 0.25
+# Most rows the row-listing and import benchmarks use, whatever the scale
+LIST_ROWS = 100_000
+IMPORT_ROWS = 100_000
+# The importer's throughput goal. It isn't met: see the import benchmarks.
+IMPORT_TARGET_ROWS_PER_S = 50_000
+
+# (name, function, setup, memory, target); see `benchmark`
+BENCHMARKS = []
+
+# The app's category icons and Gantt colors
+ICONS = {"Work": "💼", "Studies": "📚", "Personal": "🏠", "Media": "🎬", "Misc": "📦"}
+COLORS = {"Work": "#2ecc71", "Studies": "#3498db", "Personal": "#9b59b6", "Media": "#e67e22", "Misc": "#34495e"}
+
+
+def benchmark(name, setup=None, memory=False, target=None):
+    """Register `function(ctx, prepared)` as benchmark `name`.
+
+    `setup(ctx)`, if given, runs untimed before every run and its result is
+    passed in as `prepared`. The function may return the number of rows it
+    handled, which is reported as a rate, and checked against `target`
+    rows/s if one is given. With `memory`, peak memory is recorded even
+    without --memory.
+    """
+    def register(function):
+        BENCHMARKS.append((name, function, setup, memory, target))
+        return function
+    return register
+
+
+class Context:
+    def __init__(self, db, path, workdir, anchor):
+        self.db = db
+        self.path = path
+        self.workdir = workdir
+        self.today = anchor
+
+
+# View Tasks: one page with its recurrence rules and subtasks, as main() builds it
+
+def _task_page(db, where, params):
+    services.count_tasks(db, where, params)
+    rows = services.fetch_task_page(db, where, params, None, services.PAGE_SIZE + 1, TaskCard)[:services.PAGE_SIZE]
+    ids = [task.id for task in rows]
+    load_rules(db, [task.id for task in rows if task.is_recurring])
+    services.subtask_progress(db, ids)
+    services.subtasks_by_task(db, ids)
+    return len(rows)
+
+
+@benchmark("view_tasks.all")
+def view_all(ctx, _):
+    return _task_page(ctx.db, *services.task_filter(completed=0))
+
+
+@benchmark("view_tasks.category")
+def view_category(ctx, _):
+    return _task_page(ctx.db, *services.task_filter(completed=0, category="Work"))
+
+
+@benchmark("view_tasks.project")
+def view_project(ctx, _):
+    projects = services.distinct_values(ctx.db, "project")
+    return _task_page(ctx.db, *services.task_filter(completed=0, project=projects[0]))
+
+
+@benchmark("view_tasks.search")
+def view_search(ctx, _):
+    return _task_page(ctx.db, *services.task_filter(completed=0, search="kalo mi"))
+
+
+@benchmark("view_tasks.list_rows")
+def list_rows(ctx, _):
+    # Every column of up to LIST_ROWS tasks through the Task row model
+    return len(services.fetch_task_page(ctx.db, "1", (), None, LIST_ROWS, Task))
+
+
+# The same LIST_ROWS tasks read the way views did before the row models,
+# and with the columns a task card renders; compare their times and peaks
+
+@benchmark("view_tasks.list_rows_select_star", memory=True)
+def list_rows_select_star(ctx, _):
+    return len(ctx.db.fetchall("SELECT * FROM tasks LIMIT ?", (LIST_ROWS,)))
+
+
+@benchmark("view_tasks.list_rows_task_card", memory=True)
+def list_rows_task_card(ctx, _):
+    return len(ctx.db.fetchall(f"SELECT {columns(TaskCard)} FROM tasks LIMIT ?", (LIST_ROWS,), row_factory(TaskCard)))
+
+
+# Other pages
+
+@benchmark("search.everything")
+def search_everything(ctx, _):
+    return len(services.search_everything(ctx.db, "kalo mi"))
+
+
+@benchmark("search.everything_common")
+def search_everything_common(ctx, _):
+    # The generator's most frequent word
+    return len(services.search_everything(ctx.db, "kaka"))
+
+
+@benchmark("search.everything_prefix")
+def search_everything_prefix(ctx, _):
+    # What the Search page runs after the first two keystrokes
+    return len(services.search_everything(ctx.db, "ka"))
+
+
+@benchmark("complete_task.choices")
+def complete_choices(ctx, _):
+    return len(services.incomplete_tasks(ctx.db))
+
+
+def _statistics(ctx):
+    # The body of task_statistics, which the app caches between writes
+    total, completed = stats.completion_counts(ctx.db)
+    overdue_count, overdue_rows = stats.overdue_tasks(ctx.db, ctx.today)
+    return {"total": total, "completed": completed, "categories": stats.category_counts(ctx.db),
+            "priorities": stats.priority_counts(ctx.db), "overdue_count": overdue_count, "overdue": overdue_rows}
+
+
+@benchmark("statistics.aggregates")
+def statistics_aggregates(ctx, _):
+    # A cold rerun, or the first one after a write
+    return _statistics(ctx)["overdue_count"]
+
+
+def _cached_statistics(ctx):
+    return {(services.table_generation(ctx.db, "tasks"), ctx.today): pickle.dumps(_statistics(ctx))}
+
+
+@benchmark("statistics.cached", setup=_cached_statistics)
+def statistics_cached(ctx, cache):
+    # A rerun with no write since: the generation lookup that keys the
+    # cache, and the copy st.cache_data unpickles from it
+    return pickle.loads(cache[(services.table_generation(ctx.db, "tasks"), ctx.today)])["overdue_count"]
+
+
+@benchmark("gantt.detail")
+def gantt_detail(ctx, _):
+    start, end = ctx.today, ctx.today + timedelta(days=3)
+    occurrences = timeline.occurrence_frame(ctx.db, start, end)
+    timeline.count_in_window(ctx.db, start, end, occurrences)
+    frame = timeline.task_frame(ctx.db, start, end, occurrences)
+    timeline.timeline_figure(frame, ICONS, COLORS)
+    return len(frame)
+
+
+@benchmark("gantt.density")
+def gantt_density(ctx, _):
+    # The page's default window
+    start, end = ctx.today - timedelta(days=30), ctx.today + timedelta(days=90)
+    occurrences = timeline.occurrence_frame(ctx.db, start, end)
+    count = timeline.count_in_window(ctx.db, start, end, occurrences)
+    timeline.density_figure(timeline.density_frame(ctx.db, start, end, occurrences), COLORS)
+    return count
+
+
+@benchmark("media_library.list")
+def media_list(ctx, _):
+    return len(services.media_tasks(ctx.db))
+
+
+def _reset_alerts(ctx):
+    with ctx.db.transaction() as conn:
+        conn.execute("DELETE FROM task_alerts")
+        conn.execute("DELETE FROM job_state WHERE name = 'alerts_last_tick'")
+
+
+@benchmark("alerts.first_tick", setup=_reset_alerts)
+def alerts_tick(ctx, _):
+    return run_tick(ctx.db, ctx.today)
+
+
+def _queue_writes(ctx):
+    # A minute's worth of edits since a tick earlier the same day
+    run_tick(ctx.db, ctx.today)
+    with ctx.db.transaction() as conn:
+        conn.execute("UPDATE tasks SET due_date = due_date WHERE id % 2000 = 0")
+
+
+@benchmark("alerts.tick", setup=_queue_writes)
+def alerts_next_tick(ctx, _):
+    return run_tick(ctx.db, ctx.today)
+
+
+def _yesterdays_tick(ctx):
+    run_tick(ctx.db, ctx.today)
+    with ctx.db.transaction() as conn:
+        conn.execute("UPDATE job_state SET value = ? WHERE name = 'alerts_last_tick'",
+                     (str(ctx.today - timedelta(days=1)),))
+
+
+@benchmark("alerts.next_day", setup=_yesterdays_tick)
+def alerts_next_day(ctx, _):
+    return run_tick(ctx.db, ctx.today)
+
+
+@benchmark("alerts.open")
+def alerts_open(ctx, _):
+    return open_alerts(ctx.db)[0]
+
+
+@benchmark("expenses.summary")
+def expenses_summary(ctx, _):
+    summary = expense_report.summarize(expense_report.daily_totals(ctx.db, *expense_report.expense_filter()))
+    return summary.count
+
+
+@benchmark("expenses.summary_year")
+def expenses_summary_year(ctx, _):
+    where, params = expense_report.expense_filter(ctx.today - timedelta(days=365), ctx.today)
+    summary = expense_report.summarize(expense_report.daily_totals(ctx.db, where, params))
+    services.list_expenses(ctx.db, where, params, 50)
+    return summary.count
+
+
+@benchmark("expenses.csv_year")
+def expenses_csv(ctx, _):
+    where, params = expense_report.expense_filter(ctx.today - timedelta(days=365), ctx.today)
+    return expense_report.csv_report(ctx.db, where, params).count("\n") - 1
+
+
+@benchmark("voice_notes.list")
+def voice_notes_list(ctx, _):
+    return len(services.list_voice_notes(ctx.db))
+
+
+@benchmark("backup.export")
+def backup_export(ctx, _):
+    return sum(export_backup(ctx.db, io.BytesIO()).values())
+
+
+def _export(ctx):
+    out = io.BytesIO()
+    export_backup(ctx.db, out)
+    return out.getvalue()
+
+
+@benchmark("backup.restore", setup=_export)
+def backup_restore(ctx, backup):
+    # Restores a fresh export of the database, leaving the same rows behind
+    return sum(import_backup(ctx.db, io.BytesIO(backup)).values())
+
+
+IMPORT_FIELDS = ["title", "category", "project", "due_date", "priority", "completed"]
+
+
+def _import_source(ctx):
+    # An empty database to import into, and up to IMPORT_ROWS records
+    path = os.path.join(ctx.workdir, "import.db")
+    for suffix in ["", "-wal", "-shm"]:
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    db = Database(path)
+    with db.connection() as conn:
+        migrate(conn)
+    records = [{field: getattr(task, field) for field in IMPORT_FIELDS}
+               for task in services.fetch_task_page(ctx.db, "1", (), None, IMPORT_ROWS, Task)]
+    return db, records
+
+
+def _jsonl_source(ctx):
+    db, records = _import_source(ctx)
+    return db, [json.dumps(record) for record in records]
+
+
+def _csv_source(ctx):
+    db, records = _import_source(ctx)
+    out = io.StringIO()
+    writer = csv.DictWriter(out, IMPORT_FIELDS)
+    writer.writeheader()
+    writer.writerows(records)
+    return db, out.getvalue().splitlines(keepends=True)
+
+
+def _import(db, lines, fmt):
+    try:
+        return import_tasks(db, lines, fmt).inserted
+    finally:
+        db.close()
+
+
+@benchmark("import.jsonl", setup=_jsonl_source, target=IMPORT_TARGET_ROWS_PER_S)
+def import_jsonl(ctx, prepared):
+    return _import(*prepared, "jsonl")
+
+
+@benchmark("import.csv", setup=_csv_source, target=IMPORT_TARGET_ROWS_PER_S)
+def import_csv(ctx, prepared):
+    return _import(*prepared, "csv")
+
+
+# Running
+
+def _time(ctx, function, setup, repeat):
+    times, rows = [], None
+    # One untimed warm-up run fills SQLite's page cache
+    for run in range(repeat + 1):
+        prepared = setup(ctx) if setup else None
+        started = time.perf_counter()
+        rows = function(ctx, prepared)
+        if run:
+            times.append(time.perf_counter() - started)
+    return times, rows
+
+
+def _peak_memory(ctx, function, setup):
+    prepared = setup(ctx) if setup else None
+    tracemalloc.start()
+    try:
+        function(ctx, prepared)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _query_plans(ctx, function, setup):
+    # Every statement the benchmark runs, with EXPLAIN QUERY PLAN for the reads
+    prepared = setup(ctx) if setup else None
+    statements = []
+    with ctx.db.connection() as conn:
+        conn.set_trace_callback(statements.append)
+        try:
+            function(ctx, prepared)
+        finally:
+            conn.set_trace_callback(None)
+        plans = {}
+        for sql in statements:
+            if sql.lstrip().upper().startswith("SELECT") and sql not in plans:
+                plans[sql] = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+    return [{"sql": " ".join(sql.split()), "plan": plan} for sql, plan in plans.items()]
+
+
+def _environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"python": platform.python_version(), "sqlite": sqlite3.sqlite_version, "platform": platform.platform(),
+            "cpus": os.cpu_count(), "commit": commit or None}
+
+
+def _dataset(args, anchor):
+    if args.db:
+        return args.db
+    os.makedirs(args.data_dir, exist_ok=True)
+    path = os.path.join(args.data_dir, f"tasks-{args.scale}-{args.seed}-{anchor}.db")
+    if not os.path.exists(path):
+        print(f"Generating {args.scale} tasks into {path}", file=sys.stderr)
+        generate(path + ".tmp", args.scale, args.seed, anchor)
+        os.replace(path + ".tmp", path)
+    return path
+
+
+def run(args):
+    anchor = args.anchor or date.today()
+    source = _dataset(args, anchor)
+    selected = [entry for entry in BENCHMARKS if not args.only or any(entry[0].startswith(p) for p in args.only)]
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "tasks.db")
+        with sqlite3.connect(source) as src, sqlite3.connect(path) as dst:
+            src.backup(dst)
+        db = Database(path)
+        with db.connection() as conn:
+            migrate(conn)
+        ctx = Context(db, path, workdir, anchor)
+        counts = {table: db.fetchone(f"SELECT COUNT(*) FROM {table}")[0]
+                  for table in ["tasks", "subtasks", "meetings", "expenses", "voice_notes"]}
+        for name, function, setup, memory, target in selected:
+            times, rows = _time(ctx, function, setup, args.repeat)
+            median = statistics.median(times)
+            result = {"runs": len(times), "min_s": min(times), "median_s": median, "mean_s": statistics.fmean(times),
+                      "rows": rows, "rows_per_s": rows / median if rows and median else None}
+            if target:
+                result["target_rows_per_s"] = target
+                result["meets_target"] = bool(result["rows_per_s"] and result["rows_per_s"] >= target)
+            if args.memory or memory:
+                result["peak_bytes"] = _peak_memory(ctx, function, setup)
+            if args.plans:
+                result["plans"] = _query_plans(ctx, function, setup)
+            results[name] = result
+            rate = f"  {result['rows_per_s']:>12,.0f} rows/s" if result["rows_per_s"] else ""
+            peak = f"  {result['peak_bytes'] / 1e6:>8.1f} MB peak" if "peak_bytes" in result else ""
+            missed = f"  (target {target:,} rows/s missed)" if target and not result["meets_target"] else ""
+            print(f"{name:<34} {median * 1000:>10.1f} ms{rate}{peak}{missed}", file=sys.stderr)
+        db.close()
+    return {
+        "version": RESULTS_VERSION,
+        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "environment": _environment(),
+        "dataset": {"scale": args.scale if not args.db else None, "seed": args.seed, "anchor": str(anchor),
+                    "source": os.path.abspath(source), "rows": counts},
+        "results": results,
+    }
+
+
+def compare(current, baseline, tolerance=TOLERANCE):
+    """Return [(name, baseline median, current median)] for benchmarks that slowed down."""
+    regressions = []
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if before and result["median_s"] > before["median_s"] * (1 + tolerance):
+            regressions.append((name, before["median_s"], result["median_s"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the app's hot paths headlessly.")
+    parser.add_argument("--scale", type=int, default=10_000, help="tasks in the generated dataset (default: 10000)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--anchor", type=date.fromisoformat,
+                        help="date the dataset centers on and benchmarks treat as today (default: today)")
+    parser.add_argument("--db", help="benchmark a copy of this database instead of a generated one")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "tasker-benchmarks"),
+                        help="where generated datasets are kept for reuse")
+    parser.add_argument("--only", nargs="*", metavar="PREFIX", help="run only benchmarks whose names start so")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help=f"timed runs per benchmark (default: {REPEAT})")
+    parser.add_argument("--memory", action="store_true", help="also record peak Python memory (one extra run)")
+    parser.add_argument("--plans", action="store_true", help="also record EXPLAIN QUERY PLAN for every SELECT")
+    parser.add_argument("--output", help="write results JSON here (default: stdout)")
+    parser.add_argument("--compare", metavar="BASELINE", help="results JSON to check for regressions against")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help=f"allowed slowdown before a regression is reported (default: {TOLERANCE})")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: {before * 1000:.1f} ms -> {after * 1000:.1f} ms", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
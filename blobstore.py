@@ -0,0 +1,177 @@
+"""Content-addressed file store for receipt images and voice-note audio.
+
+Blobs are stored on disk under their SHA-256 digest, fanned out into
+two-character subdirectories, so identical uploads are stored once.
+Database rows keep only the digest and size.
+
+Deleting a row leaves its blob behind, since other rows, snapshots and
+backups may still refer to it. collect_garbage() removes blobs nothing
+has referred to for a grace period.
+"""
+import hashlib
+import io
+import os
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta
+
+
+CHUNK_SIZE = 64 * 1024
+# job_state entries
+EXTERNALIZED = "blobs_externalized"
+LAST_GC = "blobs_last_gc"
+GC_INTERVAL = timedelta(days=1)
+# How long a blob must stay unreferenced before it is deleted, so backups
+# (which refer to blobs by hash) can still be restored for that long
+GC_GRACE = timedelta(days=30)
+
+
+class BlobStore:
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:])
+
+    def exists(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def put(self, data):
+        """Store bytes or a binary file object and return (digest, size)."""
+        stream = io.BytesIO(data) if isinstance(data, (bytes, bytearray, memoryview)) else data
+        # Hash while spooling to a temporary file so large uploads never sit
+        # in memory as a single bytes object, and readers never see a
+        # partially written blob
+        sha = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.root)
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                    sha.update(chunk)
+                    tmp.write(chunk)
+                    size += len(chunk)
+            digest = sha.hexdigest()
+            if not self.exists(digest):
+                os.makedirs(os.path.dirname(self.path(digest)), exist_ok=True)
+                os.replace(tmp_path, self.path(digest))
+                tmp_path = None
+            return digest, size
+        finally:
+            if tmp_path is not None:
+                os.remove(tmp_path)
+
+    def open(self, digest):
+        return open(self.path(digest), "rb")
+
+    def iter_chunks(self, digest, chunk_size=CHUNK_SIZE):
+        with self.open(digest) as f:
+            yield from iter(lambda: f.read(chunk_size), b"")
+
+    def read(self, digest):
+        with self.open(digest) as f:
+            return f.read()
+
+    def digests(self):
+        # Temporary files from put() sit in the root and are not listed
+        for prefix in os.listdir(self.root):
+            directory = os.path.join(self.root, prefix)
+            if len(prefix) == 2 and os.path.isdir(directory):
+                for rest in os.listdir(directory):
+                    yield prefix + rest
+
+    def remove(self, digest):
+        try:
+            os.remove(self.path(digest))
+        except FileNotFoundError:
+            pass
+
+
+# (table, inline BLOB column, hash column, size column)
+INLINE_BLOB_COLUMNS = [
+    ("expenses", "receipt_image", "receipt_hash", "receipt_size"),
+    ("voice_notes", "audio_data", "audio_hash", "audio_size"),
+]
+# (table, hash column) of every reference into the store
+BLOB_REFERENCES = [
+    ("expenses", "receipt_hash"),
+    ("expenses", "thumbnail_hash"),
+    ("voice_notes", "audio_hash"),
+]
+
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def externalize_blobs(conn, store, batch_size=50):
+    """Move inline BLOBs into the store, leaving only hash and size behind.
+
+    Runs once per database: a finished pass is recorded in job_state and
+    later calls return straight away. Work is committed per batch so an
+    interrupted run resumes where it stopped. Returns the number of rows
+    moved.
+    """
+    if conn.execute("SELECT 1 FROM job_state WHERE name = ?", (EXTERNALIZED,)).fetchone():
+        return 0
+    moved = 0
+    for table, blob_col, hash_col, size_col in INLINE_BLOB_COLUMNS:
+        while True:
+            rows = conn.execute(f"SELECT id, {blob_col} FROM {table} WHERE {blob_col} IS NOT NULL LIMIT ?",
+                                (batch_size,)).fetchall()
+            if not rows:
+                break
+            updates = [(*store.put(data), row_id) for row_id, data in rows]
+            conn.executemany(f"UPDATE {table} SET {hash_col} = ?, {size_col} = ?, {blob_col} = NULL WHERE id = ?",
+                             updates)
+            conn.commit()
+            moved += len(rows)
+    conn.execute("INSERT OR REPLACE INTO job_state (name, value) VALUES (?, ?)", (EXTERNALIZED, _now()))
+    conn.commit()
+    return moved
+
+
+def _referenced(conn):
+    digests = set()
+    for table, column in BLOB_REFERENCES:
+        # Snapshots may predate some of these columns
+        if any(row[1] == column for row in conn.execute(f"PRAGMA table_info({table})")):
+            digests.update(row[0] for row in conn.execute(f"SELECT DISTINCT {column} FROM {table}"))
+    return digests
+
+
+def gc_due(conn, interval=GC_INTERVAL):
+    row = conn.execute("SELECT value FROM job_state WHERE name = ?", (LAST_GC,)).fetchone()
+    return row is None or datetime.now() - datetime.fromisoformat(row[0]) >= interval
+
+
+def collect_garbage(conn, store, snapshot_paths=(), grace=GC_GRACE):
+    """Delete blobs that neither the database nor any snapshot has referred to for `grace`.
+
+    Unreferenced blobs are first recorded in blob_orphans; one is deleted
+    on a later pass if it is still unreferenced then. A blob written just
+    before the row that refers to it is committed is therefore never
+    lost. Returns the digests deleted.
+    """
+    referenced = _referenced(conn)
+    for path in snapshot_paths:
+        snapshot = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            referenced |= _referenced(snapshot)
+        finally:
+            snapshot.close()
+    orphans = set(store.digests()) - referenced
+    now = _now()
+    cutoff = (datetime.now() - grace).strftime("%Y-%m-%d %H:%M:%S")
+    found = dict(conn.execute("SELECT digest, found_at FROM blob_orphans").fetchall())
+    expired = sorted(digest for digest in orphans if digest in found and found[digest] <= cutoff)
+    for digest in expired:
+        store.remove(digest)
+    conn.executemany("DELETE FROM blob_orphans WHERE digest = ?",
+                     [(digest,) for digest in found if digest not in orphans or digest in expired])
+    conn.executemany("INSERT INTO blob_orphans (digest, found_at) VALUES (?, ?)",
+                     [(digest, now) for digest in orphans if digest not in found])
+    conn.execute("INSERT OR REPLACE INTO job_state (name, value) VALUES (?, ?)", (LAST_GC, now))
+    conn.commit()
+    return expired
@@ -0,0 +1,143 @@
+"""Background cover-art fetching for the Media Library.
+
+Lookups run on a thread pool and share one pooled requests.Session, so
+rendering never waits on the network. Found cover URLs are written back
+to tasks.cover_url. Misses are recorded in cover_lookups and not retried
+until RETRY_AFTER has passed. Downloaded image bytes are kept in an
+on-disk cache keyed by URL, so later renders are served locally.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+OMDB_URL = "http://www.omdbapi.com/"
+OPENLIBRARY_SEARCH_URL = "https://openlibrary.org/search.json"
+OPENLIBRARY_COVERS_URL = "https://covers.openlibrary.org/b/id/{cover_id}-M.jpg"
+
+MAX_WORKERS = 4
+TIMEOUT = 5
+RETRY_AFTER = timedelta(days=7)
+
+
+class CoverFetcher:
+    def __init__(self, db, cache_dir, omdb_api_key="", max_workers=MAX_WORKERS, timeout=TIMEOUT,
+                 omdb_url=OMDB_URL, openlibrary_search_url=OPENLIBRARY_SEARCH_URL,
+                 openlibrary_covers_url=OPENLIBRARY_COVERS_URL):
+        self.db = db
+        self.cache_dir = cache_dir
+        self.omdb_api_key = omdb_api_key
+        self.timeout = timeout
+        self.omdb_url = omdb_url
+        self.openlibrary_search_url = openlibrary_search_url
+        self.openlibrary_covers_url = openlibrary_covers_url
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="covers")
+        self._lock = threading.Lock()
+        self._in_flight = set()
+        # Cover URLs that failed to download in this process
+        self._failed_downloads = set()
+
+    def pending(self):
+        with self._lock:
+            return len(self._in_flight)
+
+    def cached_path(self, url):
+        """Local path of the downloaded cover for `url`, or None."""
+        path = os.path.join(self.cache_dir, hashlib.sha256(url.encode()).hexdigest())
+        return path if os.path.exists(path) else None
+
+    def request_downloads(self, urls):
+        for url in urls:
+            if url not in self._failed_downloads and self.cached_path(url) is None:
+                self._submit(("download", url), self._download, url)
+
+    def request_lookups(self, items):
+        """Schedule cover lookups for (task_id, media_type, title, year, director) items."""
+        media_types = ["Book", "Movie", "TV Show"] if self.omdb_api_key else ["Book"]
+        items = [item for item in items if item[1] in media_types and item[2]]
+        if not items:
+            return
+        cutoff = (datetime.now() - RETRY_AFTER).strftime("%Y-%m-%d %H:%M:%S")
+        placeholders = ", ".join("?" * len(items))
+        recent_misses = {row[0] for row in self.db.fetchall(
+            f"SELECT task_id FROM cover_lookups WHERE checked_at > ? AND task_id IN ({placeholders})",
+            (cutoff, *[item[0] for item in items]))}
+        for item in items:
+            if item[0] not in recent_misses:
+                self._submit(("lookup", item[0]), self._lookup, *item)
+
+    def _submit(self, key, fn, *args):
+        with self._lock:
+            if key in self._in_flight:
+                return
+            self._in_flight.add(key)
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(lambda _: self._done(key))
+
+    def _done(self, key):
+        with self._lock:
+            self._in_flight.discard(key)
+
+    def _lookup(self, task_id, media_type, title, year, director):
+        try:
+            if media_type in ("Movie", "TV Show"):
+                cover_url = self._omdb_poster(title, year)
+            else:
+                cover_url = self._openlibrary_cover(title, director)
+        except (requests.RequestException, ValueError):
+            # Network errors and bad JSON count as a miss too, so a flaky
+            # API is not hammered on every rerun
+            cover_url = None
+        if cover_url:
+            self.db.execute("UPDATE tasks SET cover_url = ? WHERE id = ?", (cover_url, task_id))
+            self.db.execute("DELETE FROM cover_lookups WHERE task_id = ?", (task_id,))
+            self._download(cover_url)
+        else:
+            self.db.execute("INSERT OR REPLACE INTO cover_lookups (task_id, checked_at) VALUES (?, ?)",
+                            (task_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+
+    def _omdb_poster(self, title, year):
+        if not self.omdb_api_key:
+            return None
+        response = self.session.get(self.omdb_url, params={"t": title, "y": year or "", "apikey": self.omdb_api_key},
+                                    timeout=self.timeout)
+        poster = response.json().get("Poster") if response.status_code == 200 else None
+        return poster if poster and poster != "N/A" else None
+
+    def _openlibrary_cover(self, title, author):
+        response = self.session.get(self.openlibrary_search_url, params={"title": title, "author": author or ""},
+                                    timeout=self.timeout)
+        docs = response.json().get("docs") if response.status_code == 200 else None
+        if docs and docs[0].get("cover_i"):
+            return self.openlibrary_covers_url.format(cover_id=docs[0]["cover_i"])
+        return None
+
+    def _download(self, url):
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+        except requests.RequestException:
+            response = None
+        if response is None or response.status_code != 200 or not response.content:
+            self._failed_downloads.add(url)
+            return
+        path = os.path.join(self.cache_dir, hashlib.sha256(url.encode()).hexdigest())
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir)
+        with os.fdopen(fd, "wb") as tmp:
+            tmp.write(response.content)
+        os.replace(tmp_path, path)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
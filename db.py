@@ -0,0 +1,107 @@
+"""Shared SQLite data-access layer.
+
+A Database owns a bounded pool of connections to one database file. A
+thread checks a connection out for the duration of a `with` block, and
+nested blocks on the same thread reuse it, so helpers can call each other
+without deadlocking the pool. Connections run in WAL mode, so readers do
+not block the writer. Statements on them are timed whenever an
+instrumentation profile is active on the calling thread.
+"""
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from instrumentation import InstrumentedConnection
+
+
+POOL_SIZE = 8
+BUSY_TIMEOUT_MS = 5000
+CACHE_SIZE_KB = 16 * 1024
+
+
+def connect(path):
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+                           factory=InstrumentedConnection)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    # Negative cache_size is in KiB rather than pages
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    return conn
+
+
+class Database:
+    def __init__(self, path, pool_size=POOL_SIZE):
+        self.path = path
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._local = threading.local()
+
+    @contextmanager
+    def connection(self):
+        held = getattr(self._local, "conn", None)
+        if held is not None:
+            yield held
+            return
+        self._slots.acquire()
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = connect(self.path)
+            self._local.conn = conn
+            try:
+                yield conn
+            finally:
+                self._local.conn = None
+                if conn.in_transaction:
+                    conn.rollback()
+                self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def transaction(self):
+        """Run the block in one transaction, committing on success."""
+        with self.connection() as conn:
+            if conn.in_transaction:
+                # Nested in an outer transaction, which commits for us
+                yield conn
+                return
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+    def fetchall(self, sql, params=(), row_factory=None):
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = row_factory
+            return cursor.execute(sql, params).fetchall()
+
+    def fetchone(self, sql, params=(), row_factory=None):
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = row_factory
+            return cursor.execute(sql, params).fetchone()
+
+    def execute(self, sql, params=()):
+        """Run a single write statement in its own transaction."""
+        with self.transaction() as conn:
+            return conn.execute(sql, params).lastrowid
+
+    def executemany(self, sql, seq_of_params):
+        with self.transaction() as conn:
+            conn.executemany(sql, seq_of_params)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
@@ -0,0 +1,153 @@
+"""Expense totals, monthly and per-category rollups, and reimbursement reports.
+
+Aggregation is done in two steps. SQL sums amounts per (date, category)
+over the covering index on expenses (date, category, amount): a date
+range is one index range scan that never reads table rows (or receipt
+columns), and because the grouping follows index order it streams
+without a temporary B-tree. That leaves at most one row per day and
+category however many expenses there are, and the monthly and category
+rollups are vectorised pandas group-bys over those few rows.
+
+    python expense_report.py --start 2024-01-01 --end 2024-03-31 --html q1.html
+"""
+import argparse
+import csv
+import html
+import io
+import sys
+from collections import namedtuple
+
+import pandas as pd
+
+from db import Database
+from migrations import migrate
+
+
+UNCATEGORISED = "Uncategorised"
+# Most itemised lines an HTML report lists; the CSV export has them all
+REPORT_ITEM_LIMIT = 5000
+
+Summary = namedtuple("Summary", ["count", "total", "by_month", "by_category", "by_month_category"])
+
+
+def expense_filter(start=None, end=None, category=None):
+    """Build the (where, params) pair the expense queries take. Dates are inclusive."""
+    clauses, params = [], []
+    if start:
+        clauses.append("date >= ?")
+        params.append(str(start))
+    if end:
+        clauses.append("date <= ?")
+        params.append(str(end))
+    if category == UNCATEGORISED:
+        clauses.append("category IS NULL")
+    elif category:
+        clauses.append("category = ?")
+        params.append(category)
+    return " AND ".join(clauses) or "1", tuple(params)
+
+
+def daily_totals(db, where, params):
+    """Return a DataFrame of (date, category, count, total), one row per day and category."""
+    rows = db.fetchall(f"""SELECT date, category, COUNT(*), SUM(amount) FROM expenses WHERE {where}
+                           GROUP BY date, category""", params)
+    daily = pd.DataFrame(rows, columns=["date", "category", "count", "total"])
+    daily["category"] = daily["category"].fillna(UNCATEGORISED)
+    return daily
+
+
+def summarize(daily):
+    """Roll daily totals up into a Summary. Undated expenses count toward no month."""
+    daily = daily.assign(month=daily["date"].str[:7])
+    by_month_category = daily.groupby(["month", "category"], as_index=False)[["count", "total"]].sum()
+    return Summary(
+        count=int(daily["count"].sum()),
+        total=float(daily["total"].sum()),
+        by_month=by_month_category.groupby("month", as_index=False)[["count", "total"]].sum(),
+        by_category=(daily.groupby("category", as_index=False)[["count", "total"]].sum()
+                     .sort_values("total", ascending=False, ignore_index=True)),
+        by_month_category=by_month_category,
+    )
+
+
+def expense_items(db, where, params, limit=None):
+    """(date, description, category, amount) of the matching expenses, oldest first."""
+    return db.fetchall(f"""SELECT date, description, COALESCE(category, ?), amount FROM expenses WHERE {where}
+                           ORDER BY date, id{' LIMIT ?' if limit else ''}""",
+                       (UNCATEGORISED, *params, *([limit] if limit else [])))
+
+
+def write_csv(db, where, params, out):
+    # Lines are written as the cursor walks the rows, never all held at once
+    writer = csv.writer(out)
+    writer.writerow(["date", "description", "category", "amount"])
+    with db.connection() as conn:
+        cursor = conn.execute(f"""SELECT date, description, COALESCE(category, ?), amount FROM expenses
+                                  WHERE {where} ORDER BY date, id""", (UNCATEGORISED, *params))
+        for rows in iter(lambda: cursor.fetchmany(5000), []):
+            writer.writerows(rows)
+
+
+def csv_report(db, where, params):
+    out = io.StringIO()
+    write_csv(db, where, params, out)
+    return out.getvalue()
+
+
+def _table(headers, rows):
+    head = "".join(f"<th>{html.escape(header)}</th>" for header in headers)
+    body = "".join("<tr>" + "".join(f"<td>{html.escape(str(cell))}</td>" for cell in row) + "</tr>" for row in rows)
+    return f"<table><thead><tr>{head}</tr></thead><tbody>{body}</tbody></table>"
+
+
+def html_report(db, where, params, title="Expense report"):
+    """A self-contained HTML reimbursement report: totals, rollups and itemised lines."""
+    summary = summarize(daily_totals(db, where, params))
+    items = expense_items(db, where, params, REPORT_ITEM_LIMIT + 1)
+    more = len(items) > REPORT_ITEM_LIMIT
+    parts = [
+        f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>{html.escape(title)}</title>",
+        "<style>body{font-family:sans-serif;margin:2em}table{border-collapse:collapse;margin-bottom:2em}"
+        "th,td{border:1px solid #ccc;padding:4px 8px}td:last-child{text-align:right}</style></head><body>",
+        f"<h1>{html.escape(title)}</h1>",
+        f"<p><strong>{summary.count} expenses, {summary.total:,.2f} in total</strong></p>",
+        "<h2>By category</h2>",
+        _table(["Category", "Expenses", "Total"],
+               [(row.category, row.count, f"{row.total:,.2f}") for row in summary.by_category.itertuples()]),
+        "<h2>By month</h2>",
+        _table(["Month", "Expenses", "Total"],
+               [(row.month, row.count, f"{row.total:,.2f}") for row in summary.by_month.itertuples()]),
+        "<h2>Expenses</h2>",
+        _table(["Date", "Description", "Category", "Amount"],
+               [(day or "", description, category, f"{amount:,.2f}")
+                for day, description, category, amount in items[:REPORT_ITEM_LIMIT]]),
+    ]
+    if more:
+        parts.append(f"<p>Only the first {REPORT_ITEM_LIMIT} expenses are listed; export CSV for all of them.</p>")
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write an expense report for a date range.")
+    parser.add_argument("--db", default="tasks.db", help="database file (default: tasks.db)")
+    parser.add_argument("--start", help="first date, YYYY-MM-DD")
+    parser.add_argument("--end", help="last date, YYYY-MM-DD")
+    parser.add_argument("--category")
+    parser.add_argument("--html", metavar="FILE", help="write an HTML report here instead of CSV to stdout")
+    args = parser.parse_args(argv)
+
+    db = Database(args.db)
+    with db.connection() as conn:
+        migrate(conn)
+    where, params = expense_filter(args.start, args.end, args.category)
+    if args.html:
+        with open(args.html, "w", encoding="utf-8") as f:
+            f.write(html_report(db, where, params))
+    else:
+        write_csv(db, where, params, sys.stdout)
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+"""Bulk task import from CSV, iCalendar VTODO and JSON-lines files.
+
+Files are read as a stream of records, each mapped onto the tasks
+columns and validated. Rows that already exist (same title, category and
+due date) or repeat earlier in the file are skipped. Valid rows are
+inserted with executemany, one transaction per batch, so a long import
+doesn't hold the write lock for its whole run and can report progress.
+An import at least as large as the table switches to a bulk load
+instead: the rest of it runs in one transaction with the tasks indexes
+dropped, and they and the search index are rebuilt at the end.
+Recurring rows get a recurrence_rules row as well.
+
+    python importer.py tasks.csv
+    python importer.py todo.ics --db tasks.db --category Work
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+from collections import namedtuple
+from contextlib import ExitStack
+from datetime import date, datetime
+
+from db import Database
+from migrations import FTS_TABLES, migrate
+from recurrence import PATTERNS
+from services import CATEGORIES
+
+
+FORMATS = ["csv", "ics", "jsonl"]
+BATCH_SIZE = 5000
+# Most row errors kept for reporting; the rest are only counted
+MAX_ERRORS = 100
+
+TASK_COLUMNS = ["id", "title", "description", "category", "project", "area", "resource", "created_at",
+                "due_date", "priority", "is_recurring", "recurrence_pattern", "completed"]
+
+PRIORITIES = {"1": 1, "2": 2, "3": 3, "high": 1, "medium": 2, "low": 3}
+# Triggers on tasks whose work _insert_batch does once per batch
+INSERT_TRIGGERS = ["tasks_fts_ai", "tasks_generation_insert"]
+# Dropped for a bulk load as well; the load queues its rows for alerts
+BULK_TRIGGERS = INSERT_TRIGGERS + ["tasks_alerts_ai"]
+# An import switches to a bulk load once it has this many rows, and at
+# least as many as the table held. Rebuilding the indexes then costs
+# less than updating them row by row.
+BULK_MIN_ROWS = BATCH_SIZE
+
+# Rows without a priority fall back to the tasks column default
+DEFAULT_PRIORITY = 2
+
+ImportResult = namedtuple("ImportResult", ["read", "inserted", "duplicates", "invalid", "errors"])
+
+
+def detect_format(filename):
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == ".csv":
+        return "csv"
+    if ext in (".ics", ".ical"):
+        return "ics"
+    if ext in (".jsonl", ".ndjson", ".json"):
+        return "jsonl"
+    raise ValueError(f"Can't tell the import format of {filename}")
+
+
+def read_csv(lines):
+    # Header names are matched case-insensitively
+    for record in csv.DictReader(lines):
+        yield {(key or "").strip().lower(): value for key, value in record.items()}
+
+
+def read_jsonl(lines):
+    for line in lines:
+        if line.strip():
+            record = json.loads(line)
+            yield {key.lower(): value for key, value in record.items()} if isinstance(record, dict) else record
+
+
+def _unfold(lines):
+    # RFC 5545 continuation lines start with a space or a tab
+    current = None
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield current
+        current = line
+    if current:
+        yield current
+
+
+def _ics_text(value):
+    return value.replace("\\n", "\n").replace("\\N", "\n").replace("\\,", ",").replace("\\;", ";").replace("\\\\", "\\")
+
+
+def _ics_date(value):
+    return f"{value[:4]}-{value[4:6]}-{value[6:8]}" if len(value) >= 8 else value
+
+
+def read_ics(lines):
+    """Yield one record per VTODO, with fields named like the CSV columns."""
+    record = None
+    for line in _unfold(lines):
+        name, _, value = line.partition(":")
+        name, _, params = name.partition(";")
+        name = name.upper()
+        if name == "BEGIN" and value.upper() == "VTODO":
+            record = {}
+        elif name == "END" and value.upper() == "VTODO":
+            yield record
+            record = None
+        elif record is None:
+            continue
+        elif name == "SUMMARY":
+            record["title"] = _ics_text(value)
+        elif name == "DESCRIPTION":
+            record["description"] = _ics_text(value)
+        elif name == "DUE":
+            record["due_date"] = _ics_date(value)
+        elif name == "CREATED":
+            record["created_at"] = _ics_date(value)
+        elif name == "CATEGORIES":
+            record["category"] = _ics_text(value.split(",")[0])
+        elif name == "PRIORITY" and value.isdigit() and int(value):
+            # iCalendar uses 1 (highest) to 9; 5 is medium
+            record["priority"] = 1 if int(value) < 5 else 2 if int(value) == 5 else 3
+        elif name == "STATUS":
+            record["completed"] = value.upper() == "COMPLETED"
+        elif name == "RRULE":
+            parts = dict(part.partition("=")[::2] for part in value.split(";"))
+            record["recurrence"] = parts.get("FREQ", "").capitalize()
+            record["interval"] = parts.get("INTERVAL")
+            record["until"] = _ics_date(parts["UNTIL"]) if "UNTIL" in parts else None
+            record["count"] = parts.get("COUNT")
+
+
+READERS = {"csv": read_csv, "ics": read_ics, "jsonl": read_jsonl}
+
+
+def _text(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _date(value, field):
+    value = _text(value)
+    if value is None:
+        return None
+    try:
+        return date.fromisoformat(value[:10]).isoformat()
+    except ValueError:
+        raise ValueError(f"{field} is not a YYYY-MM-DD date: {value!r}")
+
+
+def _int(value, field):
+    value = _text(value)
+    if value is None:
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"{field} is not a whole number: {value!r}")
+    if number < 1:
+        raise ValueError(f"{field} must be at least 1")
+    return number
+
+
+def _flag(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "y", "x", "completed", "done")
+    return bool(value)
+
+
+def to_row(record, categories=CATEGORIES, default_category=None, now=None):
+    """Map one input record to (task values, recurrence rule or None).
+
+    Raises ValueError with a readable message for invalid records.
+    """
+    if not isinstance(record, dict):
+        raise ValueError("record is not an object")
+    title = _text(record.get("title"))
+    if title is None:
+        raise ValueError("title is required")
+    category = _text(record.get("category")) or default_category
+    if category is None:
+        raise ValueError("category is required")
+    matches = [known for known in categories if known.lower() == category.lower()]
+    if not matches:
+        raise ValueError(f"unknown category {category!r}")
+    priority = _text(record.get("priority"))
+    if priority is not None and priority.lower() not in PRIORITIES:
+        raise ValueError(f"priority must be 1-3 or High/Medium/Low, not {priority!r}")
+    due_date = _date(record.get("due_date") or record.get("due"), "due_date")
+
+    rule = None
+    pattern = _text(record.get("recurrence") or record.get("recurrence_pattern"))
+    if pattern:
+        pattern = pattern.capitalize()
+        if pattern not in PATTERNS:
+            raise ValueError(f"recurrence must be one of {', '.join(PATTERNS)}, not {pattern!r}")
+        if due_date is None:
+            raise ValueError("a recurring task needs a due_date")
+        rule = (pattern, _int(record.get("interval"), "interval") or 1, due_date,
+                _date(record.get("until"), "until"), _int(record.get("count"), "count"))
+
+    values = (title, _text(record.get("description")), matches[0], _text(record.get("project")),
+              _text(record.get("area")), _text(record.get("resource")),
+              _text(record.get("created_at")) or now, due_date,
+              PRIORITIES[priority.lower()] if priority else DEFAULT_PRIORITY,
+              1 if rule else 0, rule[0] if rule else None, 1 if _flag(record.get("completed")) else 0)
+    return values, rule
+
+
+def _existing_keys(conn):
+    # (title, category, due_date) of every task, read once per import
+    return set(conn.execute("SELECT title, category, due_date FROM tasks"))
+
+
+class _BulkLoad:
+    """The rest of an import as one transaction, without the tasks indexes.
+
+    finish() recreates the dropped indexes and triggers, rebuilds the
+    search index and commits.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        conn.execute("BEGIN IMMEDIATE")
+        self.last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM tasks").fetchone()[0]
+        self.dropped = conn.execute(f"""SELECT type, name, sql FROM sqlite_master WHERE tbl_name = 'tasks'
+                                        AND ((type = 'index' AND sql IS NOT NULL)
+                                             OR (type = 'trigger' AND name IN ({', '.join('?' * len(BULK_TRIGGERS))})))""",
+                                    BULK_TRIGGERS).fetchall()
+        for kind, name, _ in self.dropped:
+            conn.execute(f"DROP {kind.upper()} {name}")
+
+    def finish(self):
+        for _, _, sql in self.dropped:
+            self.conn.execute(sql)
+        self.conn.execute("INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild')")
+        self.conn.execute("INSERT OR IGNORE INTO alert_queue (task_id) SELECT id FROM tasks WHERE id > ?",
+                          (self.last_id,))
+        self.conn.execute("UPDATE table_generations SET generation = generation + 1 WHERE name = 'tasks'")
+        self.conn.commit()
+
+
+def _insert_batch(db, batch, bulk=False):
+    # Inserting in due_date order keeps every (..., due_date) index write
+    # near the previous one, which more than doubles the insert rate
+    batch.sort(key=lambda item: item[0][7] or "")
+    fts_columns = ", ".join(FTS_TABLES["tasks"])
+    with db.transaction() as conn:
+        # The write lock is held from here, so ids can be handed out directly
+        # and recurrence rules written with executemany too. AUTOINCREMENT
+        # never reuses the ids of deleted tasks, so neither does this.
+        first_id = conn.execute("""SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'tasks'), 0),
+                                             COALESCE((SELECT MAX(id) FROM tasks), 0)) + 1""").fetchone()[0]
+        last_id = first_id + len(batch) - 1
+        # Per-row insert triggers cost more than the insert itself; their
+        # work is done once for the whole batch instead. A bulk load has
+        # dropped them already and does it once at the end.
+        triggers = [] if bulk else conn.execute(f"""SELECT sql FROM sqlite_master WHERE type = 'trigger'
+                                                  AND name IN ({', '.join('?' * len(INSERT_TRIGGERS))})""",
+                                              INSERT_TRIGGERS).fetchall()
+        for name in INSERT_TRIGGERS:
+            conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        placeholders = ", ".join("?" * len(TASK_COLUMNS))
+        conn.executemany(f"INSERT INTO tasks ({', '.join(TASK_COLUMNS)}) VALUES ({placeholders})",
+                         ((first_id + i, *values) for i, (values, _) in enumerate(batch)))
+        conn.executemany("""INSERT INTO recurrence_rules (task_id, freq, interval, dtstart, until, count)
+                            VALUES (?, ?, ?, ?, ?, ?)""",
+                         ((first_id + i, *rule) for i, (_, rule) in enumerate(batch) if rule))
+        if bulk:
+            return
+        for (sql,) in triggers:
+            conn.execute(sql)
+        conn.execute(f"""INSERT INTO tasks_fts (rowid, {fts_columns})
+                         SELECT id, {fts_columns} FROM tasks WHERE id BETWEEN ? AND ?""", (first_id, last_id))
+        conn.execute("UPDATE table_generations SET generation = generation + 1 WHERE name = 'tasks'")
+
+
+def import_tasks(db, lines, fmt, categories=CATEGORIES, default_category=None, batch_size=BATCH_SIZE,
+                 progress=None):
+    """Import tasks from an iterable of text lines in format `fmt`.
+
+    `progress`, if given, is called as progress(read, inserted) after each
+    batch. Returns an ImportResult.
+    """
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with db.connection() as conn:
+        seen = _existing_keys(conn)
+        existing = conn.execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
+    read = inserted = duplicates = invalid = 0
+    errors, batch = [], []
+    bulk = None
+    # A bulk load keeps this thread's connection checked out, so the
+    # batches run inside its transaction; an error rolls that back
+    with ExitStack() as stack:
+        # Records are numbered from 1; for CSV that is the row after the header
+        for number, record in enumerate(READERS[fmt](lines), start=1):
+            read += 1
+            try:
+                values, rule = to_row(record, categories, default_category, now)
+            except ValueError as e:
+                invalid += 1
+                if len(errors) < MAX_ERRORS:
+                    errors.append((number, str(e)))
+                continue
+            key = (values[0], values[2], values[7])
+            if key in seen:
+                duplicates += 1
+                continue
+            seen.add(key)
+            batch.append((values, rule))
+            if len(batch) >= batch_size:
+                if bulk is None and inserted + len(batch) >= max(BULK_MIN_ROWS, existing):
+                    bulk = _BulkLoad(stack.enter_context(db.connection()))
+                _insert_batch(db, batch, bulk is not None)
+                inserted += len(batch)
+                batch = []
+                if progress:
+                    progress(read, inserted)
+        if batch:
+            _insert_batch(db, batch, bulk is not None)
+            inserted += len(batch)
+        if bulk is not None:
+            bulk.finish()
+    if progress:
+        progress(read, inserted)
+    return ImportResult(read, inserted, duplicates, invalid, errors)
+
+
+def open_text(fileobj):
+    # utf-8-sig drops the byte order mark spreadsheet exports often start with
+    return io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import tasks from CSV, iCalendar or JSON-lines files.")
+    parser.add_argument("file")
+    parser.add_argument("--db", default="tasks.db", help="database file (default: tasks.db)")
+    parser.add_argument("--format", choices=FORMATS, help="input format (default: from the file extension)")
+    parser.add_argument("--category", choices=CATEGORIES, help="category for rows that don't name one")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    db = Database(args.db)
+    with db.connection() as conn:
+        migrate(conn)
+    with open(args.file, "rb") as f:
+        result = import_tasks(db, open_text(f), args.format or detect_format(args.file),
+                              default_category=args.category, batch_size=args.batch_size,
+                              progress=lambda read, inserted: print(f"\r{read} read, {inserted} inserted",
+                                                                    end="", file=sys.stderr))
+    print(file=sys.stderr)
+    print(f"{result.inserted} imported, {result.duplicates} duplicates skipped, {result.invalid} invalid")
+    for number, message in result.errors:
+        print(f"  record {number}: {message}")
+    db.close()
+    return 1 if result.invalid else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
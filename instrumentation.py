@@ -0,0 +1,233 @@
+"""Opt-in timing of reruns: SQL statements, named sections and profiles.
+
+A Profile collects what happens on one thread between `start` and
+`finish`. While one is active, every statement run through a connection
+from `db.connect` is timed and its rows counted, aggregated by statement
+text. `start_section` books the time from there on to a named section
+until the next one starts. A profile can also run cProfile and
+tracemalloc, and each finished profile is appended to a rotating
+JSON-lines log.
+
+With no profile active the connection wrappers only check a thread-local
+and hand straight over to sqlite3.
+"""
+import cProfile
+import json
+import logging
+import os
+import pstats
+import sqlite3
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUPS = 3
+# Statements and functions a finished profile keeps
+TOP_N = 20
+
+_local = threading.local()
+_log = logging.getLogger("tasker.performance")
+_log.propagate = False
+
+
+class QueryStats:
+    __slots__ = ["sql", "calls", "rows", "seconds", "slowest"]
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.calls = self.rows = 0
+        self.seconds = self.slowest = 0.0
+
+    def add(self, seconds, call_seconds, rows):
+        self.seconds += seconds
+        self.slowest = max(self.slowest, call_seconds)
+        self.rows += rows
+
+    def to_dict(self):
+        return {"sql": " ".join(self.sql.split()), "calls": self.calls, "rows": self.rows,
+                "ms": round(self.seconds * 1000, 3), "slowest_ms": round(self.slowest * 1000, 3)}
+
+
+class Profile:
+    def __init__(self, label, cpu=False, memory=False):
+        self.label = label
+        self.cpu = cpu
+        self.memory = memory
+        self.queries = {}
+        self.sections = {}
+        self.seconds = 0.0
+        self.peak_memory = None
+        self.functions = []
+        self._section = None
+        self._profiler = None
+        self._started_tracing = False
+
+    def start(self):
+        if self.memory:
+            # tracemalloc is process-wide, so concurrent sessions share one
+            # trace and the peak covers whatever else ran meanwhile
+            self._started_tracing = not tracemalloc.is_tracing()
+            if self._started_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        if self.cpu:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        _local.profile = self
+        self._start = self._section_start = time.perf_counter()
+        return self
+
+    def start_section(self, name):
+        now = time.perf_counter()
+        if self._section is not None:
+            self.sections[self._section] = self.sections.get(self._section, 0.0) + now - self._section_start
+        self._section, self._section_start = name, now
+
+    def finish(self):
+        self.start_section(None)
+        self.seconds = time.perf_counter() - self._start
+        _local.profile = None
+        if self._profiler:
+            self._profiler.disable()
+            self.functions = _top_functions(self._profiler)
+        if self.memory:
+            self.peak_memory = tracemalloc.get_traced_memory()[1]
+            if self._started_tracing:
+                tracemalloc.stop()
+
+    def record(self, sql, seconds, rows):
+        stats = self.queries.get(sql)
+        if stats is None:
+            stats = self.queries[sql] = QueryStats(sql)
+        stats.calls += 1
+        stats.add(seconds, seconds, rows)
+        return stats
+
+    def slowest_queries(self, n=TOP_N):
+        return sorted(self.queries.values(), key=lambda stats: stats.seconds, reverse=True)[:n]
+
+    def to_dict(self):
+        return {
+            "at": datetime.now().isoformat(timespec="seconds"),
+            "label": self.label,
+            "ms": round(self.seconds * 1000, 3),
+            "sections": {name: round(seconds * 1000, 3) for name, seconds in self.sections.items()},
+            "query_count": sum(stats.calls for stats in self.queries.values()),
+            "query_ms": round(sum(stats.seconds for stats in self.queries.values()) * 1000, 3),
+            "queries": [stats.to_dict() for stats in self.slowest_queries()],
+            "peak_memory": self.peak_memory,
+            "functions": self.functions,
+        }
+
+
+def _top_functions(profiler, n=TOP_N):
+    rows = []
+    for (filename, line, name), (_, calls, own, cumulative, _) in pstats.Stats(profiler).stats.items():
+        rows.append({"function": f"{name} ({os.path.basename(filename)}:{line})", "calls": calls,
+                     "own_ms": round(own * 1000, 3), "cumulative_ms": round(cumulative * 1000, 3)})
+    return sorted(rows, key=lambda row: row["cumulative_ms"], reverse=True)[:n]
+
+
+def active_profile():
+    return getattr(_local, "profile", None)
+
+
+def start_section(name):
+    """Book time from here on to `name` in the active profile, if there is one."""
+    profile = active_profile()
+    if profile is not None:
+        profile.start_section(name)
+
+
+@contextmanager
+def profiling(label, cpu=False, memory=False):
+    """Profile the block on this thread and log the result when it ends."""
+    profile = Profile(label, cpu, memory).start()
+    try:
+        yield profile
+    finally:
+        profile.finish()
+        write_log(profile)
+
+
+def configure_log(path, max_bytes=LOG_MAX_BYTES, backups=LOG_BACKUPS):
+    """Send finished profiles to `path`, one JSON object per line, rotating at `max_bytes`.
+
+    The file is only created when the first profile is written.
+    """
+    path = os.path.abspath(path)
+    if any(getattr(handler, "baseFilename", None) == path for handler in _log.handlers):
+        return
+    handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8", delay=True)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    _log.addHandler(handler)
+    _log.setLevel(logging.INFO)
+
+
+def write_log(profile):
+    if _log.handlers:
+        _log.info(json.dumps(profile.to_dict()))
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    # Stats of the statement last executed while a profile was active, and
+    # that call's time so far. Fetches add to both; rows read by iterating
+    # the cursor directly are not counted.
+    _stats = None
+    _call_seconds = 0.0
+
+    def _run(self, method, sql, params):
+        profile = active_profile()
+        if profile is None:
+            self._stats = None
+            return method(sql, params)
+        start = time.perf_counter()
+        try:
+            return method(sql, params)
+        finally:
+            self._call_seconds = time.perf_counter() - start
+            self._stats = profile.record(sql, self._call_seconds, max(self.rowcount, 0))
+
+    def execute(self, sql, params=()):
+        return self._run(super().execute, sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self._run(super().executemany, sql, seq_of_params)
+
+    def _fetch(self, method, *args):
+        if self._stats is None:
+            return method(*args)
+        start = time.perf_counter()
+        result = method(*args)
+        seconds = time.perf_counter() - start
+        self._call_seconds += seconds
+        self._stats.add(seconds, self._call_seconds,
+                        len(result) if isinstance(result, list) else int(result is not None))
+        return result
+
+    def fetchone(self):
+        return self._fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._fetch(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._fetch(super().fetchall)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """sqlite3 connection whose statements are recorded in the active profile."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
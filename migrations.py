@@ -0,0 +1,306 @@
+"""Versioned schema migrations for tasks.db.
+
+The schema version is stored in ``PRAGMA user_version``. Each entry in
+MIGRATIONS upgrades the database by one version, and all pending entries
+are applied in a single transaction, so a failed upgrade leaves the file
+untouched.
+"""
+
+
+# Full-text search indexes, kept in sync with their source tables by triggers
+FTS_TABLES = {
+    "tasks": ["title", "description", "category", "project", "area", "resource"],
+    "meetings": ["title", "summary", "attendees", "action_items", "location"],
+    "voice_notes": ["title", "transcript"],
+}
+
+
+def _table_names(c):
+    return [row[0] for row in c.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()]
+
+
+def _initial_schema(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS tasks
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  title TEXT NOT NULL,
+                  description TEXT,
+                  category TEXT NOT NULL,
+                  project TEXT,
+                  area TEXT,
+                  resource TEXT,
+                  created_at TEXT,
+                  due_date TEXT,
+                  priority INTEGER DEFAULT 2,
+                  is_recurring INTEGER DEFAULT 0,
+                  recurrence_pattern TEXT,
+                  completed INTEGER DEFAULT 0,
+                  media_type TEXT,
+                  year TEXT,
+                  director TEXT,
+                  rating INTEGER,
+                  cover_url TEXT)''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS subtasks
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  task_id INTEGER NOT NULL,
+                  title TEXT NOT NULL,
+                  completed INTEGER DEFAULT 0,
+                  FOREIGN KEY(task_id) REFERENCES tasks(id))''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS meetings
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  title TEXT NOT NULL,
+                  summary TEXT,
+                  attendees TEXT,
+                  action_items TEXT,
+                  date TEXT,
+                  duration INTEGER,
+                  location TEXT,
+                  created_at TEXT)''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS expenses
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  description TEXT NOT NULL,
+                  amount REAL NOT NULL,
+                  category TEXT,
+                  receipt_image BLOB,
+                  date TEXT,
+                  created_at TEXT)''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS voice_notes
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  title TEXT NOT NULL,
+                  audio_data BLOB,
+                  transcript TEXT,
+                  created_at TEXT)''')
+
+    # Databases created by early versions lack the due date and media columns
+    columns = [column[1] for column in c.execute("PRAGMA table_info(tasks)").fetchall()]
+    if 'due_date' not in columns:
+        c.execute("ALTER TABLE tasks ADD COLUMN due_date TEXT")
+    for column in ['media_type', 'year', 'director', 'rating', 'cover_url']:
+        if column not in columns:
+            c.execute(f"ALTER TABLE tasks ADD COLUMN {column} TEXT")
+
+
+def _full_text_search(c):
+    existing_tables = _table_names(c)
+    for table, fts_columns in FTS_TABLES.items():
+        cols = ", ".join(fts_columns)
+        new_cols = ", ".join(f"new.{col}" for col in fts_columns)
+        old_cols = ", ".join(f"old.{col}" for col in fts_columns)
+        c.execute(f"""CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5
+                      ({cols}, content='{table}', content_rowid='id', prefix='2 3')""")
+        c.execute(f"""CREATE TRIGGER IF NOT EXISTS {table}_fts_ai AFTER INSERT ON {table} BEGIN
+                          INSERT INTO {table}_fts (rowid, {cols}) VALUES (new.id, {new_cols});
+                      END""")
+        c.execute(f"""CREATE TRIGGER IF NOT EXISTS {table}_fts_ad AFTER DELETE ON {table} BEGIN
+                          INSERT INTO {table}_fts ({table}_fts, rowid, {cols}) VALUES ('delete', old.id, {old_cols});
+                      END""")
+        c.execute(f"""CREATE TRIGGER IF NOT EXISTS {table}_fts_au AFTER UPDATE OF {cols} ON {table} BEGIN
+                          INSERT INTO {table}_fts ({table}_fts, rowid, {cols}) VALUES ('delete', old.id, {old_cols});
+                          INSERT INTO {table}_fts (rowid, {cols}) VALUES (new.id, {new_cols});
+                      END""")
+        # Backfill rows that existed before the index was created
+        if f"{table}_fts" not in existing_tables:
+            c.execute(f"INSERT INTO {table}_fts ({table}_fts) VALUES ('rebuild')")
+
+
+def _secondary_indexes(c):
+    # One index per filter in "View Tasks", each ending in due_date so the
+    # keyset pager reads pages straight off the index
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tasks_completed_due ON tasks (completed, due_date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tasks_category_completed_due ON tasks (category, completed, due_date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tasks_project_completed_due ON tasks (project, completed, due_date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tasks_area_completed_due ON tasks (area, completed, due_date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tasks_resource_completed_due ON tasks (resource, completed, due_date)")
+    # Gantt View and overdue detection
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tasks_due ON tasks (due_date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_subtasks_task ON subtasks (task_id)")
+    # Newest-first listings
+    c.execute("CREATE INDEX IF NOT EXISTS idx_meetings_date ON meetings (date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_expenses_date ON expenses (date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_voice_notes_created ON voice_notes (created_at)")
+
+
+def _external_blob_columns(c):
+    # Receipts and audio move to the blob store; rows keep hash and size.
+    # The old BLOB columns stay so not-yet-moved rows can be read.
+    c.execute("ALTER TABLE expenses ADD COLUMN receipt_hash TEXT")
+    c.execute("ALTER TABLE expenses ADD COLUMN receipt_size INTEGER")
+    c.execute("ALTER TABLE voice_notes ADD COLUMN audio_hash TEXT")
+    c.execute("ALTER TABLE voice_notes ADD COLUMN audio_size INTEGER")
+
+
+def _add_generation_counter(c, table):
+    # Every write to the table bumps its counter, so readers can key caches
+    # on it no matter which process or code path did the write
+    c.execute("INSERT OR IGNORE INTO table_generations (name) VALUES (?)", (table,))
+    for event in ["INSERT", "UPDATE", "DELETE"]:
+        c.execute(f"""CREATE TRIGGER IF NOT EXISTS {table}_generation_{event.lower()} AFTER {event} ON {table} BEGIN
+                          UPDATE table_generations SET generation = generation + 1 WHERE name = '{table}';
+                      END""")
+
+
+def _table_generations(c):
+    c.execute("""CREATE TABLE IF NOT EXISTS table_generations
+                 (name TEXT PRIMARY KEY,
+                  generation INTEGER NOT NULL DEFAULT 0)""")
+    _add_generation_counter(c, "tasks")
+
+
+def _cover_lookups(c):
+    # Negative cache for Media Library cover lookups that found nothing
+    c.execute("""CREATE TABLE IF NOT EXISTS cover_lookups
+                 (task_id INTEGER PRIMARY KEY,
+                  checked_at TEXT NOT NULL)""")
+
+
+def _recurrence_rules(c):
+    # One rule per recurring series instead of a duplicated row per occurrence
+    c.execute("""CREATE TABLE IF NOT EXISTS recurrence_rules
+                 (task_id INTEGER PRIMARY KEY,
+                  freq TEXT NOT NULL,
+                  interval INTEGER NOT NULL DEFAULT 1,
+                  dtstart TEXT NOT NULL,
+                  until TEXT,
+                  count INTEGER,
+                  FOREIGN KEY(task_id) REFERENCES tasks(id))""")
+    c.execute("""CREATE TABLE IF NOT EXISTS recurrence_exceptions
+                 (task_id INTEGER NOT NULL,
+                  occurrence_date TEXT NOT NULL,
+                  PRIMARY KEY (task_id, occurrence_date)) WITHOUT ROWID""")
+    c.execute("""INSERT OR IGNORE INTO recurrence_rules (task_id, freq, dtstart)
+                 SELECT id, recurrence_pattern, due_date FROM tasks
+                 WHERE is_recurring = 1 AND due_date IS NOT NULL
+                 AND recurrence_pattern IN ('Daily', 'Weekly', 'Monthly', 'Yearly')""")
+
+
+def _more_table_generations(c):
+    # The HTTP API derives list ETags from these counters
+    for table in ["subtasks", "meetings", "expenses", "voice_notes"]:
+        _add_generation_counter(c, table)
+
+
+def _task_alerts(c):
+    # Written by the alert scheduler; the app only reads open alerts
+    c.execute("""CREATE TABLE IF NOT EXISTS task_alerts
+                 (task_id INTEGER NOT NULL,
+                  due_date TEXT NOT NULL,
+                  kind TEXT NOT NULL,
+                  created_at TEXT NOT NULL,
+                  dismissed INTEGER NOT NULL DEFAULT 0,
+                  PRIMARY KEY (task_id, due_date))""")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_task_alerts_open ON task_alerts (dismissed, due_date)")
+    # Small key/value store for background jobs' bookkeeping
+    c.execute("""CREATE TABLE IF NOT EXISTS job_state
+                 (name TEXT PRIMARY KEY,
+                  value TEXT)""")
+
+
+def _transcription_jobs(c):
+    # One job per voice note, run by the transcription worker
+    c.execute("""CREATE TABLE IF NOT EXISTS transcription_jobs
+                 (note_id INTEGER PRIMARY KEY,
+                  status TEXT NOT NULL,
+                  error TEXT,
+                  chunks_total INTEGER,
+                  chunks_done INTEGER NOT NULL DEFAULT 0,
+                  queued_at TEXT NOT NULL,
+                  started_at TEXT,
+                  finished_at TEXT)""")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_transcription_jobs_status ON transcription_jobs (status, queued_at)")
+
+
+def _voice_note_audio_metadata(c):
+    # NULL audio_format: saved before compression, in the recorder's format
+    c.execute("ALTER TABLE voice_notes ADD COLUMN audio_format TEXT")
+    c.execute("ALTER TABLE voice_notes ADD COLUMN duration REAL")
+
+
+def _receipt_thumbnails(c):
+    # Blob store hash of the receipt's thumbnail; NULL until one is made
+    c.execute("ALTER TABLE expenses ADD COLUMN thumbnail_hash TEXT")
+
+
+def _expense_report_index(c):
+    # Covers the expense rollups, which group by (date, category) and sum
+    # amount, and still serves the newest-first listing
+    c.execute("CREATE INDEX IF NOT EXISTS idx_expenses_date_category_amount ON expenses (date, category, amount)")
+    c.execute("DROP INDEX IF EXISTS idx_expenses_date")
+
+
+def _blob_orphans(c):
+    # Blob store files no row referred to when blob GC last looked
+    c.execute("""CREATE TABLE IF NOT EXISTS blob_orphans
+                 (digest TEXT PRIMARY KEY,
+                  found_at TEXT NOT NULL)""")
+
+
+def _alert_queue(c):
+    # Tasks written since the last alert tick, so a tick looks only at them.
+    # Alerts a write leaves stale are dropped by the same triggers, which
+    # lets the app count open alerts without checking each task.
+    c.execute("CREATE TABLE IF NOT EXISTS alert_queue (task_id INTEGER PRIMARY KEY)")
+    c.execute("""CREATE TRIGGER IF NOT EXISTS tasks_alerts_ai AFTER INSERT ON tasks BEGIN
+                     INSERT OR IGNORE INTO alert_queue (task_id) VALUES (new.id);
+                 END""")
+    c.execute("""CREATE TRIGGER IF NOT EXISTS tasks_alerts_au AFTER UPDATE OF due_date, completed, is_recurring ON tasks
+                 BEGIN
+                     INSERT OR IGNORE INTO alert_queue (task_id) VALUES (new.id);
+                     DELETE FROM task_alerts WHERE task_id = new.id AND NOT IFNULL(new.completed = 0
+                         AND (due_date = new.due_date OR (new.is_recurring = 1 AND due_date > new.due_date)), 0);
+                 END""")
+    c.execute("""CREATE TRIGGER IF NOT EXISTS tasks_alerts_ad AFTER DELETE ON tasks BEGIN
+                     DELETE FROM task_alerts WHERE task_id = old.id;
+                 END""")
+    c.execute("""DELETE FROM task_alerts AS a WHERE NOT EXISTS
+                 (SELECT 1 FROM tasks t WHERE t.id = a.task_id AND t.completed = 0
+                  AND (a.due_date = t.due_date OR (t.is_recurring = 1 AND a.due_date > t.due_date)))""")
+    # Lists open alerts in order straight off the index
+    c.execute("CREATE INDEX IF NOT EXISTS idx_task_alerts_open_due ON task_alerts (dismissed, due_date, task_id)")
+    c.execute("DROP INDEX IF EXISTS idx_task_alerts_open")
+
+
+# Append new migrations to the end; never reorder or edit applied ones
+MIGRATIONS = [
+    _initial_schema,
+    _full_text_search,
+    _secondary_indexes,
+    _external_blob_columns,
+    _table_generations,
+    _cover_lookups,
+    _recurrence_rules,
+    _more_table_generations,
+    _task_alerts,
+    _transcription_jobs,
+    _voice_note_audio_metadata,
+    _receipt_thumbnails,
+    _expense_report_index,
+    _blob_orphans,
+    _alert_queue,
+]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """Apply all pending migrations and return the resulting schema version."""
+    version = schema_version(conn)
+    if version >= len(MIGRATIONS):
+        return version
+    c = conn.cursor()
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        # Another process may have migrated while we waited for the lock
+        version = schema_version(conn)
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            migration(c)
+            c.execute(f"PRAGMA user_version = {number}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return schema_version(conn)
@@ -0,0 +1,40 @@
+"""Row models.
+
+Each model is a namedtuple whose fields are exactly the columns one view
+selects, so a query fetches only what its view renders and code reads
+`task.completed` rather than `task[12]`. Rows stay plain tuples
+underneath: there is no per-row dict, and `row_factory` builds them
+straight from the cursor.
+"""
+from collections import namedtuple
+
+
+# Every tasks column, for the API and single-task lookups
+Task = namedtuple("Task", ["id", "title", "description", "category", "project", "area", "resource", "created_at",
+                           "due_date", "priority", "is_recurring", "recurrence_pattern", "completed", "media_type",
+                           "year", "director", "rating", "cover_url"])
+# What a "View Tasks" card shows
+TaskCard = namedtuple("TaskCard", ["id", "title", "category", "project", "area", "resource", "created_at",
+                                   "due_date", "priority", "is_recurring", "completed"])
+# What a Media Library entry shows
+MediaItem = namedtuple("MediaItem", ["id", "title", "project", "area", "resource", "created_at", "completed",
+                                     "media_type", "year", "director", "rating", "cover_url"])
+TaskChoice = namedtuple("TaskChoice", ["id", "title", "due_date"])
+Subtask = namedtuple("Subtask", ["id", "task_id", "title", "completed"])
+Meeting = namedtuple("Meeting", ["id", "title", "summary", "attendees", "action_items", "date", "duration",
+                                 "location", "created_at"])
+Expense = namedtuple("Expense", ["id", "description", "amount", "category", "receipt_hash", "thumbnail_hash", "date"])
+VoiceNote = namedtuple("VoiceNote", ["id", "title", "created_at", "audio_hash", "audio_size", "audio_format",
+                                     "duration", "transcript"])
+TranscriptionJob = namedtuple("TranscriptionJob", ["note_id", "status", "error", "chunks_total", "chunks_done"])
+
+
+def columns(model):
+    """The SELECT list for `model`."""
+    return ", ".join(model._fields)
+
+
+def row_factory(model):
+    """A sqlite3 row factory that builds `model` rows."""
+    new = tuple.__new__
+    return lambda cursor, row: new(model, row)
@@ -0,0 +1,128 @@
+"""Recurrence rules and lazy occurrence expansion.
+
+A recurring task is stored once, with one row in recurrence_rules
+describing the series (frequency, interval, start, optional end) and
+any skipped dates in recurrence_exceptions. tasks.due_date always holds
+the next pending occurrence. Other occurrences are never stored; they
+are generated on demand for whatever date window a view asks for.
+"""
+import calendar
+from collections import namedtuple
+from datetime import date, timedelta
+
+
+PATTERNS = ["Daily", "Weekly", "Monthly", "Yearly"]
+
+Rule = namedtuple("Rule", ["task_id", "freq", "interval", "dtstart", "until", "count", "exceptions"])
+
+
+def _parse(value):
+    if value is None or isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def _add(freq, day, n):
+    # `day` plus n periods, clamped to the end of shorter months. Plain
+    # arithmetic rather than relativedelta, which dominated expansion time.
+    if freq == "Daily":
+        return day + timedelta(days=n)
+    if freq == "Weekly":
+        return day + timedelta(weeks=n)
+    if freq == "Monthly":
+        months = n
+    elif freq == "Yearly":
+        months = 12 * n
+    else:
+        raise ValueError(f"Unknown recurrence pattern: {freq}")
+    year, month = divmod(day.month - 1 + months, 12)
+    year += day.year
+    return date(year, month + 1, min(day.day, calendar.monthrange(year, month + 1)[1]))
+
+
+def _first_index(freq, interval, dtstart, start):
+    # A lower bound on the index of the first occurrence on or after
+    # `start`, so long-running series don't have to be walked from dtstart
+    if start <= dtstart:
+        return 0
+    if freq == "Daily":
+        units = (start - dtstart).days
+    elif freq == "Weekly":
+        units = (start - dtstart).days // 7
+    elif freq == "Monthly":
+        units = (start.year - dtstart.year) * 12 + start.month - dtstart.month - 1
+    else:
+        units = start.year - dtstart.year - 1
+    return max(0, units // interval)
+
+
+def occurrences(rule, start=None, end=None):
+    """Yield the rule's occurrence dates between `start` and `end`, inclusive.
+
+    Either bound may be None. Without an `end`, `until` or `count` the
+    generator is infinite, so callers must stop consuming it themselves.
+    """
+    dtstart, until, start, end = _parse(rule.dtstart), _parse(rule.until), _parse(start), _parse(end)
+    n = _first_index(rule.freq, rule.interval, dtstart, start) if start else 0
+    while rule.count is None or n < rule.count:
+        # Always offset from dtstart so month-end dates don't drift
+        day = _add(rule.freq, dtstart, n * rule.interval)
+        if (until and day > until) or (end and day > end):
+            return
+        n += 1
+        if (start and day < start) or day in rule.exceptions:
+            continue
+        yield day
+
+
+def next_occurrence(rule, after):
+    return next(occurrences(rule, start=_parse(after) + timedelta(days=1)), None)
+
+
+def _chunks(items, size=500):
+    # Keeps IN (...) lists under SQLite's bound-parameter limit
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def load_rules(db, task_ids):
+    """Return {task_id: Rule} for the given tasks that recur."""
+    rules = {}
+    for chunk in _chunks(task_ids):
+        placeholders = ", ".join("?" * len(chunk))
+        rows = db.fetchall(f"""SELECT task_id, freq, interval, dtstart, until, count FROM recurrence_rules
+                               WHERE task_id IN ({placeholders})""", chunk)
+        exceptions = {}
+        for task_id, day in db.fetchall(f"""SELECT task_id, occurrence_date FROM recurrence_exceptions
+                                            WHERE task_id IN ({placeholders})""", chunk):
+            exceptions.setdefault(task_id, set()).add(_parse(day))
+        rules.update((row[0], Rule(*row, frozenset(exceptions.get(row[0], ())))) for row in rows)
+    return rules
+
+
+def expand(db, start, end, task_ids=None, skip_due=False):
+    """Yield (task_id, date) for every pending occurrence in the window.
+
+    Only series that overlap the window and aren't finished are loaded,
+    and only those in `task_ids` if it is given. With `skip_due`, each
+    series' current due date, which is a task row of its own, is left out.
+    """
+    # CROSS JOIN keeps SQLite walking the few rules rather than every open task
+    sql = """SELECT r.task_id, t.due_date FROM recurrence_rules r CROSS JOIN tasks t ON t.id = r.task_id
+             WHERE t.completed = 0 AND r.dtstart <= ? AND (r.until IS NULL OR r.until >= ?)"""
+    if task_ids is None:
+        due_dates = dict(db.fetchall(sql, (str(end), str(start))))
+    else:
+        due_dates = {}
+        for chunk in _chunks(task_ids):
+            due_dates.update(db.fetchall(f"{sql} AND r.task_id IN ({', '.join('?' * len(chunk))})",
+                                         (str(end), str(start), *chunk)))
+    for task_id, rule in load_rules(db, due_dates).items():
+        # Occurrences before the task's current due date are already done
+        due = _parse(due_dates[task_id])
+        if due and skip_due:
+            due += timedelta(days=1)
+        window_start = max(_parse(start), due) if due else _parse(start)
+        for day in occurrences(rule, window_start, end):
+            yield task_id, day
@@ -0,0 +1,360 @@
+"""Task, subtask, meeting, expense and voice note operations.
+
+Every read and write the app makes goes through these functions, which
+take the shared Database as their first argument. The Streamlit UI and
+the HTTP API (api.py) both call them, so they always agree on how data
+is stored. Reads return the row models from models.py, selecting only
+the model's columns.
+"""
+from datetime import date, datetime
+
+import audio
+import thumbnails
+from models import (Expense, MediaItem, Meeting, Subtask, Task, TaskChoice, VoiceNote, columns,
+                    row_factory)
+from recurrence import PATTERNS, load_rules, next_occurrence
+from transcription import enqueue
+
+
+# Task categories, in the order the app lists them
+CATEGORIES = ["Work", "Studies", "Personal", "Media", "Misc"]
+# High, Medium and Low
+PRIORITIES = [1, 2, 3]
+
+PAGE_SIZE = 25
+
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _iso_date(value, name):
+    # Dates are stored as YYYY-MM-DD text, which recurrence, alerts and the
+    # Gantt view all parse back
+    try:
+        return str(value if isinstance(value, date) else date.fromisoformat(str(value)))
+    except ValueError:
+        raise ValueError(f"{name} must be a date in YYYY-MM-DD form")
+
+
+def table_generation(db, table):
+    return db.fetchone("SELECT generation FROM table_generations WHERE name = ?", (table,))[0]
+
+
+# Search
+
+def fts_query(term):
+    # Quote every word so user input can't inject FTS5 syntax, and match
+    # the last one as a prefix so results update while typing.
+    words = [f'"{word.replace(chr(34), chr(34) * 2)}"' for word in term.split()]
+    if words:
+        words[-1] += "*"
+    return " ".join(words)
+
+
+# Only the newest this many matches in each index are ranked, so a common
+# word or a short prefix doesn't have BM25 score most of the table
+SEARCH_CANDIDATES = 1000
+
+
+def search_everything(db, term, limit=20, candidates=SEARCH_CANDIDATES):
+    # BM25-ranked matches across tasks, meetings and voice notes, with the
+    # matching terms highlighted in markdown bold
+    query = fts_query(term)
+    if not query:
+        return []
+    results = []
+    for kind, table in [("Task", "tasks"), ("Meeting", "meetings"), ("Voice Note", "voice_notes")]:
+        # Walking the matches in rowid order is cheap; the bound it yields
+        # keeps the ranked scan to the newest `candidates` of them
+        rows = db.fetchall(f"""SELECT rowid, highlight({table}_fts, 0, '**', '**'),
+                                    snippet({table}_fts, -1, '**', '**', '…', 12), rank
+                             FROM {table}_fts WHERE {table}_fts MATCH ?1
+                               AND rowid >= (SELECT MIN(rowid) FROM (SELECT rowid FROM {table}_fts
+                                                                     WHERE {table}_fts MATCH ?1
+                                                                     ORDER BY rowid DESC LIMIT ?3))
+                             ORDER BY rank LIMIT ?2""", (query, limit, candidates))
+        results += [(rank, kind, row_id, title, snippet) for row_id, title, snippet, rank in rows]
+    return sorted(results)[:limit]
+
+
+# Tasks
+
+def task_filter(completed=None, category=None, project=None, area=None, resource=None, search=None):
+    """Build the (where, params) pair the task queries take.
+
+    `search` is free text matched against tasks_fts.
+    """
+    clauses, params = [], []
+    for column, value in [("category", category), ("project", project), ("area", area),
+                          ("resource", resource), ("completed", completed)]:
+        if value is not None:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    if search and fts_query(search):
+        clauses.append("id IN (SELECT rowid FROM tasks_fts WHERE tasks_fts MATCH ?)")
+        params.append(fts_query(search))
+    return " AND ".join(clauses) or "1", tuple(params)
+
+
+def count_tasks(db, where, params):
+    return db.fetchone(f"SELECT COUNT(*) FROM tasks WHERE {where}", params)[0]
+
+
+def fetch_task_page(db, where, params, after=None, limit=PAGE_SIZE, model=Task):
+    # Keyset pagination ordered by (due_date, id). Dated tasks come first and
+    # undated ones after them, so each half stays a plain range scan.
+    # `after` is the (due_date, id) of the last row on the previous page.
+    rows = []
+    if after is None or after[0] is not None:
+        keyset, keyset_params = "", ()
+        if after is not None:
+            keyset = " AND (due_date > ? OR (due_date = ? AND id > ?))"
+            keyset_params = (after[0], after[0], after[1])
+        rows = db.fetchall(f"""SELECT {columns(model)} FROM tasks WHERE {where} AND due_date IS NOT NULL{keyset}
+                               ORDER BY due_date, id LIMIT ?""", (*params, *keyset_params, limit), row_factory(model))
+    if len(rows) < limit:
+        last_id = after[1] if after is not None and after[0] is None else 0
+        rows += db.fetchall(f"""SELECT {columns(model)} FROM tasks WHERE {where} AND due_date IS NULL AND id > ?
+                                ORDER BY id LIMIT ?""", (*params, last_id, limit - len(rows)), row_factory(model))
+    return rows
+
+
+def fetch_newest_page(db, table, column, model, after=None, limit=PAGE_SIZE):
+    # Keyset pagination ordered by (column, id) descending: the mirror image
+    # of fetch_task_page, with rows that have no `column` value last.
+    # `after` is the (column value, id) of the last row on the previous page.
+    rows = []
+    if after is None or after[0] is not None:
+        keyset, keyset_params = "", ()
+        if after is not None:
+            keyset = f" AND ({column} < ? OR ({column} = ? AND id < ?))"
+            keyset_params = (after[0], after[0], after[1])
+        rows = db.fetchall(f"""SELECT {columns(model)} FROM {table} WHERE {column} IS NOT NULL{keyset}
+                               ORDER BY {column} DESC, id DESC LIMIT ?""", (*keyset_params, limit), row_factory(model))
+    if len(rows) < limit:
+        before = " AND id < ?" if after is not None and after[0] is None else ""
+        rows += db.fetchall(f"""SELECT {columns(model)} FROM {table} WHERE {column} IS NULL{before}
+                                ORDER BY id DESC LIMIT ?""", (*([after[1]] if before else []), limit - len(rows)),
+                            row_factory(model))
+    return rows
+
+
+def get_task(db, task_id):
+    return db.fetchone(f"SELECT {columns(Task)} FROM tasks WHERE id = ?", (task_id,), row_factory(Task))
+
+
+def distinct_values(db, column):
+    # Only the free-text grouping columns are offered as filters
+    if column not in ("project", "area", "resource"):
+        raise ValueError(f"Can't list values of {column}")
+    return [row[0] for row in db.fetchall(f"SELECT DISTINCT {column} FROM tasks WHERE {column} IS NOT NULL")]
+
+
+def incomplete_tasks(db):
+    return db.fetchall(f"SELECT {columns(TaskChoice)} FROM tasks WHERE completed = 0 ORDER BY due_date, id",
+                       row_factory=row_factory(TaskChoice))
+
+
+def media_tasks(db):
+    return db.fetchall(f"SELECT {columns(MediaItem)} FROM tasks WHERE category = 'Media'",
+                       row_factory=row_factory(MediaItem))
+
+
+def add_task(db, title, category, description=None, project=None, area=None, resource=None, due_date=None,
+             priority=2, recurrence=None, interval=1, until=None, media_type=None, year=None, director=None,
+             rating=None):
+    """Insert a task and return its id.
+
+    A recurring task is stored once with a rule; later occurrences are
+    computed when they're needed.
+    """
+    if recurrence and recurrence not in PATTERNS:
+        raise ValueError(f"recurrence must be one of {', '.join(PATTERNS)}")
+    if recurrence and not due_date:
+        raise ValueError("A recurring task needs a due date")
+    due_date = _iso_date(due_date, "due_date") if due_date else None
+    until = _iso_date(until, "until") if until else None
+    if not isinstance(interval, int) or isinstance(interval, bool) or interval < 1:
+        raise ValueError("interval must be a whole number of at least 1")
+    with db.transaction() as conn:
+        task_id = conn.execute("""INSERT INTO tasks (title, description, category, project, area, resource, created_at,
+                                  due_date, priority, is_recurring, recurrence_pattern, media_type, year, director, rating)
+                                  VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                               (title, description, category, project, area, resource, _now(),
+                                due_date, priority, 1 if recurrence else 0, recurrence,
+                                media_type, year, director, rating)).lastrowid
+        if recurrence:
+            conn.execute("INSERT INTO recurrence_rules (task_id, freq, interval, dtstart, until) VALUES (?, ?, ?, ?, ?)",
+                         (task_id, recurrence, interval, due_date, until))
+    return task_id
+
+
+def delete_tasks(db, task_ids):
+    # Subtasks and recurrence rows go with their task
+    rows = [(task_id,) for task_id in task_ids]
+    with db.transaction() as conn:
+        conn.executemany("DELETE FROM tasks WHERE id = ?", rows)
+        conn.executemany("DELETE FROM subtasks WHERE task_id = ?", rows)
+        conn.executemany("DELETE FROM recurrence_rules WHERE task_id = ?", rows)
+        conn.executemany("DELETE FROM recurrence_exceptions WHERE task_id = ?", rows)
+
+
+def complete_tasks(db, task_ids):
+    # A recurring task moves on to its next occurrence; the series itself is
+    # only completed once its rule runs out
+    with db.transaction() as conn:
+        rules = load_rules(db, task_ids)
+        advance, done = [], []
+        for task_id in task_ids:
+            rule = rules.get(task_id)
+            due_date = conn.execute("SELECT due_date FROM tasks WHERE id = ?", (task_id,)).fetchone()[0] if rule else None
+            next_due = next_occurrence(rule, due_date) if due_date else None
+            if next_due:
+                advance.append((str(next_due), task_id))
+            else:
+                done.append((task_id,))
+        conn.executemany("UPDATE tasks SET due_date = ? WHERE id = ?", advance)
+        conn.executemany("UPDATE tasks SET completed = 1 WHERE id = ?", done)
+
+
+def skip_occurrence(db, task_id):
+    # Record the current occurrence as an exception and move to the next one.
+    # Returns False if there is no such task.
+    with db.transaction():
+        row = db.fetchone("SELECT due_date FROM tasks WHERE id = ?", (task_id,))
+        if row is None:
+            return False
+        due_date = row[0]
+        db.execute("INSERT OR IGNORE INTO recurrence_exceptions (task_id, occurrence_date) VALUES (?, ?)",
+                   (task_id, due_date))
+        complete_tasks(db, [task_id])
+    return True
+
+
+def move_tasks(db, task_ids, category):
+    with db.transaction() as conn:
+        conn.executemany("UPDATE tasks SET category = ? WHERE id = ?", [(category, task_id) for task_id in task_ids])
+
+
+def shift_due_dates(db, task_ids, days):
+    # Tasks without a due date keep none. A recurring series moves as a
+    # whole, so its next occurrences are computed from the shifted start.
+    params = [(f"{days:+d} days", task_id) for task_id in task_ids]
+    with db.transaction() as conn:
+        conn.executemany("UPDATE tasks SET due_date = date(due_date, ?) WHERE id = ?", params)
+        conn.executemany("""UPDATE recurrence_rules SET dtstart = date(dtstart, ?1), until = date(until, ?1)
+                            WHERE task_id = ?2""", params)
+        # Skipped dates move with the series. Deleted and reinserted rather
+        # than updated, which could collide with a not yet moved date.
+        for offset, task_id in params:
+            skipped = conn.execute("SELECT occurrence_date FROM recurrence_exceptions WHERE task_id = ?",
+                                   (task_id,)).fetchall()
+            conn.execute("DELETE FROM recurrence_exceptions WHERE task_id = ?", (task_id,))
+            conn.executemany("""INSERT INTO recurrence_exceptions (task_id, occurrence_date)
+                                VALUES (?, date(?, ?))""", [(task_id, day, offset) for (day,) in skipped])
+
+
+# Subtasks
+
+def subtasks_for(db, task_id):
+    return db.fetchall(f"SELECT {columns(Subtask)} FROM subtasks WHERE task_id = ? ORDER BY id", (task_id,),
+                       row_factory(Subtask))
+
+
+def subtasks_by_task(db, task_ids):
+    """Return {task_id: [subtask rows]} for a page of tasks in one query."""
+    grouped = {task_id: [] for task_id in task_ids}
+    if task_ids:
+        rows = db.fetchall(f"""SELECT {columns(Subtask)} FROM subtasks
+                               WHERE task_id IN ({', '.join('?' * len(task_ids))}) ORDER BY task_id, id""",
+                           list(task_ids), row_factory(Subtask))
+        for row in rows:
+            grouped[row.task_id].append(row)
+    return grouped
+
+
+def subtask_progress(db, task_ids):
+    """Return {task_id: (done, total)} for the tasks that have subtasks."""
+    if not task_ids:
+        return {}
+    rows = db.fetchall(f"""SELECT task_id, COALESCE(SUM(completed), 0), COUNT(*) FROM subtasks
+                           WHERE task_id IN ({', '.join('?' * len(task_ids))}) GROUP BY task_id""", list(task_ids))
+    return {task_id: (done, total) for task_id, done, total in rows}
+
+
+def add_subtask(db, task_id, title):
+    return db.execute("INSERT INTO subtasks (task_id, title) VALUES (?, ?)", (task_id, title))
+
+
+def set_subtask_completed(db, subtask_id, completed):
+    db.execute("UPDATE subtasks SET completed = ? WHERE id = ?", (1 if completed else 0, subtask_id))
+
+
+# Meetings
+
+def list_meetings(db):
+    return db.fetchall(f"SELECT {columns(Meeting)} FROM meetings ORDER BY date DESC", row_factory=row_factory(Meeting))
+
+
+def add_meeting(db, title, summary=None, attendees=None, action_items=None, date=None, duration=None, location=None):
+    return db.execute("""INSERT INTO meetings (title, summary, attendees, action_items, date, duration, location, created_at)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                      (title, summary, attendees, action_items, str(date) if date else None, duration, location, _now()))
+
+
+# Expenses
+
+def list_expenses(db, where="1", params=(), limit=-1):
+    # `where` and `params` as built by expense_report.expense_filter
+    return db.fetchall(f"SELECT {columns(Expense)} FROM expenses WHERE {where} ORDER BY date DESC LIMIT ?",
+                       (*params, limit), row_factory(Expense))
+
+
+def add_expense(db, store, description, amount, category=None, date=None, receipt=None):
+    # `receipt` is bytes or a binary file object; it is kept in the blob store
+    # along with a thumbnail for the expense list
+    receipt_hash = receipt_size = thumbnail_hash = None
+    if receipt:
+        receipt_hash, receipt_size = store.put(receipt)
+        with store.open(receipt_hash) as f:
+            thumbnail = thumbnails.make_thumbnail(f)
+        thumbnail_hash = store.put(thumbnail)[0] if thumbnail else thumbnails.UNREADABLE
+    return db.execute("""INSERT INTO expenses (description, amount, category, receipt_hash, receipt_size, thumbnail_hash,
+                         date, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                      (description, amount, category, receipt_hash, receipt_size, thumbnail_hash,
+                       str(date) if date else None, _now()))
+
+
+# Voice notes
+
+def list_voice_notes(db):
+    return db.fetchall(f"SELECT {columns(VoiceNote)} FROM voice_notes ORDER BY created_at DESC",
+                       row_factory=row_factory(VoiceNote))
+
+
+def get_voice_note(db, note_id):
+    return db.fetchone(f"SELECT {columns(VoiceNote)} FROM voice_notes WHERE id = ?", (note_id,), row_factory(VoiceNote))
+
+
+def add_voice_note(db, store, title, recording):
+    # Stored compressed, and queued for transcription along with it. A
+    # recording that can't be decoded is kept as recorded rather than lost.
+    try:
+        data, duration = audio.compress(recording)
+        audio_format = audio.STORED_FORMAT
+    except ValueError:
+        data, duration, audio_format = recording, None, None
+    audio_hash, audio_size = store.put(data)
+    with db.transaction() as conn:
+        note_id = conn.execute("""INSERT INTO voice_notes (title, audio_hash, audio_size, audio_format, duration,
+                                  created_at) VALUES (?, ?, ?, ?, ?, ?)""",
+                               (title, audio_hash, audio_size, audio_format, duration, _now())).lastrowid
+        enqueue(conn, note_id)
+    return note_id
+
+
+def delete_voice_note(db, note_id):
+    with db.transaction() as conn:
+        conn.execute("DELETE FROM voice_notes WHERE id = ?", (note_id,))
+        conn.execute("DELETE FROM transcription_jobs WHERE note_id = ?", (note_id,))
@@ -0,0 +1,165 @@
+"""Online snapshots of tasks.db using the SQLite backup API.
+
+Snapshots copy the live database a few pages per step on a dedicated
+connection, so the app keeps serving reads and writes while one is
+taken. Each snapshot is a plain SQLite file, which keeps exact column
+types. A SnapshotScheduler thread takes snapshots on an interval and
+prunes old ones. The module can also run headless:
+
+    python snapshots.py take
+    python snapshots.py list
+    python snapshots.py restore snapshots/tasks_20250101_120000_000000.db
+    python snapshots.py schedule --every-hours 24 --keep 7
+"""
+import argparse
+import glob
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+from db import connect
+from migrations import migrate
+
+
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'snapshots')
+PAGES_PER_STEP = 256
+# Pause between steps so a large copy doesn't monopolise the disk
+STEP_PAUSE = 0.001
+KEEP = 7
+INTERVAL = timedelta(hours=24)
+
+_log = logging.getLogger(__name__)
+
+
+def list_snapshots(snapshot_dir=SNAPSHOT_DIR):
+    """Snapshot paths, newest first."""
+    return sorted(glob.glob(os.path.join(snapshot_dir, "tasks_*.db")), reverse=True)
+
+
+def take_snapshot(db_path, snapshot_dir=SNAPSHOT_DIR, pages=PAGES_PER_STEP):
+    os.makedirs(snapshot_dir, exist_ok=True)
+    # Microseconds keep two snapshots taken in the same second apart
+    target = os.path.join(snapshot_dir, f"tasks_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.db")
+    partial = target + ".partial"
+    src = connect(db_path)
+    dst = sqlite3.connect(partial)
+    try:
+        # Copy from one WAL read snapshot. Without it every commit from
+        # another connection restarts the backup, which never finishes
+        # under a steady write load.
+        src.execute("BEGIN")
+        src.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        src.backup(dst, pages=pages, progress=lambda status, remaining, total: time.sleep(STEP_PAUSE))
+    finally:
+        dst.close()
+        src.close()
+    # Only complete snapshots ever carry the final name
+    os.replace(partial, target)
+    return target
+
+
+def prune_snapshots(snapshot_dir=SNAPSHOT_DIR, keep=KEEP):
+    removed = list_snapshots(snapshot_dir)[keep:]
+    for path in removed:
+        os.remove(path)
+    return removed
+
+
+def snapshot_due(snapshot_dir=SNAPSHOT_DIR, interval=INTERVAL):
+    snapshots = list_snapshots(snapshot_dir)
+    if not snapshots:
+        return True
+    return datetime.now() - datetime.fromtimestamp(os.path.getmtime(snapshots[0])) >= interval
+
+
+def restore_snapshot(snapshot_path, db_path, pages=PAGES_PER_STEP):
+    """Copy a snapshot over the live database in place.
+
+    Open connections see the restored data on their next query. Table
+    generation counters are moved past their pre-restore values so caches
+    keyed on them can't serve stale results.
+    """
+    dst = connect(db_path)
+    src = sqlite3.connect(snapshot_path)
+    try:
+        before = dict(dst.execute("SELECT name, generation FROM table_generations").fetchall())
+        src.backup(dst, pages=pages, progress=lambda status, remaining, total: time.sleep(STEP_PAUSE))
+        # The snapshot may predate newer migrations
+        migrate(dst)
+        with dst:
+            for name, generation in before.items():
+                dst.execute("""UPDATE table_generations SET generation = MAX(generation, ?) + 1
+                               WHERE name = ?""", (generation, name))
+    finally:
+        src.close()
+        dst.close()
+
+
+class SnapshotScheduler(threading.Thread):
+    """Takes a snapshot whenever the newest one is older than `interval`."""
+
+    def __init__(self, db_path, snapshot_dir=SNAPSHOT_DIR, interval=INTERVAL, keep=KEEP, check_every=60):
+        super().__init__(name="snapshots", daemon=True)
+        self.db_path = db_path
+        self.snapshot_dir = snapshot_dir
+        self.interval = interval
+        self.keep = keep
+        self.check_every = check_every
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            # A failed snapshot is logged and tried again on the next check
+            try:
+                if snapshot_due(self.snapshot_dir, self.interval):
+                    take_snapshot(self.db_path, self.snapshot_dir)
+                    prune_snapshots(self.snapshot_dir, self.keep)
+            except Exception:
+                _log.exception("Snapshot of %s failed", self.db_path)
+            self._stop_event.wait(self.check_every)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Take, list and restore tasks.db snapshots.")
+    parser.add_argument("--db", default="tasks.db", help="database file (default: tasks.db)")
+    parser.add_argument("--dir", default=SNAPSHOT_DIR, help="snapshot directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("take", help="take a snapshot now")
+    commands.add_parser("list", help="list snapshots, newest first")
+    restore = commands.add_parser("restore", help="restore a snapshot over the database")
+    restore.add_argument("snapshot")
+    prune = commands.add_parser("prune", help="delete all but the newest snapshots")
+    prune.add_argument("--keep", type=int, default=KEEP)
+    schedule = commands.add_parser("schedule", help="take snapshots on an interval until interrupted")
+    schedule.add_argument("--every-hours", type=float, default=INTERVAL.total_seconds() / 3600)
+    schedule.add_argument("--keep", type=int, default=KEEP)
+    args = parser.parse_args(argv)
+
+    if args.command == "take":
+        print(take_snapshot(args.db, args.dir))
+    elif args.command == "list":
+        for path in list_snapshots(args.dir):
+            print(path)
+    elif args.command == "restore":
+        restore_snapshot(args.snapshot, args.db)
+        print(f"Restored {args.snapshot} into {args.db}")
+    elif args.command == "prune":
+        for path in prune_snapshots(args.dir, args.keep):
+            print(f"Removed {path}")
+    elif args.command == "schedule":
+        scheduler = SnapshotScheduler(args.db, args.dir, timedelta(hours=args.every_hours), args.keep)
+        scheduler.start()
+        try:
+            scheduler.join()
+        except KeyboardInterrupt:
+            scheduler.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""Task aggregates computed in SQL.
+
+Each function returns a handful of rows no matter how many tasks exist,
+so the Statistics page keeps flat memory as the database grows.
+"""
+
+# Most rows shown in the overdue table; the total is counted separately
+OVERDUE_LIMIT = 100
+
+
+def completion_counts(db):
+    total, completed = db.fetchone("SELECT COUNT(*), COALESCE(SUM(completed), 0) FROM tasks")
+    return total, completed
+
+
+def category_counts(db):
+    # (category, total, completed), largest category first
+    return db.fetchall("""SELECT category, COUNT(*) AS total, COALESCE(SUM(completed), 0)
+                          FROM tasks GROUP BY category ORDER BY total DESC""")
+
+
+def priority_counts(db):
+    return db.fetchall("SELECT priority, COUNT(*) FROM tasks GROUP BY priority ORDER BY priority")
+
+
+def overdue_tasks(db, today, limit=OVERDUE_LIMIT):
+    """Return (count, rows) for incomplete tasks due before `today`.
+
+    Only the columns the overdue table shows are fetched, oldest first.
+    """
+    today = str(today)
+    count = db.fetchone("SELECT COUNT(*) FROM tasks WHERE completed = 0 AND due_date < ?", (today,))[0]
+    rows = db.fetchall("""SELECT title, category, due_date, priority FROM tasks
+                          WHERE completed = 0 AND due_date < ?
+                          ORDER BY due_date LIMIT ?""", (today, limit))
+    return count, rows
@@ -1,96 +1,89 @@
 import streamlit as st
-import sqlite3
 from datetime import datetime
 import plotly.express as px
-import requests
-from dateutil.relativedelta import relativedelta
+import pandas as pd
 from datetime import timedelta
+from itertools import islice
+import io
 import os
 from streamlit_mic_recorder import mic_recorder
+from recurrence import PATTERNS, load_rules, occurrences
+from models import TaskCard
+import services
+import stats
+import expense_report
+import instrumentation
+import timeline
+from alerts import dismiss_alert, dismiss_all, open_alerts
+from backup import export_backup, import_backup
+from covers import CoverFetcher
+from importer import detect_format, import_tasks, open_text
+from snapshots import SNAPSHOT_DIR, list_snapshots, restore_snapshot, take_snapshot
+import transcription
+import workspaces
 
 
-# Initialize database
-conn = sqlite3.connect('tasks.db')
-c = conn.cursor()
-
-# Create tables if they don't exist
-c.execute('''CREATE TABLE IF NOT EXISTS tasks
-             (id INTEGER PRIMARY KEY AUTOINCREMENT,
-              title TEXT NOT NULL,
-              description TEXT,
-              category TEXT NOT NULL,
-              project TEXT,
-              area TEXT,
-              resource TEXT,
-              created_at TEXT,
-              due_date TEXT,
-              priority INTEGER DEFAULT 2,
-              is_recurring INTEGER DEFAULT 0,
-              recurrence_pattern TEXT,
-              completed INTEGER DEFAULT 0,
-              media_type TEXT,
-              year TEXT,
-              director TEXT,
-              rating INTEGER,
-              cover_url TEXT)''')
-
-# Create subtasks table
-c.execute('''CREATE TABLE IF NOT EXISTS subtasks
-             (id INTEGER PRIMARY KEY AUTOINCREMENT,
-              task_id INTEGER NOT NULL,
-              title TEXT NOT NULL,
-              completed INTEGER DEFAULT 0,
-              FOREIGN KEY(task_id) REFERENCES tasks(id))''')
-
-# Create meetings table
-c.execute('''CREATE TABLE IF NOT EXISTS meetings
-             (id INTEGER PRIMARY KEY AUTOINCREMENT,
-              title TEXT NOT NULL,
-              summary TEXT,
-              attendees TEXT,
-              action_items TEXT,
-              date TEXT,
-              duration INTEGER,
-              location TEXT,
-              created_at TEXT)''')
-
-# Create expenses table
-c.execute('''CREATE TABLE IF NOT EXISTS expenses
-             (id INTEGER PRIMARY KEY AUTOINCREMENT,
-              description TEXT NOT NULL,
-              amount REAL NOT NULL,
-              category TEXT,
-              receipt_image BLOB,
-              date TEXT,
-              created_at TEXT)''')
-
-# Create voice_notes table
-c.execute('''CREATE TABLE IF NOT EXISTS voice_notes
-             (id INTEGER PRIMARY KEY AUTOINCREMENT,
-              title TEXT NOT NULL,
-              audio_data BLOB,
-              transcript TEXT,
-              created_at TEXT)''')
-
-# Create directory for voice notes if it doesn't exist
-voice_notes_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'voice_notes')
-if not os.path.exists(voice_notes_dir):
-    os.makedirs(voice_notes_dir)
-
-
-
-# Add due_date column if it doesn't exist
-c.execute("PRAGMA table_info(tasks)")
-columns = [column[1] for column in c.fetchall()]
-if 'due_date' not in columns:
-    c.execute("ALTER TABLE tasks ADD COLUMN due_date TEXT")
-    conn.commit()
-
-# Add media metadata columns if they don't exist
-for column in ['media_type', 'year', 'director', 'rating', 'cover_url']:
-    if column not in columns:
-        c.execute(f"ALTER TABLE tasks ADD COLUMN {column} TEXT")
-        conn.commit()
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = 'tasks.db'
+# Receipt images and voice-note audio live on disk, addressed by SHA-256
+voice_notes_dir = os.path.join(APP_DIR, 'voice_notes')
+# Set to a directory to give every user a workspace (database, blobs and
+# snapshots) of their own under it. Unset, everyone shares tasks.db.
+WORKSPACE_ROOT = os.environ.get(workspaces.ROOT_ENV)
+# Profiled reruns are appended here, one JSON object per line
+PERFORMANCE_LOG = 'performance.jsonl'
+instrumentation.configure_log(PERFORMANCE_LOG)
+
+# One transcription pool and one maintenance thread (alerts, snapshots)
+# serve every open workspace
+@st.cache_resource
+def get_background_jobs():
+    return workspaces.BackgroundJobs().start()
+
+# A workspace's connection pool and thumbnail backfill are shared by all
+# its sessions
+@st.cache_resource(max_entries=workspaces.MAX_OPEN, on_release=workspaces.Workspace.close)
+def get_workspace(name):
+    if name is None:
+        workspace = workspaces.Workspace(None, DB_PATH, voice_notes_dir, SNAPSHOT_DIR)
+    else:
+        workspace = workspaces.Workspace.in_root(WORKSPACE_ROOT, name)
+    return workspace.open().start(get_background_jobs())
+
+def session_workspace():
+    # With workspaces, the workspace is the signed-in account's and nothing
+    # else: a name from the URL or a form would let anyone open anyone's
+    # data. Sign-in (st.login) needs an [auth] section in secrets.toml.
+    if WORKSPACE_ROOT is None:
+        return get_workspace(None)
+    if not st.user.get("is_logged_in"):
+        st.subheader("Sign in")
+        st.caption("Each account has a workspace of its own.")
+        if st.button("Log in"):
+            st.login()
+        st.stop()
+    try:
+        name = workspaces.normalize_name(st.user.get("email") or st.user.get("sub"))
+    except ValueError as e:
+        st.error(f"This account can't be given a workspace: {e}")
+        st.stop()
+    return get_workspace(name)
+
+workspace = session_workspace()
+db = workspace.db
+blob_store = workspace.store
+
+# Media Library covers are looked up and downloaded in the background, into
+# a cache all workspaces share
+@st.cache_resource(max_entries=workspaces.MAX_OPEN, on_release=CoverFetcher.shutdown)
+def get_cover_fetcher(workspace_name, _db):
+    cache_dir = os.path.join(APP_DIR, 'covers')
+    try:
+        omdb_api_key = st.secrets.get("OMDB_API_KEY", "")
+    except FileNotFoundError:
+        # No secrets.toml: only OpenLibrary book covers are looked up
+        omdb_api_key = ""
+    return CoverFetcher(_db, cache_dir, omdb_api_key=omdb_api_key)
 
 
 # PARA categories with icons
@@ -102,18 +95,73 @@ CATEGORIES = {
     "Misc": "📦"
 }
 
-# Streamlit app
+def task_pager(where, params, state_key):
+    # Keeps a stack of page cursors in session state and resets it whenever
+    # the filter changes. Returns the rows of the current page only.
+    if st.session_state.get(f"{state_key}_filter") != (where, params):
+        st.session_state[f"{state_key}_filter"] = (where, params)
+        st.session_state[f"{state_key}_cursors"] = [None]
+    cursors = st.session_state[f"{state_key}_cursors"]
+
+    total = services.count_tasks(db, where, params)
+    rows = services.fetch_task_page(db, where, params, cursors[-1], services.PAGE_SIZE + 1, TaskCard)
+    has_next = len(rows) > services.PAGE_SIZE
+    rows = rows[:services.PAGE_SIZE]
+
+    first = (len(cursors) - 1) * services.PAGE_SIZE
+    st.markdown(f"**{total} tasks** · showing {first + 1 if rows else 0}–{first + len(rows)}")
+    col1, col2, _ = st.columns([0.15, 0.15, 0.7])
+    with col1:
+        if st.button("◀ Previous", key=f"{state_key}_prev", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+    with col2:
+        if st.button("Next ▶", key=f"{state_key}_next", disabled=not has_next):
+            cursors.append((rows[-1].due_date, rows[-1].id))
+            st.rerun()
+    return rows
+
+@st.cache_data(max_entries=workspaces.MAX_OPEN, show_spinner=False)
+def task_statistics(workspace_name, generation, today):
+    # The arguments only key the cache: results are served from memory until
+    # a write to the workspace's tasks bumps its generation or the date
+    # rolls over
+    total, completed = stats.completion_counts(db)
+    overdue_count, overdue_rows = stats.overdue_tasks(db, today)
+    return {
+        "total": total,
+        "completed": completed,
+        "categories": stats.category_counts(db),
+        "priorities": stats.priority_counts(db),
+        "overdue_count": overdue_count,
+        "overdue": pd.DataFrame(overdue_rows, columns=["title", "category", "due_date", "priority"]),
+    }
+
+@st.cache_data(max_entries=2 * workspaces.MAX_OPEN, show_spinner=False)
+def expense_summary(workspace_name, generation, where, params):
+    # Keyed on the expenses generation like task_statistics
+    return expense_report.summarize(expense_report.daily_totals(db, where, params))
+
+# Newest expenses listed under the analytics
+EXPENSE_LIST_LIMIT = 50
+
+# Button callbacks
 def delete_task(task_id):
-    # Create new connection for thread safety
-    local_conn = sqlite3.connect('tasks.db')
-    local_c = local_conn.cursor()
-    local_c.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
-    local_c.execute("DELETE FROM subtasks WHERE task_id = ?", (task_id,))
-    local_conn.commit()
-    local_conn.close()
+    services.delete_tasks(db, [task_id])
+
+def complete_task(task_id):
+    services.complete_tasks(db, [task_id])
+
+def skip_occurrence(task_id):
+    services.skip_occurrence(db, task_id)
 
+def toggle_subtask(subtask_id):
+    services.set_subtask_completed(db, subtask_id, st.session_state[f"subtask_done_{subtask_id}"])
+
+# Streamlit app
 def main():
     st.set_page_config(page_title="Tasker", page_icon="✅", layout="wide")
+    instrumentation.start_section("Layout")
     
     # Modern CSS styling
     st.markdown("""
@@ -206,65 +254,99 @@ def main():
     st.markdown("<h2 style='color: #4CAF50; margin-top: -20px;'>Personal Task Manager</h2>", unsafe_allow_html=True)
 
     # Sidebar for navigation
-    menu = ["Add Task", "View Tasks", "Complete Task", "Gantt View", "Media Library", "Statistics", "Meetings", "Expenses", "Voice Notes"]
+    menu = ["Add Task", "View Tasks", "Search", "Complete Task", "Gantt View", "Media Library", "Statistics", "Meetings", "Expenses", "Voice Notes"]
     choice = st.sidebar.selectbox("Menu", menu)
+    instrumentation.start_section("Sidebar")
+    
+    alert_count, alerts = open_alerts(db)
+    if alert_count:
+        with st.sidebar.expander(f"🔔 {alert_count} due or overdue"):
+            for task_id, title, category, due_date, kind in alerts:
+                col1, col2 = st.columns([0.8, 0.2])
+                with col1:
+                    st.markdown(f"{CATEGORIES.get(category, '')} **{title}**")
+                    st.caption(f"{'Overdue since' if kind == 'overdue' else 'Due'} {due_date}")
+                with col2:
+                    st.button("✕", key=f"dismiss_{task_id}_{due_date}", help="Dismiss",
+                              on_click=dismiss_alert, args=(db, task_id, due_date))
+            if alert_count > len(alerts):
+                st.caption(f"and {alert_count - len(alerts)} more")
+            st.button("Dismiss all", key="dismiss_all_alerts", on_click=dismiss_all, args=(db,))
     
     # Backup/Restore section
     st.sidebar.markdown("---")
     st.sidebar.subheader("Backup & Restore")
+    # Set by restores, which rerun the app before a message could be seen
+    if "restore_message" in st.session_state:
+        st.sidebar.success(st.session_state.pop("restore_message"))
     
     if st.sidebar.button("Export Backup"):
-        # Get all tasks and subtasks
-        tasks = c.execute("SELECT * FROM tasks").fetchall()
-        subtasks = c.execute("SELECT * FROM subtasks").fetchall()
-        
-        # Prepare data for export
-        backup_data = {
-            "tasks": tasks,
-            "subtasks": subtasks,
-            "exported_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
-        
-        # Convert to JSON
-        backup_json = json.dumps(backup_data, indent=2)
+        # Stream every table into a compressed buffer; only the gzip output,
+        # not the rows, is held in memory
+        backup_file = io.BytesIO()
+        export_backup(db, backup_file)
         
         # Create download button
         st.sidebar.download_button(
             label="Download Backup",
-            data=backup_json,
-            file_name=f"tasker_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-            mime="application/json"
+            data=backup_file.getvalue(),
+            file_name=f"tasker_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.ndjson.gz",
+            mime="application/gzip"
         )
     
-    uploaded_file = st.sidebar.file_uploader("Import Backup", type=["json"])
+    uploaded_file = st.sidebar.file_uploader("Import Backup", type=["gz", "ndjson", "json"])
     if uploaded_file is not None:
         if st.sidebar.button("Restore Backup"):
             try:
-                # Read and parse the uploaded file
-                backup_data = json.loads(uploaded_file.getvalue().decode("utf-8"))
-                
-                # Clear existing data
-                c.execute("DELETE FROM tasks")
-                c.execute("DELETE FROM subtasks")
-                
-                # Restore tasks
-                for task in backup_data["tasks"]:
-                    c.execute("""INSERT INTO tasks 
-                        (id, title, description, category, project, area, resource, created_at, 
-                        due_date, priority, is_recurring, recurrence_pattern, completed, 
-                        media_type, year, director, rating, cover_url)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", task)
-                
-                # Restore subtasks
-                for subtask in backup_data["subtasks"]:
-                    c.execute("INSERT INTO subtasks (id, task_id, title, completed) VALUES (?, ?, ?, ?)", subtask)
-                
-                conn.commit()
-                st.sidebar.success("Backup restored successfully!")
-                st.experimental_rerun()
+                counts = import_backup(db, uploaded_file)
+                st.session_state.restore_message = f"Backup restored successfully! ({sum(counts.values())} rows)"
             except Exception as e:
                 st.sidebar.error(f"Failed to restore backup: {str(e)}")
+            else:
+                st.rerun()
+    
+    # Tasks from other apps are added to the existing ones, not restored over them
+    tasks_file = st.sidebar.file_uploader("Import Tasks", type=["csv", "ics", "jsonl", "ndjson"],
+                                          help="CSV with title, category, due_date, ... columns, "
+                                               "iCalendar to-dos or JSON lines")
+    if tasks_file is not None:
+        default_category = st.sidebar.selectbox("Category for rows without one", CATEGORIES)
+        if st.sidebar.button("Import Tasks"):
+            progress_bar = st.sidebar.progress(0.0)
+            try:
+                result = import_tasks(
+                    db, open_text(tasks_file), detect_format(tasks_file.name), list(CATEGORIES), default_category,
+                    progress=lambda read, inserted: progress_bar.progress(
+                        min(tasks_file.tell() / max(tasks_file.size, 1), 1.0), text=f"{inserted} tasks imported"))
+                st.sidebar.success(f"Imported {result.inserted} tasks, skipped {result.duplicates} duplicates")
+                if result.invalid:
+                    st.sidebar.warning(f"{result.invalid} invalid rows skipped:\n\n" +
+                                       "\n".join(f"- record {number}: {message}" for number, message in result.errors[:10]))
+            except ValueError as e:
+                st.sidebar.error(f"Failed to import tasks: {str(e)}")
+    
+    # Snapshots copy the database file online and keep exact column types
+    if st.sidebar.button("Take Snapshot"):
+        st.sidebar.success(f"Snapshot saved: {os.path.basename(take_snapshot(workspace.db_path, workspace.snapshot_dir))}")
+    snapshots = list_snapshots(workspace.snapshot_dir)
+    if snapshots:
+        selected_snapshot = st.sidebar.selectbox("Snapshots", snapshots, format_func=os.path.basename)
+        if st.sidebar.button("Restore Snapshot"):
+            try:
+                restore_snapshot(selected_snapshot, workspace.db_path)
+                st.session_state.restore_message = f"Snapshot {os.path.basename(selected_snapshot)} restored successfully!"
+            except Exception as e:
+                st.sidebar.error(f"Failed to restore snapshot: {str(e)}")
+            else:
+                st.rerun()
 
+    if workspace.name is not None:
+        st.sidebar.markdown("---")
+        st.sidebar.caption(f"Workspace: {workspace.name}")
+        if st.sidebar.button("Log out"):
+            st.logout()
+
+    instrumentation.start_section(choice)
     if choice == "Add Task":
         st.subheader("Add New Task")
         st.caption("Create new tasks with details like category, project, due date and priority.")
@@ -288,39 +370,17 @@ def main():
                 
                 with st.expander("Recurring Task Settings"):
                     is_recurring = st.checkbox("This is a recurring task")
-                    if is_recurring:
-                        recurrence_pattern = st.selectbox("Recurrence Pattern", 
-                            ["Daily", "Weekly", "Monthly", "Yearly"])
+                    recurrence_pattern = st.selectbox("Recurrence Pattern", PATTERNS)
+                    recurrence_interval = st.number_input("Repeat every", min_value=1, value=1)
+                    recurrence_until = st.date_input("Repeat until (optional)", value=None)
                 
             submitted = st.form_submit_button("Save Task")
             
             if submitted:
-                created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                # Include media metadata if category is Media
-                c.execute("INSERT INTO tasks (title, description, category, project, area, resource, created_at, due_date, priority, is_recurring, recurrence_pattern) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                              (title, description, category, project, area, resource, created_at, str(due_date), priority[1], 
-                              1 if is_recurring else 0, recurrence_pattern if is_recurring else None))
-                conn.commit()
+                services.add_task(db, title, category, description, project, area, resource, due_date, priority[1],
+                                  recurrence_pattern if is_recurring and due_date else None, recurrence_interval,
+                                  recurrence_until)
                 st.success(f"Task '{title}' added to {category}")
-                
-                # If recurring, create next instance
-                if is_recurring and due_date:
-                    next_date = None
-                    due_date_obj = datetime.strptime(str(due_date), "%Y-%m-%d")
-                    if recurrence_pattern == "Daily":
-                        next_date = due_date_obj + timedelta(days=1)
-                    elif recurrence_pattern == "Weekly":
-                        next_date = due_date_obj + timedelta(weeks=1)
-                    elif recurrence_pattern == "Monthly":
-                        next_date = due_date_obj + relativedelta(months=+1)
-                    elif recurrence_pattern == "Yearly":
-                        next_date = due_date_obj + relativedelta(years=+1)
-                        
-                    if next_date:
-                        c.execute("INSERT INTO tasks (title, description, category, project, area, resource, created_at, due_date, priority, is_recurring, recurrence_pattern) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                                  (title, description, category, project, area, resource, created_at, str(next_date.date()), priority, 
-                                  1 if is_recurring else 0, recurrence_pattern if is_recurring else None))
-                        conn.commit()
 
     elif choice == "View Tasks":
         st.subheader("View Tasks")
@@ -329,113 +389,160 @@ def main():
         view_option = st.radio("View by:", ["All", "Category", "Project", "Area", "Resource", "Search"])
         show_completed = st.checkbox("Show completed tasks")
         
+        completed = 0 if not show_completed else 1
+        where, params = None, ()
         if view_option == "All":
-            tasks = c.execute("SELECT * FROM tasks WHERE completed = ?", (0 if not show_completed else 1,)).fetchall()
+            where, params = services.task_filter(completed=completed)
         elif view_option == "Category":
             selected_category = st.selectbox("Select Category", CATEGORIES)
-            tasks = c.execute("SELECT * FROM tasks WHERE category = ? AND completed = ?", (selected_category, 0 if not show_completed else 1)).fetchall()
-        elif view_option == "Project":
-            projects = [item[0] for item in c.execute("SELECT DISTINCT project FROM tasks WHERE project IS NOT NULL").fetchall()]
-            selected_project = st.selectbox("Select Project", projects)
-            tasks = c.execute("SELECT * FROM tasks WHERE project = ? AND completed = ?", (selected_project, 0 if not show_completed else 1)).fetchall()
-        elif view_option == "Area":
-            areas = [item[0] for item in c.execute("SELECT DISTINCT area FROM tasks WHERE area IS NOT NULL").fetchall()]
-            selected_area = st.selectbox("Select Area", areas)
-            tasks = c.execute("SELECT * FROM tasks WHERE area = ? AND completed = ?", (selected_area, 0 if not show_completed else 1)).fetchall()
-        elif view_option == "Resource":
-            resources = [item[0] for item in c.execute("SELECT DISTINCT resource FROM tasks WHERE resource IS NOT NULL").fetchall()]
-            selected_resource = st.selectbox("Select Resource", resources)
-            tasks = c.execute("SELECT * FROM tasks WHERE resource = ? AND completed = ?", (selected_resource, 0 if not show_completed else 1)).fetchall()
+            where, params = services.task_filter(completed=completed, category=selected_category)
+        elif view_option in ("Project", "Area", "Resource"):
+            column = view_option.lower()
+            selected = st.selectbox(f"Select {view_option}", services.distinct_values(db, column))
+            if selected is not None:
+                where, params = services.task_filter(completed=completed, **{column: selected})
         elif view_option == "Search":
             search_term = st.text_input("Search tasks")
-            if search_term:
-                tasks = c.execute("""SELECT * FROM tasks WHERE completed = ? AND 
-                                    (title LIKE ? OR description LIKE ? OR category LIKE ? OR 
-                                    project LIKE ? OR area LIKE ? OR resource LIKE ?)""", 
-                                    (0 if not show_completed else 1, f"%{search_term}%", f"%{search_term}%", f"%{search_term}%", 
-                                    f"%{search_term}%", f"%{search_term}%", f"%{search_term}%")).fetchall()
-            else:
-                tasks = []
+            if search_term.strip():
+                where, params = services.task_filter(completed=completed, search=search_term)
+
+        tasks = task_pager(where, params, "view_tasks") if where else []
+        rules = load_rules(db, [task.id for task in tasks if task.is_recurring])
+        
+        if tasks and st.toggle("Bulk edit"):
+            # One row per task on this page; the action applies to every
+            # ticked row in a single transaction
+            grid = st.data_editor(
+                pd.DataFrame({
+                    "Select": False,
+                    "Title": [task.title for task in tasks],
+                    "Category": [task.category for task in tasks],
+                    "Due": [task.due_date for task in tasks],
+                }, index=[task.id for task in tasks]),
+                disabled=["Title", "Category", "Due"],
+                hide_index=True,
+                use_container_width=True,
+                key=f"bulk_{where}_{params}_{tasks[0].id}",
+            )
+            selected = [int(task_id) for task_id in grid.index[grid["Select"]]]
+            
+            col1, col2, col3 = st.columns([0.3, 0.3, 0.4])
+            with col1:
+                action = st.selectbox("Action", ["Complete", "Delete", "Move to category", "Shift due date"])
+            with col2:
+                if action == "Move to category":
+                    new_category = st.selectbox("New category", CATEGORIES)
+                elif action == "Shift due date":
+                    shift_days = st.number_input("Days", value=7, step=1)
+            with col3:
+                st.write("")
+                if st.button(f"Apply to {len(selected)} selected", disabled=not selected):
+                    if action == "Complete":
+                        services.complete_tasks(db, selected)
+                    elif action == "Delete":
+                        services.delete_tasks(db, selected)
+                    elif action == "Move to category":
+                        services.move_tasks(db, selected, new_category)
+                    else:
+                        services.shift_due_dates(db, selected, int(shift_days))
+                    st.rerun()
+            tasks = []
+        
+        # Subtasks and their progress for the whole page, one query each
+        page_ids = [task.id for task in tasks]
+        subtask_counts = services.subtask_progress(db, page_ids)
+        subtasks_by_task = services.subtasks_by_task(db, page_ids)
         
         for task in tasks:
             with st.container():
                 col1, col2 = st.columns([0.9, 0.1])
                 with col1:
-                    if task[12]:  # Completed task
-                        st.markdown(f"### ✅ ~~{CATEGORIES[task[3]]} {task[1]}~~")
-                        st.caption(f"**Completed on:** {task[7]}")
-                if not task[12]:
-                    st.markdown(f"### {CATEGORIES[task[3]]} {task[1]}")
-                st.caption(f"**Category:** {task[3]}")
-                if task[4]: st.caption(f"**Project:** {task[4]}")
-                if task[5]: st.caption(f"**Area:** {task[5]}")
-                if task[6] and task[6] != 'None': st.caption(f"**Resource:** {task[6]}")
-                st.caption(f"Added: {task[7]}")
-                if task[8]: st.caption(f"**Due:** {task[8]}")
-                priority_text = {1: "🔥 High", 2: "⚡ Medium", 3: "🐢 Low"}.get(task[9], "⚡ Medium")
+                    if task.completed:
+                        st.markdown(f"### ✅ ~~{CATEGORIES[task.category]} {task.title}~~")
+                        st.caption(f"**Completed on:** {task.created_at}")
+                if not task.completed:
+                    st.markdown(f"### {CATEGORIES[task.category]} {task.title}")
+                st.caption(f"**Category:** {task.category}")
+                if task.project: st.caption(f"**Project:** {task.project}")
+                if task.area: st.caption(f"**Area:** {task.area}")
+                if task.resource and task.resource != 'None': st.caption(f"**Resource:** {task.resource}")
+                st.caption(f"Added: {task.created_at}")
+                if task.due_date: st.caption(f"**Due:** {task.due_date}")
+                rule = rules.get(task.id)
+                if rule and task.due_date:
+                    upcoming = ", ".join(str(day) for day in islice(occurrences(rule, start=task.due_date), 1, 4))
+                    every = f"every {rule.interval} " if rule.interval > 1 else ""
+                    st.caption(f"**Repeats:** {every}{rule.freq.lower()}" + (f" · next: {upcoming}" if upcoming else ""))
+                priority_text = {1: "🔥 High", 2: "⚡ Medium", 3: "🐢 Low"}.get(task.priority, "⚡ Medium")
                 st.caption(f"**Priority:** {priority_text}")
                 with col2:
-                    st.button("✓", key=f"complete_{task[0]}")
-                    if st.button("🗑️", key=f"delete_{task[0]}", on_click=lambda: delete_task(task[0])):
-                        st.experimental_rerun()
-                if st.button("➕", key=f"subtask_{task[0]}"):
-                    with st.expander(f"Add subtask to: {task[1]}"):
-                        with st.form(key=f'subtask_form_{task[0]}'):
-                            subtask_title = st.text_input("Subtask Title")
-                            submitted = st.form_submit_button("Add Subtask")
-                            if submitted:
-                                c.execute("INSERT INTO subtasks (task_id, title) VALUES (?, ?)",
-                                          (task[0], subtask_title))
-                                conn.commit()
-                                st.success(f"Subtask '{subtask_title}' added")
-                    
-                    # Show existing subtasks
-                    subtasks = c.execute("SELECT * FROM subtasks WHERE task_id = ?", (task[0],)).fetchall()
-                    if subtasks:
-                        st.write("Subtasks:")
-                        for subtask in subtasks:
-                            st.checkbox(subtask[2], value=bool(subtask[3]), 
-                                       key=f"subtask_{subtask[0]}", 
-                                       on_change=lambda x=subtask[0]: 
-                                           c.execute("UPDATE subtasks SET completed = ? WHERE id = ?", 
-                                                     (x, subtask[0])) and conn.commit())
+                    if not task.completed:
+                        st.button("✓", key=f"complete_{task.id}", on_click=complete_task, args=(task.id,))
+                    if rule and not task.completed:
+                        st.button("⏭", key=f"skip_{task.id}", help="Skip this occurrence",
+                                  on_click=skip_occurrence, args=(task.id,))
+                    if st.button("🗑️", key=f"delete_{task.id}", on_click=delete_task, args=(task.id,)):
+                        st.rerun()
+                done, total = subtask_counts.get(task.id, (0, 0))
+                with st.expander(f"Subtasks · {done}/{total} done" if total else "➕ Add subtask"):
+                    for subtask in subtasks_by_task[task.id]:
+                        st.checkbox(subtask.title, value=bool(subtask.completed),
+                                    key=f"subtask_done_{subtask.id}",
+                                    on_change=toggle_subtask, args=(subtask.id,))
+                    with st.form(key=f'subtask_form_{task.id}', clear_on_submit=True):
+                        subtask_title = st.text_input("Subtask Title")
+                        if st.form_submit_button("Add Subtask") and subtask_title:
+                            services.add_subtask(db, task.id, subtask_title)
+                            st.rerun()
                 st.divider()
 
+    elif choice == "Search":
+        st.subheader("Search")
+        st.caption("Search across tasks, meetings and voice note transcripts.")
+        
+        search_term = st.text_input("Search everything")
+        if search_term:
+            results = services.search_everything(db, search_term)
+            if results:
+                for _, kind, row_id, title, snippet in results:
+                    with st.container():
+                        st.markdown(f"**{kind}** · {title}")
+                        if snippet:
+                            st.caption(snippet)
+                        st.divider()
+            else:
+                st.info("No matches found.")
+
     elif choice == "Complete Task":
         st.subheader("Mark Task as Complete")
         st.caption("Mark tasks as completed to track your progress.")
         
-        incomplete_tasks = c.execute("SELECT id, title FROM tasks WHERE completed = 0").fetchall()
-        task_dict = {task[1]: task[0] for task in incomplete_tasks}
+        incomplete_tasks = services.incomplete_tasks(db)
+        # Keyed by id so tasks that share a title stay distinct
+        task_labels = {task.id: f"{task.title} (due {task.due_date})" if task.due_date else task.title
+                       for task in incomplete_tasks}
         
-        selected_task = st.selectbox("Select Task to Complete", list(task_dict.keys()))
+        selected_tasks = st.multiselect("Select Tasks to Complete", list(task_labels), format_func=task_labels.get)
         
-        if st.button("Complete Task"):
-            task_id = task_dict[selected_task]
-            c.execute("UPDATE tasks SET completed = 1 WHERE id = ?", (task_id,))
-            conn.commit()
-            st.success(f"Task '{selected_task}' marked as complete")
+        if st.button("Complete Tasks", disabled=not selected_tasks):
+            services.complete_tasks(db, selected_tasks)
+            st.success(f"{len(selected_tasks)} task(s) marked as complete")
     
     elif choice == "Gantt View":
         st.subheader("Task Timeline View")
         st.caption("Visualize your tasks on a timeline to understand deadlines and workload.")
         
-        # Get all tasks with due dates (both completed and incomplete)
-        tasks = c.execute("SELECT id, title, category, due_date, completed FROM tasks WHERE due_date IS NOT NULL").fetchall()
+        today = datetime.now().date()
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            window = st.date_input("Date range", value=(today - timedelta(days=30), today + timedelta(days=90)))
+        with col2:
+            detail_limit = st.number_input("Individual bars up to", min_value=50, value=timeline.DETAIL_LIMIT, step=50,
+                                           help="Larger windows are shown as the number of tasks due per day or week")
         
-        if tasks:
-            # Prepare data for Gantt chart
-            tasks_data = []
-            for task in tasks:
-                tasks_data.append({
-                    "Task": f"{CATEGORIES[task[2]]} {task[1]}",
-                    "Start": datetime.strptime(datetime.now().strftime("%Y-%m-%d"), "%Y-%m-%d"),
-                    "End": datetime.strptime(task[3], "%Y-%m-%d"),
-                    "Category": task[2],
-                    "Completed": bool(task[4])
-                })
-            
-            # Color map for completed vs incomplete tasks
+        if len(window) == 2:
+            start, end = window
+            # Color map for categories
             color_discrete_map = {
                 "Work": "#2ecc71",
                 "Studies": "#3498db",
@@ -444,28 +551,20 @@ def main():
                 "Misc": "#34495e"
             }
             
-            # Create Gantt chart
-            fig = px.timeline(
-                tasks_data,
-                x_start="Start",
-                x_end="End",
-                y="Task",
-                color="Category",
-                title="Task Timeline",
-                color_discrete_map=color_discrete_map,
-                opacity=0.7
-            )
-            
-            # Style completed tasks differently
-            for i, task in enumerate(tasks_data):
-                if task["Completed"]:
-                    fig.data[0].marker.line.width[i] = 0
-                    fig.data[0].marker.opacity[i] = 0.3
-            
-            fig.update_yaxes(autorange="reversed")
-            st.plotly_chart(fig, use_container_width=True)
-        else:
-            st.info("No tasks with due dates found.")
+            occurrences = timeline.occurrence_frame(db, start, end)
+            total = timeline.count_in_window(db, start, end, occurrences)
+            if total > detail_limit:
+                st.caption(f"{total} tasks in this range, showing how many are due per "
+                           f"{'week' if (end - start).days > timeline.DAILY_BUCKET_DAYS else 'day'}.")
+                fig = timeline.density_figure(timeline.density_frame(db, start, end, occurrences), color_discrete_map)
+                st.plotly_chart(fig, use_container_width=True)
+            else:
+                frame = timeline.task_frame(db, start, end, occurrences)
+                if not frame.empty:
+                    fig = timeline.timeline_figure(frame, CATEGORIES, color_discrete_map)
+                    st.plotly_chart(fig, use_container_width=True)
+                else:
+                    st.info("No tasks with due dates in this range.")
 
     elif choice == "Media Library":
         st.subheader("Media Library")
@@ -488,67 +587,57 @@ def main():
                 if submitted:
 
                     
-                    created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    c.execute("INSERT INTO tasks (title, description, category, project, area, resource, created_at, media_type, year, director, rating) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                              (title, description, "Media", project, area, resource, created_at, media_type, year, director, rating))
-                    conn.commit()
+                    services.add_task(db, title, "Media", description, project, area, resource,
+                                      media_type=media_type, year=year, director=director, rating=rating)
                     st.success(f"Media item '{title}' added")
         
         # Get all media tasks (both completed and incomplete)
-        media_tasks = c.execute("SELECT * FROM tasks WHERE category = 'Media'").fetchall()
+        media_tasks = services.media_tasks(db)
         
         if media_tasks:
-            for task in media_tasks:
-                with st.container():
-                    col1, col2 = st.columns([0.9, 0.1])
-                    with col1:
-                        status_icon = "✅" if task[12] else "📺"
-                        st.markdown(f"### {status_icon} {task[1]}")
-                        
-                        # Display cover image if available
-                        if len(task) > 17 and task[17]:  # cover_url
-                            st.image(task[17], width=150)
-                        elif task[13] and task[1]:  # If no cover but has media type and title
-                            with st.spinner("Fetching cover..."):
-                                try:
-                                    if task[13] in ["Movie", "TV Show"]:
-                                        # Try OMDB API for movies/TV shows
-                                        omdb_api_key = st.secrets.get("OMDB_API_KEY", "")
-                                        if omdb_api_key:
-                                            response = requests.get(f"http://www.omdbapi.com/?t={task[1]}&y={task[14] or ''}&apikey={omdb_api_key}")
-                                            if response.status_code == 200 and response.json().get("Poster"):
-                                                cover_url = response.json()["Poster"]
-                                                c.execute("UPDATE tasks SET cover_url = ? WHERE id = ?", (cover_url, task[0]))
-                                                conn.commit()
-                                                st.image(cover_url, width=150)
-                                    elif task[13] == "Book":
-                                        # Try OpenLibrary API for books
-                                        response = requests.get(f"https://openlibrary.org/search.json?title={task[1]}&author={task[15] or ''}")
-                                        if response.status_code == 200 and response.json().get("docs"):
-                                            book = response.json()["docs"][0]
-                                            if book.get("cover_i"):
-                                                cover_url = f"https://covers.openlibrary.org/b/id/{book['cover_i']}-M.jpg"
-                                                c.execute("UPDATE tasks SET cover_url = ? WHERE id = ?", (cover_url, task[0]))
-                                                conn.commit()
-                                                st.image(cover_url, width=150)
-                                except Exception as e:
-                                    st.error(f"Failed to fetch cover: {str(e)}")
-                        
-                        st.caption(f"**Type:** {task[4] if len(task) > 4 and task[4] else 'N/A'}")
-                        if len(task) > 13 and task[13]: st.caption(f"**Media Type:** {task[13]}")
-                        if len(task) > 14 and task[14]: st.caption(f"**Year:** {task[14]}")
-                        if len(task) > 15 and task[15]: st.caption(f"**Director:** {task[15]}")
-                        if len(task) > 16 and task[16]: st.caption(f"**Rating:** {'⭐' * int(task[16])}")
-                        if len(task) > 5 and task[5]: st.caption(f"**Area:** {task[5]}")
-                        if task[6] and task[6] != 'None': st.caption(f"**Resource:** {task[6]}")
-                        st.caption(f"Added: {task[7]}")
-                        if task[8]: st.caption(f"**Completed:** {task[12]}")
-                    with col2:
-                        if not task[12]:
-                            st.button("✓", key=f"complete_media_{task[0]}")
-                        if st.button("🗑️", key=f"delete_media_{task[0]}", on_click=lambda: delete_task(task[0])):
-                            st.experimental_rerun()
-                    st.divider()
+            # Covers are looked up and downloaded in the background. While any
+            # are in flight the list refreshes itself, without a full rerun.
+            cover_fetcher = get_cover_fetcher(workspace.name, db)
+            cover_fetcher.request_lookups([(task.id, task.media_type, task.title, task.year, task.director)
+                                           for task in media_tasks if not task.cover_url])
+            cover_fetcher.request_downloads([task.cover_url for task in media_tasks if task.cover_url])
+            refreshing = cover_fetcher.pending() > 0
+            
+            @st.fragment(run_every=2 if refreshing else None)
+            def media_list():
+                tasks = services.media_tasks(db) if refreshing else media_tasks
+                for task in tasks:
+                    with st.container():
+                        col1, col2 = st.columns([0.9, 0.1])
+                        with col1:
+                            status_icon = "✅" if task.completed else "📺"
+                            st.markdown(f"### {status_icon} {task.title}")
+                            
+                            # Display cover image if available
+                            if task.cover_url:
+                                st.image(cover_fetcher.cached_path(task.cover_url) or task.cover_url, width=150)
+                            elif refreshing:
+                                st.caption("Fetching cover...")
+                            
+                            st.caption(f"**Type:** {task.project or 'N/A'}")
+                            if task.media_type: st.caption(f"**Media Type:** {task.media_type}")
+                            if task.year: st.caption(f"**Year:** {task.year}")
+                            if task.director: st.caption(f"**Director:** {task.director}")
+                            if task.rating: st.caption(f"**Rating:** {'⭐' * int(task.rating)}")
+                            if task.area: st.caption(f"**Area:** {task.area}")
+                            if task.resource and task.resource != 'None': st.caption(f"**Resource:** {task.resource}")
+                            st.caption(f"Added: {task.created_at}")
+                        with col2:
+                            if not task.completed:
+                                st.button("✓", key=f"complete_media_{task.id}", on_click=complete_task, args=(task.id,))
+                            if st.button("🗑️", key=f"delete_media_{task.id}", on_click=delete_task, args=(task.id,)):
+                                st.rerun()
+                        st.divider()
+                # Stop polling once everything has arrived
+                if refreshing and not cover_fetcher.pending():
+                    st.rerun()
+            
+            media_list()
         else:
             st.info("No media tasks found.")
             
@@ -556,18 +645,12 @@ def main():
         st.subheader("Task Statistics")
         st.caption("Visual analytics of your task management patterns.")
         
-        # Get all tasks
-        tasks = c.execute("SELECT * FROM tasks").fetchall()
+        task_stats = task_statistics(workspace.name, services.table_generation(db, "tasks"), datetime.now().date())
         
-        if tasks:
-            # Prepare data for charts
-            df = pd.DataFrame(tasks, columns=["id", "title", "description", "category", "project", "area", "resource", 
-                                            "created_at", "due_date", "priority", "is_recurring", "recurrence_pattern", 
-                                            "completed", "media_type", "year", "director", "rating", "cover_url"])
-            
+        if task_stats["total"]:
             # Completion rate chart
-            completed_count = df["completed"].sum()
-            total_count = len(df)
+            completed_count = task_stats["completed"]
+            total_count = task_stats["total"]
             completion_rate = (completed_count / total_count) * 100 if total_count > 0 else 0
             
             fig1 = px.pie(names=["Completed", "Pending"], 
@@ -577,34 +660,26 @@ def main():
             st.plotly_chart(fig1, use_container_width=True)
             
             # Category distribution chart
-            category_counts = df["category"].value_counts()
-            fig2 = px.bar(category_counts, 
-                         x=category_counts.index, 
-                         y=category_counts.values,
+            categories = [row[0] for row in task_stats["categories"]]
+            fig2 = px.bar(x=categories, 
+                         y=[row[1] for row in task_stats["categories"]],
                          title="Tasks by Category",
-                         color=category_counts.index,
+                         color=categories,
                          labels={"x":"Category", "y":"Count"})
             st.plotly_chart(fig2, use_container_width=True)
             
             # Priority breakdown chart
-            priority_counts = df["priority"].value_counts().sort_index()
             priority_labels = {1:"High", 2:"Medium", 3:"Low"}
-            fig3 = px.pie(priority_counts, 
-                         names=priority_counts.index.map(priority_labels), 
-                         values=priority_counts.values,
+            fig3 = px.pie(names=[priority_labels.get(row[0], row[0]) for row in task_stats["priorities"]], 
+                         values=[row[1] for row in task_stats["priorities"]],
                          title="Tasks by Priority",
                          color_discrete_sequence=["#F44336", "#FFC107", "#4CAF50"])
             st.plotly_chart(fig3, use_container_width=True)
             
             # Overdue tasks
-            if 'due_date' in df.columns:
-                today = datetime.now().date()
-                df['due_date'] = pd.to_datetime(df['due_date']).dt.date
-                overdue_tasks = df[(df['completed'] == 0) & (df['due_date'] < today)]
-                
-                if not overdue_tasks.empty:
-                    st.warning(f"You have {len(overdue_tasks)} overdue tasks!")
-                    st.dataframe(overdue_tasks[["title", "category", "due_date", "priority"]].sort_values("due_date"))
+            if task_stats["overdue_count"]:
+                st.warning(f"You have {task_stats['overdue_count']} overdue tasks!")
+                st.dataframe(task_stats["overdue"])
         else:
             st.info("No tasks found to display statistics.")
         st.caption("View completion rates and task distribution by category.")
@@ -628,21 +703,18 @@ def main():
                 
             submitted = st.form_submit_button("Save Meeting")
             if submitted:
-                created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                c.execute("INSERT INTO meetings (title, summary, attendees, action_items, date, duration, location, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-                          (title, summary, attendees, action_items, str(date), duration, location, created_at))
-                conn.commit()
+                services.add_meeting(db, title, summary, attendees, action_items, date, duration, location)
                 st.success(f"Meeting '{title}' recorded")
         
         # Display existing meetings
-        meetings = c.execute("SELECT * FROM meetings ORDER BY date DESC").fetchall()
+        meetings = services.list_meetings(db)
         for meeting in meetings:
-            with st.expander(f"{meeting[1]} - {meeting[5]}"):
-                st.write(f"**Attendees:** {meeting[3]}")
-                st.write(f"**Duration:** {meeting[6]} minutes")
-                st.write(f"**Location:** {meeting[7]}")
-                st.write(f"**Summary:** {meeting[2]}")
-                st.write(f"**Action Items:** {meeting[4]}")
+            with st.expander(f"{meeting.title} - {meeting.date}"):
+                st.write(f"**Attendees:** {meeting.attendees}")
+                st.write(f"**Duration:** {meeting.duration} minutes")
+                st.write(f"**Location:** {meeting.location}")
+                st.write(f"**Summary:** {meeting.summary}")
+                st.write(f"**Action Items:** {meeting.action_items}")
                 
     elif choice == "Expenses":
         st.subheader("Expense Tracking")
@@ -657,81 +729,133 @@ def main():
             
             submitted = st.form_submit_button("Save Expense")
             if submitted:
-                created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                receipt_data = receipt.read() if receipt else None
-                c.execute("INSERT INTO expenses (description, amount, category, receipt_image, date, created_at) VALUES (?, ?, ?, ?, ?, ?)",
-                          (description, amount, category, receipt_data, str(date), created_at))
-                conn.commit()
+                services.add_expense(db, blob_store, description, amount, category, date, receipt)
                 st.success(f"Expense '{description}' recorded")
         
-        # Display existing expenses
-        expenses = c.execute("SELECT * FROM expenses ORDER BY date DESC").fetchall()
+        # Analytics over a date range and category
+        expenses_generation = services.table_generation(db, "expenses")
+        everything = expense_summary(workspace.name, expenses_generation, *expense_report.expense_filter())
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            start = st.date_input("From", value=None, key="expenses_from")
+        with col2:
+            end = st.date_input("To", value=None, key="expenses_to")
+        with col3:
+            category = st.selectbox("Category", ["All", *everything.by_category["category"]], key="expenses_category")
+        where, params = expense_report.expense_filter(start, end, None if category == "All" else category)
+        summary = expense_summary(workspace.name, expenses_generation, where, params)
+
+        col1, col2 = st.columns(2)
+        col1.metric("Total", f"${summary.total:,.2f}")
+        col2.metric("Expenses", summary.count)
+        if summary.count:
+            fig = px.bar(summary.by_month_category, x="month", y="total", color="category",
+                         labels={"month": "Month", "total": "Total", "category": "Category"},
+                         title="Monthly Expenses")
+            st.plotly_chart(fig, use_container_width=True)
+            st.dataframe(summary.by_category, hide_index=True, use_container_width=True)
+
+            # Reports are only built when their button is clicked
+            report_name = f"expenses_{start or 'start'}_{end or 'end'}"
+            col1, col2 = st.columns(2)
+            with col1:
+                st.download_button("Download CSV", lambda: expense_report.csv_report(db, where, params),
+                                   file_name=f"{report_name}.csv", mime="text/csv")
+            with col2:
+                st.download_button("Download Report", lambda: expense_report.html_report(db, where, params),
+                                   file_name=f"{report_name}.html", mime="text/html")
+
+        # Display the newest matching expenses
+        expenses = services.list_expenses(db, where, params, EXPENSE_LIST_LIMIT)
+        if summary.count > len(expenses):
+            st.caption(f"Showing the {len(expenses)} most recent of {summary.count} expenses")
         for expense in expenses:
-            with st.expander(f"{expense[1]} - ${expense[2]:.2f}"):
-                st.write(f"**Category:** {expense[3]}")
-                st.write(f"**Date:** {expense[5]}")
-                if expense[4]:
-                    st.image(expense[4], width=200)
+            with st.expander(f"{expense.description} - ${expense.amount:.2f}"):
+                st.write(f"**Category:** {expense.category}")
+                st.write(f"**Date:** {expense.date}")
+                if expense.receipt_hash:
+                    # Only the thumbnail is sent unless the original is asked for
+                    if expense.thumbnail_hash:
+                        st.image(blob_store.path(expense.thumbnail_hash), width=200)
+                    elif expense.thumbnail_hash is None:
+                        st.caption("Preparing preview...")
+                    if st.toggle("Full-size receipt", key=f"receipt_{expense.id}"):
+                        st.image(blob_store.path(expense.receipt_hash))
                 
     elif choice == "Voice Notes":
         st.subheader("Voice Notes")
         st.caption("Record and manage your voice memos.")
         
         # Voice recording functionality
-        audio_data = mic_recorder(start_prompt="Start recording", stop_prompt="Stop recording", key="recorder")
+        # Recorded as WAV; it is compressed when saved
+        audio_data = mic_recorder(start_prompt="Start recording", stop_prompt="Stop recording", format="wav", key="recorder")
         
         if audio_data and 'bytes' in audio_data:
             st.audio(audio_data['bytes'], format="audio/wav")
 
+            title = st.text_input("Note Title", key="voice_note_title")
             if st.button("Save Voice Note"):
-                title = st.text_input("Note Title", key=f"voice_note_title_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
                 if title:
-                    created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    c.execute("INSERT INTO voice_notes (title, audio_data, created_at) VALUES (?, ?, ?)",
-                              (title, audio_data['bytes'], created_at))
-                    conn.commit()
+                    with st.spinner("Compressing..."):
+                        services.add_voice_note(db, blob_store, title, audio_data['bytes'])
+                    workspace.transcriber.notify()
                     st.success("Voice note saved!")
         
         # Display existing voice notes
-        voice_notes = c.execute("SELECT id, title, created_at FROM voice_notes ORDER BY created_at DESC").fetchall()
+        voice_notes = services.list_voice_notes(db)
         if voice_notes:
             st.subheader("Saved Voice Notes")
-            for note in voice_notes:
-                with st.expander(f"{note[1]} - {note[2]}"):
-                    audio_data = c.execute("SELECT audio_data FROM voice_notes WHERE id = ?", (note[0],)).fetchone()[0]
-                    st.audio(audio_data, format="audio/wav")
-                    if st.button("Delete", key=f"delete_voice_note_{note[0]}"):
-                        c.execute("DELETE FROM voice_notes WHERE id = ?", (note[0],))
-                        conn.commit()
-                        st.rerun()
-        
-        audio_bytes = None
-        title = st.text_input("Note Title", key=f"voice_note_title_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
-        
-        # Display existing voice notes
-        notes = c.execute("SELECT * FROM voice_notes ORDER BY created_at DESC").fetchall()
-        for note in notes:
-            with st.expander(note[1]):
-                st.write(f"**Created:** {note[4]}")
-                if note[2]:
-                    st.audio(note[2], format='audio/wav')
+            # Transcripts are written in the background. While any are in
+            # progress the list refreshes itself, without a full rerun.
+            transcribing = transcription.pending_count(db) > 0
+
+            @st.fragment(run_every=2 if transcribing else None)
+            def voice_note_list():
+                notes = services.list_voice_notes(db) if transcribing else voice_notes
+                jobs = transcription.jobs_for(db, [note.id for note in notes])
+                for note in notes:
+                    with st.expander(f"{note.title} - {note.created_at}"):
+                        if note.audio_hash:
+                            length = f"{note.duration:.0f}s · " if note.duration else ""
+                            st.caption(f"{length}{note.audio_size / 1024:.0f} KB")
+                            # Audio is only read from disk and sent to the
+                            # browser for the notes being played
+                            if st.toggle("▶ Play", key=f"play_voice_note_{note.id}"):
+                                st.audio(blob_store.path(note.audio_hash), format=note.audio_format or "audio/wav")
+                        job = jobs.get(note.id)
+                        if note.transcript:
+                            st.write(note.transcript)
+                        elif job and job.status == "queued":
+                            st.caption("Waiting to be transcribed...")
+                        elif job and job.status == "running":
+                            st.caption(f"Transcribing... {job.chunks_done}/{job.chunks_total or '?'} parts done")
+                        elif job and job.status == "failed":
+                            st.caption(f"Transcription failed: {job.error}")
+                            if st.button("Retry", key=f"retry_transcription_{note.id}"):
+                                transcription.retry(db, note.id)
+                                workspace.transcriber.notify()
+                                st.rerun()
+                        if st.button("Delete", key=f"delete_voice_note_{note.id}"):
+                            services.delete_voice_note(db, note.id)
+                            st.rerun()
+                # Stop polling once every transcript is in
+                if transcribing and not transcription.pending_count(db):
+                    st.rerun()
+
+            voice_note_list()
         
         # Statistics
+        task_stats = task_statistics(workspace.name, services.table_generation(db, "tasks"), datetime.now().date())
+        
         # Completion rate
-        total_tasks = c.execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
-        completed_tasks = c.execute("SELECT COUNT(*) FROM tasks WHERE completed = 1").fetchone()[0]
+        total_tasks = task_stats["total"]
+        completed_tasks = task_stats["completed"]
         completion_rate = (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0
         
         st.metric("Completion Rate", f"{completion_rate:.1f}%")
         
         # Tasks by category
-        category_stats = c.execute("""
-            SELECT category, 
-                   COUNT(*) as total, 
-                   SUM(CASE WHEN completed = 1 THEN 1 ELSE 0 END) as completed
-            FROM tasks
-            GROUP BY category
-        """).fetchall()
+        category_stats = task_stats["categories"]
         
         if category_stats:
             categories = [stat[0] for stat in category_stats]
@@ -748,5 +872,42 @@ def main():
             fig.add_bar(x=categories, y=completed, name="Completed")
             st.plotly_chart(fig, use_container_width=True)
 
+def performance_panel(profile):
+    with st.sidebar.expander("Performance"):
+        st.checkbox("Profile reruns", key="profile_reruns")
+        st.checkbox("cProfile", key="profile_cpu")
+        st.checkbox("Peak memory", key="profile_memory")
+        if profile is None:
+            st.caption(f"Profiled reruns are shown here and logged to {PERFORMANCE_LOG}.")
+            return
+        query_seconds = sum(query_stats.seconds for query_stats in profile.queries.values())
+        st.metric("Rerun", f"{profile.seconds * 1000:.0f} ms")
+        st.caption(f"{sum(query_stats.calls for query_stats in profile.queries.values())} queries, "
+                   f"{query_seconds * 1000:.0f} ms in SQLite")
+        if profile.peak_memory is not None:
+            st.caption(f"Peak memory {profile.peak_memory / 1024 / 1024:.1f} MiB")
+        st.dataframe(pd.DataFrame({"Section": list(profile.sections),
+                                   "ms": [round(seconds * 1000, 1) for seconds in profile.sections.values()]}),
+                     hide_index=True, use_container_width=True)
+        st.markdown("**Slowest queries**")
+        st.dataframe(pd.DataFrame([query_stats.to_dict() for query_stats in profile.slowest_queries(10)],
+                                  columns=["sql", "calls", "rows", "ms", "slowest_ms"]),
+                     hide_index=True, use_container_width=True)
+        if profile.functions:
+            st.markdown("**Functions by cumulative time**")
+            st.dataframe(pd.DataFrame(profile.functions), hide_index=True, use_container_width=True)
+
+def run():
+    # Opt in from the Performance panel, or for every session with TASKER_PROFILE=1
+    st.session_state.setdefault("profile_reruns", os.environ.get("TASKER_PROFILE") == "1")
+    if not st.session_state.profile_reruns:
+        main()
+        performance_panel(None)
+        return
+    with instrumentation.profiling("rerun", st.session_state.get("profile_cpu", False),
+                                   st.session_state.get("profile_memory", False)) as profile:
+        main()
+    performance_panel(profile)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    run()
\ No newline at end of file
@@ -0,0 +1,44 @@
+from datetime import date
+
+import services
+from alerts import open_alerts, run_tick
+
+
+def _alerts(db):
+    return db.fetchall("SELECT task_id, due_date, kind FROM task_alerts ORDER BY task_id, due_date")
+
+
+def test_ticks_pick_up_tasks_written_since_the_last_one(db):
+    first = services.add_task(db, "Report", "Work", due_date="2025-03-10")
+    services.add_task(db, "Later", "Work", due_date="2025-04-01")
+    assert run_tick(db, date(2025, 3, 10)) == 1
+    assert run_tick(db, date(2025, 3, 10)) == 0
+
+    rescheduled = services.add_task(db, "Slipped", "Work", due_date="2025-04-01")
+    services.shift_due_dates(db, [rescheduled], -25)
+    assert run_tick(db, date(2025, 3, 10)) == 1
+    # The next day the report is overdue too
+    assert run_tick(db, date(2025, 3, 11)) == 1
+    assert _alerts(db) == [(first, "2025-03-10", "overdue"), (rescheduled, "2025-03-07", "overdue")]
+
+
+def test_series_loaded_with_an_old_created_at_gets_its_missed_repeats(db):
+    run_tick(db, date(2025, 3, 10))
+    # As an import or restore writes it: created long before the last tick
+    db.execute("""INSERT INTO tasks (title, category, created_at, due_date, is_recurring, recurrence_pattern)
+                  VALUES ('Stretch', 'Personal', '2020-01-01 00:00:00', '2025-03-08', 1, 'Daily')""")
+    task_id = db.fetchone("SELECT id FROM tasks WHERE title = 'Stretch'")[0]
+    db.execute("INSERT INTO recurrence_rules (task_id, freq, dtstart) VALUES (?, 'Daily', '2025-03-08')", (task_id,))
+    assert run_tick(db, date(2025, 3, 10)) == 3
+    assert [row[1:] for row in _alerts(db)] == [("2025-03-08", "overdue"), ("2025-03-09", "overdue"),
+                                                ("2025-03-10", "due")]
+
+
+def test_completing_a_task_drops_its_alert_at_once(db):
+    done, pending = (services.add_task(db, title, "Work", due_date="2025-03-01") for title in ["Done", "Pending"])
+    run_tick(db, date(2025, 3, 10))
+    assert open_alerts(db)[0] == 2
+    services.complete_tasks(db, [done])
+    count, rows = open_alerts(db)
+    assert count == 1
+    assert [row[0] for row in rows] == [pending]
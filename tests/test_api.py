@@ -0,0 +1,116 @@
+import asyncio
+import json
+
+import pytest
+
+from api import create_app
+
+
+def _request(app, method, path, body=None, query=""):
+    # Drives the ASGI app directly, lifespan included; returns (status, json)
+    async def run():
+        sent = []
+        payload = json.dumps(body).encode() if body is not None else b""
+
+        async def receive():
+            return {"type": "http.request", "body": payload, "more_body": False}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+                 "path": path, "raw_path": path.encode(), "query_string": query.encode(),
+                 "headers": [(b"content-type", b"application/json")], "scheme": "http",
+                 "server": ("test", 80), "client": ("test", 1), "root_path": "", "app": app}
+        async with app.router.lifespan_context(app):
+            await app(scope, receive, send)
+        status = next(message["status"] for message in sent if message["type"] == "http.response.start")
+        data = b"".join(message.get("body", b"") for message in sent if message["type"] == "http.response.body")
+        return status, json.loads(data) if data else None
+
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def app(tmp_path):
+    return create_app(str(tmp_path / "tasks.db"), str(tmp_path / "blobs"))
+
+
+@pytest.mark.parametrize("body, message", [
+    ({"category": "Work"}, "title is required"),
+    ({"title": "T", "category": "Hobbies"}, "category must be one of"),
+    ({"title": "T", "category": "Work", "priority": 5}, "priority must be one of"),
+    ({"title": "T", "category": "Work", "priority": "High"}, "priority must be one of"),
+    ({"title": "T", "category": "Work", "priority": True}, "priority must be one of"),
+    ({"title": "T", "category": "Work", "recurrence": "Hourly", "due_date": "2025-01-01"}, "recurrence must be"),
+    ({"title": "T", "category": "Work", "recurrence": "Weekly"}, "needs a due date"),
+    ({"title": "T", "category": "Work", "due_date": "bad"}, "due_date"),
+    ({"title": "T", "category": "Work", "recurrence": "Weekly", "due_date": "2025-01-01", "until": "someday"},
+     "until"),
+    ({"title": "T", "category": "Work", "recurrence": "Weekly", "due_date": "2025-01-01", "interval": 0},
+     "interval"),
+    ({"title": "T", "category": "Work", "recurrence": "Weekly", "due_date": "2025-01-01", "interval": "2"},
+     "interval"),
+])
+def test_create_task_rejects_invalid_fields(app, body, message):
+    status, data = _request(app, "POST", "/tasks", body)
+    assert status == 400
+    assert message in data["error"]
+    assert _request(app, "GET", "/tasks")[1]["tasks"] == []
+
+
+@pytest.mark.parametrize("body", [
+    ["not", "an", "object"],
+    {"ids": [1], "action": "move"},
+    {"ids": "1,2", "action": "complete"},
+    {"ids": [None], "action": "delete"},
+    {"ids": [1], "action": "shift", "days": None},
+])
+def test_bulk_update_rejects_malformed_bodies(app, body):
+    status, data = _request(app, "POST", "/tasks/bulk", body)
+    assert status == 400
+    assert "error" in data
+
+
+def test_bad_query_parameters_are_400(app):
+    assert _request(app, "GET", "/tasks", query="limit=many")[0] == 400
+    assert _request(app, "POST", "/tasks/bulk", {"ids": [], "action": "archive"})[0] == 400
+    assert _request(app, "POST", "/expenses", {"description": "Lunch", "amount": "ten"})[0] == 400
+
+
+@pytest.mark.parametrize("method, path", [
+    ("GET", "/tasks/999"),
+    ("POST", "/tasks/999/complete"),
+    ("POST", "/tasks/999/skip"),
+    ("POST", "/tasks/999/subtasks"),
+    ("GET", "/voice-notes/999/audio"),
+])
+def test_missing_ids_are_404(app, method, path):
+    status, data = _request(app, method, path, {"title": "Orphan"} if path.endswith("/subtasks") else None)
+    assert status == 404
+    assert data == {"error": "Not found"}
+
+
+def test_recurring_task_round_trip(app):
+    status, data = _request(app, "POST", "/tasks", {"title": "Pay rent", "category": "Personal",
+                                                    "due_date": "2025-01-31", "recurrence": "Monthly"})
+    assert status == 201
+    task_id = data["id"]
+    assert _request(app, "POST", f"/tasks/{task_id}/skip")[0] == 204
+    assert _request(app, "POST", f"/tasks/{task_id}/complete")[0] == 204
+    assert _request(app, "GET", f"/tasks/{task_id}")[1]["due_date"] == "2025-03-31"
+
+
+def test_expenses_are_paged_newest_first(app):
+    for day in range(1, 6):
+        _request(app, "POST", "/expenses", {"description": f"Day {day}", "amount": day, "date": f"2025-01-0{day}"})
+    _request(app, "POST", "/expenses", {"description": "Undated", "amount": 1})
+    seen, query = [], "limit=4"
+    while True:
+        status, data = _request(app, "GET", "/expenses", query=query)
+        assert status == 200
+        seen += [expense["description"] for expense in data["expenses"]]
+        if data["next"] is None:
+            break
+        query = "limit=4&" + "&".join(f"{key}={value or ''}" for key, value in data["next"].items())
+    assert seen == ["Day 5", "Day 4", "Day 3", "Day 2", "Day 1", "Undated"]
@@ -0,0 +1,96 @@
+import gzip
+import io
+import json
+
+import pytest
+
+import services
+from backup import BACKUP_TABLES, VERSION, export_backup, import_backup
+from db import Database
+from migrations import migrate
+
+
+def _fill(db):
+    task_id = services.add_task(db, "Water plants", "Personal", description="The ferns too",
+                                due_date="2025-01-31", recurrence="Monthly")
+    services.skip_occurrence(db, task_id)
+    services.add_subtask(db, task_id, "Fill the can")
+    services.add_task(db, "Read paper", "Studies", project="Thesis")
+    services.add_meeting(db, "Standup", attendees="Ana, Ben", date="2025-01-02")
+    services.add_expense(db, None, "Lunch", 12.5, "Food", "2025-01-03")
+    db.execute("""INSERT INTO voice_notes (title, audio_hash, audio_size, created_at, transcript)
+                  VALUES ('Idea', 'abc', 3, '2025-01-04 10:00:00', 'remember the ferns')""")
+
+
+def _dump(db):
+    return {table: db.fetchall(f"SELECT * FROM {table} ORDER BY 1, 2") for table in BACKUP_TABLES}
+
+
+def _export(db):
+    out = io.BytesIO()
+    counts = export_backup(db, out)
+    return out.getvalue(), counts
+
+
+@pytest.fixture
+def other_db(tmp_path):
+    database = Database(str(tmp_path / "other.db"))
+    with database.connection() as conn:
+        migrate(conn)
+    yield database
+    database.close()
+
+
+def test_round_trip_restores_every_table(db, other_db):
+    _fill(db)
+    data, counts = _export(db)
+    assert counts == {table: len(rows) for table, rows in _dump(db).items()}
+    services.add_task(other_db, "Overwritten", "Misc")
+    generation = services.table_generation(other_db, "tasks")
+
+    assert import_backup(other_db, io.BytesIO(data)) == counts
+    assert _dump(other_db) == _dump(db)
+    # Search indexes are rebuilt and caches keyed on generations invalidated
+    assert sorted(row[1] for row in services.search_everything(other_db, "ferns")) == ["Task", "Voice Note"]
+    assert services.table_generation(other_db, "tasks") > generation
+
+
+def test_restore_accepts_uncompressed_backups(db, other_db):
+    _fill(db)
+    data, counts = _export(db)
+    assert import_backup(other_db, io.BytesIO(gzip.decompress(data))) == counts
+    assert _dump(other_db) == _dump(db)
+
+
+@pytest.mark.parametrize("lines, message", [
+    ([{"format": "tasker-backup", "version": VERSION + 1}], "newer than this app supports"),
+    ([{"format": "tasker-backup", "version": VERSION}, {"table": "users", "columns": ["id"]}], "Unknown table"),
+    ([{"format": "tasker-backup", "version": VERSION}, [1, "No header"]], "before any table header"),
+])
+def test_bad_backup_leaves_the_database_untouched(db, lines, message):
+    _fill(db)
+    before = _dump(db)
+    data = "".join(json.dumps(line) + "\n" for line in lines).encode()
+    with pytest.raises(ValueError, match=message):
+        import_backup(db, io.BytesIO(data))
+    assert _dump(db) == before
+
+
+def test_failed_restore_midway_rolls_back(db):
+    _fill(db)
+    before = _dump(db)
+    lines = [{"format": "tasker-backup", "version": VERSION}, {"table": "tasks", "columns": ["id", "title", "category"]},
+             [1, "Replacement", "Work"], {"table": "users", "columns": ["id"]}]
+    with pytest.raises(ValueError):
+        import_backup(db, io.BytesIO("".join(json.dumps(line) + "\n" for line in lines).encode()))
+    assert _dump(db) == before
+
+
+def test_legacy_json_backup_loads(db):
+    legacy = {"tasks": [[7, "Old task", None, "Work", None, None, None, "2024-01-01 00:00:00", "2024-02-01", 2, 0,
+                         None, 0, None, None, None, None, None]],
+              "subtasks": [[3, 7, "Old subtask", 1]]}
+    counts = import_backup(db, io.BytesIO(json.dumps(legacy, indent=2).encode()))
+    assert counts == {"tasks": 1, "subtasks": 1}
+    assert services.get_task(db, 7).title == "Old task"
+    assert [(subtask.title, subtask.completed) for subtask in services.subtasks_for(db, 7)] == [("Old subtask", 1)]
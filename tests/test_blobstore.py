@@ -0,0 +1,65 @@
+from datetime import timedelta
+
+import pytest
+
+import services
+from blobstore import BlobStore, collect_garbage, externalize_blobs, gc_due
+from snapshots import take_snapshot
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BlobStore(str(tmp_path / "blobs"))
+
+
+def _add_receipt(db, store, data):
+    digest, size = store.put(data)
+    db.execute("INSERT INTO expenses (description, amount, receipt_hash, receipt_size) VALUES ('Lunch', 1, ?, ?)",
+               (digest, size))
+    return digest
+
+
+def test_inline_blobs_are_externalized_once(db, store):
+    db.execute("INSERT INTO expenses (description, amount, receipt_image) VALUES ('Lunch', 1, ?)", (b"receipt",))
+    with db.connection() as conn:
+        assert externalize_blobs(conn, store) == 1
+        # Rows written inline after the first pass are left for a restore to flag
+        conn.execute("UPDATE expenses SET receipt_image = ?", (b"again",))
+        conn.commit()
+        assert externalize_blobs(conn, store) == 0
+        conn.execute("DELETE FROM job_state WHERE name = 'blobs_externalized'")
+        conn.commit()
+        assert externalize_blobs(conn, store) == 1
+    assert db.fetchone("SELECT receipt_image, receipt_size FROM expenses") == (None, 5)
+
+
+def test_unreferenced_blobs_are_collected_after_the_grace_period(db, store, tmp_path):
+    kept = _add_receipt(db, store, b"kept")
+    in_snapshot = _add_receipt(db, store, b"in snapshot")
+    snapshot = take_snapshot(db.path, str(tmp_path / "snapshots"))
+    note_id = services.add_voice_note(db, store, "Idea", b"audio")
+    orphan = db.fetchone("SELECT audio_hash FROM voice_notes WHERE id = ?", (note_id,))[0]
+    services.delete_voice_note(db, note_id)
+    db.execute("DELETE FROM expenses WHERE receipt_hash = ?", (in_snapshot,))
+
+    with db.connection() as conn:
+        assert gc_due(conn)
+        # The first pass only records the orphan
+        assert collect_garbage(conn, store, [snapshot], grace=timedelta(0)) == []
+        assert not gc_due(conn)
+        assert store.exists(orphan)
+        assert collect_garbage(conn, store, [snapshot], grace=timedelta(0)) == [orphan]
+    assert not store.exists(orphan)
+    assert store.exists(kept) and store.exists(in_snapshot)
+
+
+def test_blob_referenced_again_is_not_collected(db, store):
+    digest, _ = store.put(b"receipt")
+    with db.connection() as conn:
+        collect_garbage(conn, store, grace=timedelta(0))
+        conn.commit()
+    _add_receipt(db, store, b"receipt")
+    with db.connection() as conn:
+        assert collect_garbage(conn, store, grace=timedelta(0)) == []
+        assert conn.execute("SELECT COUNT(*) FROM blob_orphans").fetchone()[0] == 0
+    assert store.exists(digest)
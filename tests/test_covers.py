@@ -0,0 +1,101 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import services
+from covers import CoverFetcher
+
+
+COVER = b"\xff\xd8 not really a jpeg"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Canned Open Library and OMDb responses; "Slow" titles outlast the timeout
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        self.server.requests.append(url.path)
+        if query.get("title") == "Slow" or query.get("t") == "Slow":
+            time.sleep(1)
+        if url.path == "/search.json":
+            docs = [{"cover_i": 42}] if query["title"] == "Dune" else []
+            self._send(json.dumps({"docs": docs}).encode())
+        elif url.path == "/omdb":
+            poster = f"http://{self.headers['Host']}/poster.jpg" if query["t"] == "Alien" else "N/A"
+            self._send(json.dumps({"Poster": poster}).encode())
+        elif url.path in ("/covers/42-M.jpg", "/poster.jpg"):
+            self._send(COVER)
+        else:
+            self.send_error(404)
+
+    def _send(self, body):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    httpd.daemon_threads = True
+    httpd.requests = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def fetcher(db, tmp_path, server):
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    fetcher = CoverFetcher(db, str(tmp_path / "covers"), omdb_api_key="key", timeout=0.2, omdb_url=f"{base}/omdb",
+                           openlibrary_search_url=f"{base}/search.json",
+                           openlibrary_covers_url=base + "/covers/{cover_id}-M.jpg")
+    yield fetcher
+    fetcher.shutdown()
+
+
+def _wait(fetcher):
+    deadline = time.monotonic() + 5
+    while fetcher.pending() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not fetcher.pending()
+
+
+def _media(db, title, media_type):
+    task_id = services.add_task(db, title, "Media", media_type=media_type)
+    return (task_id, media_type, title, None, None)
+
+
+def test_found_covers_are_stored_and_downloaded(db, fetcher, server):
+    book, movie = _media(db, "Dune", "Book"), _media(db, "Alien", "Movie")
+    fetcher.request_lookups([book, movie])
+    _wait(fetcher)
+    for item in (book, movie):
+        cover_url = services.get_task(db, item[0]).cover_url
+        assert cover_url.startswith("http://127.0.0.1:")
+        with open(fetcher.cached_path(cover_url), "rb") as f:
+            assert f.read() == COVER
+    assert db.fetchone("SELECT COUNT(*) FROM cover_lookups")[0] == 0
+
+
+def test_misses_and_timeouts_are_recorded_and_not_retried(db, fetcher, server):
+    items = [_media(db, "Unknown", "Book"), _media(db, "Slow", "Book"), _media(db, "Slow", "TV Show")]
+    fetcher.request_lookups(items)
+    _wait(fetcher)
+    assert [services.get_task(db, item[0]).cover_url for item in items] == [None, None, None]
+    assert sorted(row[0] for row in db.fetchall("SELECT task_id FROM cover_lookups")) == [item[0] for item in items]
+
+    requests_made = len(server.requests)
+    fetcher.request_lookups(items)
+    _wait(fetcher)
+    assert len(server.requests) == requests_made
@@ -0,0 +1,102 @@
+import json
+
+import pytest
+
+import importer
+import services
+from importer import detect_format, import_tasks, to_row
+
+
+def _jsonl(*records):
+    return [json.dumps(record) for record in records]
+
+
+@pytest.mark.parametrize("record, message", [
+    ({"category": "Work"}, "title is required"),
+    ({"title": "No category"}, "category is required"),
+    ({"title": "T", "category": "Hobbies"}, "unknown category"),
+    ({"title": "T", "category": "Work", "priority": "urgent"}, "priority must be"),
+    ({"title": "T", "category": "Work", "due_date": "31/01/2025"}, "due_date is not a YYYY-MM-DD date"),
+    ({"title": "T", "category": "Work", "recurrence": "Hourly", "due_date": "2025-01-01"}, "recurrence must be"),
+    ({"title": "T", "category": "Work", "recurrence": "Weekly"}, "needs a due_date"),
+    ({"title": "T", "category": "Work", "recurrence": "Weekly", "due_date": "2025-01-01", "interval": "0"},
+     "interval must be at least 1"),
+    ({"title": "T", "category": "Work", "recurrence": "Weekly", "due_date": "2025-01-01", "count": "two"},
+     "count is not a whole number"),
+    (["not", "an", "object"], "record is not an object"),
+])
+def test_invalid_records_are_rejected(record, message):
+    with pytest.raises(ValueError, match=message):
+        to_row(record)
+
+
+def test_record_fields_are_normalized():
+    values, rule = to_row({"title": " Report ", "category": "work", "priority": "High", "due_date": "2025-03-01T09:00",
+                           "recurrence": "monthly", "interval": "2", "completed": "yes"}, now="2025-01-01 00:00:00")
+    assert values == ("Report", None, "Work", None, None, None, "2025-01-01 00:00:00", "2025-03-01", 1, 1,
+                      "Monthly", 1)
+    assert rule == ("Monthly", 2, "2025-03-01", None, None)
+
+
+def test_import_counts_invalid_and_duplicate_rows(db):
+    services.add_task(db, "Existing", "Work", due_date="2025-01-01")
+    result = import_tasks(db, _jsonl(
+        {"title": "Existing", "category": "Work", "due_date": "2025-01-01"},
+        {"title": "New", "category": "Work", "due_date": "2025-01-02"},
+        {"title": "New", "category": "Work", "due_date": "2025-01-02"},
+        {"title": "Bad date", "category": "Work", "due_date": "soon"},
+        {"title": "Recurring", "category": "Personal", "due_date": "2025-01-31", "recurrence": "Monthly"},
+    ), "jsonl")
+    assert result.read == 5
+    assert (result.inserted, result.duplicates, result.invalid) == (2, 2, 1)
+    assert result.errors == [(4, "due_date is not a YYYY-MM-DD date: 'soon'")]
+    assert services.count_tasks(db, "1", ()) == 3
+    recurring = db.fetchone("SELECT id FROM tasks WHERE title = 'Recurring'")[0]
+    assert db.fetchone("SELECT freq, dtstart FROM recurrence_rules WHERE task_id = ?", (recurring,)) == \
+        ("Monthly", "2025-01-31")
+
+
+def test_imported_rows_are_searchable_across_batches(db):
+    lines = ["Title,Category,Due_Date,Priority\n"] + [f"Import {i},Studies,2025-02-{i % 28 + 1:02},low\n"
+                                                      for i in range(12)]
+    batches = []
+    result = import_tasks(db, lines, "csv", batch_size=5, progress=lambda read, inserted: batches.append(inserted))
+    assert result.inserted == 12
+    assert batches == [5, 10, 12]
+    # The search index and generation counter are maintained per batch
+    assert len(services.fetch_task_page(db, *services.task_filter(search="import"), None, 20)) == 12
+    assert services.table_generation(db, "tasks") > 0
+
+
+def test_large_import_is_bulk_loaded(db, monkeypatch):
+    monkeypatch.setattr(importer, "BULK_MIN_ROWS", 8)
+    services.add_task(db, "Existing", "Work", due_date="2025-01-01")
+    indexes = db.fetchall("SELECT name, sql FROM sqlite_master WHERE tbl_name = 'tasks' ORDER BY name")
+    generation = services.table_generation(db, "tasks")
+    db.execute("DELETE FROM alert_queue")
+
+    lines = _jsonl(*({"title": f"Bulk {i}", "category": "Work", "due_date": f"2025-02-{i + 1:02}"} for i in range(12)))
+    assert import_tasks(db, lines, "jsonl", batch_size=5).inserted == 12
+    # Everything dropped for the load is back, and its work done once
+    assert db.fetchall("SELECT name, sql FROM sqlite_master WHERE tbl_name = 'tasks' ORDER BY name") == indexes
+    assert len(services.fetch_task_page(db, *services.task_filter(search="bulk"), None, 20)) == 12
+    assert services.search_everything(db, "existing")[0][2] == 1
+    assert db.fetchone("SELECT COUNT(*) FROM alert_queue")[0] == 12
+    assert services.table_generation(db, "tasks") > generation
+
+
+def test_ics_todos_are_imported(db):
+    lines = ["BEGIN:VCALENDAR\r\n", "BEGIN:VTODO\r\n", "SUMMARY:Renew passport\\, urgently\r\n",
+             "DUE;VALUE=DATE:20250315\r\n", "PRIORITY:1\r\n", "RRULE:FREQ=YEARLY;COUNT=3\r\n", "END:VTODO\r\n",
+             "END:VCALENDAR\r\n"]
+    result = import_tasks(db, lines, "ics", default_category="Personal")
+    assert result.inserted == 1
+    task = services.get_task(db, 1)
+    assert (task.title, task.category, task.due_date, task.priority) == \
+        ("Renew passport, urgently", "Personal", "2025-03-15", 1)
+
+
+def test_detect_format():
+    assert [detect_format(name) for name in ["a.CSV", "b.ics", "c.ndjson"]] == ["csv", "ics", "jsonl"]
+    with pytest.raises(ValueError):
+        detect_format("tasks.xlsx")
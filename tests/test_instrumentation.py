@@ -0,0 +1,33 @@
+import json
+
+import instrumentation
+
+
+def test_profile_records_statements_and_sections(db):
+    with instrumentation.profiling("rerun") as profile:
+        instrumentation.start_section("Tasks")
+        db.fetchall("SELECT id FROM tasks")
+        db.fetchall("SELECT id FROM tasks")
+        instrumentation.start_section("Stats")
+        db.fetchone("SELECT COUNT(*) FROM tasks")
+    assert set(profile.sections) == {"Tasks", "Stats"}
+    assert sorted(stats.calls for stats in profile.queries.values()) == [1, 2]
+    assert instrumentation.active_profile() is None
+    # Statements outside a profile aren't recorded anywhere
+    db.fetchall("SELECT id FROM tasks")
+    assert sum(stats.calls for stats in profile.queries.values()) == 3
+
+
+def test_log_file_is_created_on_first_write(tmp_path):
+    path = tmp_path / "performance.jsonl"
+    instrumentation.configure_log(str(path))
+    try:
+        assert not path.exists()
+        with instrumentation.profiling("rerun"):
+            pass
+        assert json.loads(path.read_text().splitlines()[-1])["label"] == "rerun"
+    finally:
+        for handler in list(instrumentation._log.handlers):
+            if getattr(handler, "baseFilename", None) == str(path):
+                instrumentation._log.removeHandler(handler)
+                handler.close()
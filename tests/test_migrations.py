@@ -0,0 +1,88 @@
+import sqlite3
+
+import pytest
+
+import services
+from db import Database
+from migrations import MIGRATIONS, migrate, schema_version
+
+
+# tasks and subtasks as the app created them before migrations existed
+BASELINE_SCHEMA = """
+CREATE TABLE tasks (id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT NOT NULL, description TEXT,
+                    category TEXT NOT NULL, project TEXT, area TEXT, resource TEXT, created_at TEXT, due_date TEXT,
+                    priority INTEGER DEFAULT 2, is_recurring INTEGER DEFAULT 0, recurrence_pattern TEXT,
+                    completed INTEGER DEFAULT 0, media_type TEXT, year TEXT, director TEXT, rating INTEGER,
+                    cover_url TEXT);
+CREATE TABLE subtasks (id INTEGER PRIMARY KEY AUTOINCREMENT, task_id INTEGER NOT NULL, title TEXT NOT NULL,
+                       completed INTEGER DEFAULT 0, FOREIGN KEY(task_id) REFERENCES tasks(id));
+"""
+
+
+def test_fresh_database_migrates_to_latest_version(db):
+    with db.connection() as conn:
+        assert schema_version(conn) == len(MIGRATIONS) == 15
+        # Already current: nothing to apply
+        assert migrate(conn) == 15
+
+
+def test_baseline_database_keeps_its_rows(tmp_path):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.execute("""INSERT INTO tasks (title, category, created_at, due_date, is_recurring, recurrence_pattern)
+                    VALUES ('Water plants', 'Personal', '2024-01-01 09:00:00', '2024-01-31', 1, 'Monthly')""")
+    conn.execute("INSERT INTO subtasks (task_id, title) VALUES (1, 'Fetch can')")
+    conn.commit()
+    conn.close()
+
+    db = Database(path)
+    with db.connection() as conn:
+        assert migrate(conn) == 15
+        assert conn.execute("SELECT freq, dtstart FROM recurrence_rules WHERE task_id = 1").fetchone() == \
+            ("Monthly", "2024-01-31")
+    assert services.get_task(db, 1).title == "Water plants"
+    assert [subtask.title for subtask in services.subtasks_for(db, 1)] == ["Fetch can"]
+    assert services.search_everything(db, "plants")[0][2] == 1
+    db.close()
+
+
+def _plans(db, run):
+    # Query plans of the SELECTs `run` makes, with their parameters bound
+    statements = []
+    with db.connection() as conn:
+        conn.set_trace_callback(statements.append)
+        try:
+            run()
+        finally:
+            conn.set_trace_callback(None)
+        return [[row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+                for sql in statements if sql.lstrip().upper().startswith("SELECT")]
+
+
+def _assert_index_searches(plans, table):
+    assert plans
+    for plan in plans:
+        assert any(step.startswith(f"SEARCH {table} USING") and "INDEX" in step for step in plan), plan
+        assert not any(step.startswith(f"SCAN {table}") for step in plan), plan
+
+
+@pytest.mark.parametrize("after", [None, ("2025-01-01", 5), (None, 5)])
+def test_task_pages_search_the_due_date_index(db, after):
+    where, params = services.task_filter()
+    _assert_index_searches(_plans(db, lambda: services.fetch_task_page(db, where, params, after)), "tasks")
+
+
+def test_category_filter_searches_its_index(db):
+    where, params = services.task_filter(completed=0, category="Work")
+    plans = _plans(db, lambda: (services.count_tasks(db, where, params),
+                                services.fetch_task_page(db, where, params, ("2025-01-01", 5))))
+    _assert_index_searches(plans, "tasks")
+    assert all("idx_tasks_category_completed_due" in plan[0] for plan in plans)
+
+
+def test_subtask_queries_search_the_task_index(db):
+    plans = _plans(db, lambda: (services.subtasks_for(db, 1), services.subtasks_by_task(db, [1, 2, 3]),
+                                services.subtask_progress(db, [1, 2, 3])))
+    _assert_index_searches(plans, "subtasks")
+    assert all("idx_subtasks_task" in plan[0] for plan in plans)
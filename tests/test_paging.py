@@ -0,0 +1,61 @@
+import services
+
+
+def _add(db, count, due_dates, category="Work"):
+    return [services.add_task(db, f"Task {i}", category, due_date=due_dates[i % len(due_dates)])
+            for i in range(count)]
+
+
+def _walk(db, where, params, limit):
+    # Every page from the first, as View Tasks' Next button steps through them
+    pages, after = [], None
+    while True:
+        rows = services.fetch_task_page(db, where, params, after, limit)
+        if not rows:
+            return pages
+        pages.append([row.id for row in rows])
+        after = (rows[-1].due_date, rows[-1].id)
+
+
+def test_pages_cover_every_task_once_in_order(db):
+    # Many ties on due_date, and undated tasks that sort after the dated ones
+    _add(db, 23, ["2025-03-02", "2025-03-01", None, "2025-03-01"])
+    where, params = services.task_filter()
+    pages = _walk(db, where, params, limit=5)
+    ids = [task_id for page in pages for task_id in page]
+    expected = [row[0] for row in db.fetchall("""SELECT id FROM tasks
+                                                 ORDER BY due_date IS NULL, due_date, id""")]
+    assert ids == expected
+    assert [len(page) for page in pages] == [5, 5, 5, 5, 3]
+
+
+def test_page_boundary_between_dated_and_undated_tasks(db):
+    _add(db, 4, ["2025-01-01"])
+    _add(db, 3, [None])
+    where, params = services.task_filter()
+    pages = _walk(db, where, params, limit=4)
+    assert [len(page) for page in pages] == [4, 3]
+    assert sorted(pages[0] + pages[1]) == list(range(1, 8))
+
+
+def test_writes_before_the_cursor_dont_shift_later_pages(db):
+    _add(db, 10, ["2025-05-01", "2025-05-02"])
+    where, params = services.task_filter(completed=0)
+    first = services.fetch_task_page(db, where, params, None, 4)
+    after = (first[-1].due_date, first[-1].id)
+    second = [row.id for row in services.fetch_task_page(db, where, params, after, 4)]
+
+    # An earlier task appears and one already seen is completed: offset
+    # paging would repeat or skip a row here, keyset paging doesn't
+    services.add_task(db, "Earlier", "Work", due_date="2025-04-01")
+    services.complete_tasks(db, [first[0].id])
+    assert [row.id for row in services.fetch_task_page(db, where, params, after, 4)] == second
+
+
+def test_filtered_pages_only_hold_matching_tasks(db):
+    work = _add(db, 7, ["2025-02-01", None])
+    _add(db, 5, ["2025-02-01", None], category="Personal")
+    where, params = services.task_filter(category="Work")
+    pages = _walk(db, where, params, limit=3)
+    assert sorted(task_id for page in pages for task_id in page) == work
+    assert services.count_tasks(db, where, params) == len(work)
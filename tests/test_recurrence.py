@@ -0,0 +1,96 @@
+from datetime import date
+
+import pytest
+
+import services
+from recurrence import Rule, expand, occurrences
+
+
+def _rule(freq, dtstart, interval=1, until=None, count=None, exceptions=()):
+    return Rule(1, freq, interval, dtstart, until, count, frozenset(exceptions))
+
+
+def _dates(*values):
+    return [date.fromisoformat(value) for value in values]
+
+
+def test_monthly_from_the_31st_clamps_without_drifting():
+    rule = _rule("Monthly", "2025-01-31")
+    assert list(occurrences(rule, end="2025-05-31")) == \
+        _dates("2025-01-31", "2025-02-28", "2025-03-31", "2025-04-30", "2025-05-31")
+
+
+def test_monthly_from_the_31st_in_a_leap_year():
+    assert list(occurrences(_rule("Monthly", "2024-01-31"), end="2024-03-31")) == \
+        _dates("2024-01-31", "2024-02-29", "2024-03-31")
+
+
+def test_yearly_from_february_29th():
+    assert list(occurrences(_rule("Yearly", "2024-02-29"), end="2028-12-31")) == \
+        _dates("2024-02-29", "2025-02-28", "2026-02-28", "2027-02-28", "2028-02-29")
+
+
+@pytest.mark.parametrize("start", ["2025-06-30", "2025-07-01", "2025-07-31", "2027-01-15"])
+def test_window_starting_mid_series_matches_a_full_walk(start):
+    # occurrences() skips ahead instead of walking from dtstart; it must
+    # land on the same month-end dates
+    rule = _rule("Monthly", "2025-01-31", interval=2)
+    full = [day for day in occurrences(rule, end="2027-12-31") if day >= date.fromisoformat(start)]
+    assert list(occurrences(rule, start=start, end="2027-12-31")) == full
+
+
+def test_until_count_and_exceptions():
+    assert list(occurrences(_rule("Monthly", "2025-01-31", until="2025-03-31"))) == \
+        _dates("2025-01-31", "2025-02-28", "2025-03-31")
+    assert list(occurrences(_rule("Monthly", "2025-01-31", count=2))) == _dates("2025-01-31", "2025-02-28")
+    rule = _rule("Monthly", "2025-01-31", exceptions=_dates("2025-02-28"))
+    assert list(occurrences(rule, end="2025-03-31")) == _dates("2025-01-31", "2025-03-31")
+
+
+def test_completing_a_month_end_task_returns_to_the_31st(db):
+    task_id = services.add_task(db, "Pay rent", "Personal", due_date="2025-01-31", recurrence="Monthly")
+    due_dates = []
+    for _ in range(3):
+        services.complete_tasks(db, [task_id])
+        due_dates.append(services.get_task(db, task_id).due_date)
+    assert due_dates == ["2025-02-28", "2025-03-31", "2025-04-30"]
+    assert services.get_task(db, task_id).completed == 0
+
+
+def test_skipped_month_end_occurrence_is_not_expanded(db):
+    task_id = services.add_task(db, "Invoice", "Work", due_date="2025-01-31", recurrence="Monthly")
+    assert services.skip_occurrence(db, task_id)
+    assert services.get_task(db, task_id).due_date == "2025-02-28"
+    assert list(expand(db, date(2025, 1, 1), date(2025, 4, 30))) == \
+        [(task_id, day) for day in _dates("2025-02-28", "2025-03-31", "2025-04-30")]
+
+
+def test_series_ends_when_its_rule_runs_out(db):
+    task_id = services.add_task(db, "Trial", "Misc", due_date="2025-01-31", recurrence="Monthly",
+                                until="2025-02-28")
+    services.complete_tasks(db, [task_id])
+    assert services.get_task(db, task_id).due_date == "2025-02-28"
+    services.complete_tasks(db, [task_id])
+    assert services.get_task(db, task_id).completed == 1
+
+
+def test_shifted_series_continues_from_its_new_dates(db):
+    task_id = services.add_task(db, "Team sync", "Work", due_date="2025-01-06", recurrence="Weekly",
+                                until="2025-03-31")
+    services.skip_occurrence(db, task_id)
+    services.skip_occurrence(db, task_id)
+    assert services.get_task(db, task_id).due_date == "2025-01-20"
+
+    services.shift_due_dates(db, [task_id], 2)
+    services.complete_tasks(db, [task_id])
+    assert services.get_task(db, task_id).due_date == "2025-01-29"
+    assert db.fetchone("SELECT dtstart, until FROM recurrence_rules WHERE task_id = ?", (task_id,)) == \
+        ("2025-01-08", "2025-04-02")
+    assert db.fetchall("SELECT occurrence_date FROM recurrence_exceptions WHERE task_id = ? ORDER BY 1",
+                       (task_id,)) == [("2025-01-08",), ("2025-01-15",)]
+
+    # A week's shift moves each skipped date onto the next one's old date
+    services.shift_due_dates(db, [task_id], 7)
+    assert db.fetchall("SELECT occurrence_date FROM recurrence_exceptions WHERE task_id = ? ORDER BY 1",
+                       (task_id,)) == [("2025-01-15",), ("2025-01-22",)]
+    assert services.get_task(db, task_id).due_date == "2025-02-05"
@@ -0,0 +1,11 @@
+import services
+
+
+def test_only_the_newest_candidates_are_ranked(db):
+    # The oldest task is the best BM25 match but falls outside the candidates
+    services.add_task(db, "Fern fern fern", "Personal")
+    newer = [services.add_task(db, f"Water the fern in room {i}", "Personal") for i in range(3)]
+    results = services.search_everything(db, "fern", candidates=3)
+    assert sorted(row_id for _, _, row_id, _, _ in results) == newer
+    assert len(services.search_everything(db, "fern")) == 4
+    assert services.search_everything(db, "fe")[0][3] == "**Fern** **fern** **fern**"
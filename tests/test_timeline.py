@@ -0,0 +1,29 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+
+import services
+import timeline
+
+
+# Daily bars from March 3rd, one a month for the rent, and the report
+@pytest.mark.parametrize("end, expected", [(date(2025, 3, 31), 29 + 1 + 1), (date(2025, 9, 30), 212 + 7 + 1)])
+def test_density_counts_match_the_window_count(db, end, expected):
+    start = date(2025, 3, 1)
+    services.add_task(db, "Standup", "Work", due_date="2025-03-03", recurrence="Daily")
+    services.add_task(db, "Rent", "Personal", due_date="2025-03-31", recurrence="Monthly")
+    services.add_task(db, "Report", "Work", due_date="2025-03-10")
+    occurrences = timeline.occurrence_frame(db, start, end)
+
+    total = timeline.count_in_window(db, start, end, occurrences)
+    assert total == expected
+    assert timeline.density_frame(db, start, end, occurrences)["tasks"].sum() == total
+    assert len(timeline.task_frame(db, start, end, occurrences)) == total
+
+
+def test_weekly_buckets_start_on_monday(db):
+    services.add_task(db, "Standup", "Work", due_date="2025-03-05", recurrence="Daily", until="2025-03-11")
+    frame = timeline.density_frame(db, date(2025, 1, 1), date(2025, 12, 31))
+    assert frame[["bucket", "tasks"]].values.tolist() == [[pd.Timestamp("2025-03-03"), 5],
+                                                          [pd.Timestamp("2025-03-10"), 2]]
@@ -0,0 +1,83 @@
+import io
+import os
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+import services
+import transcription
+from blobstore import BlobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BlobStore(str(tmp_path / "blobs"))
+
+
+@pytest.fixture
+def pool():
+    # Threads stand in for the worker processes; the stub engine needs neither
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        yield pool
+
+
+def _recording(seconds, rate=44100):
+    t = np.arange(int(seconds * rate)) / rate
+    out = io.BytesIO()
+    with wave.open(out, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes((np.sin(2 * np.pi * 440 * t) * 8000).astype("<i2").tobytes())
+    return out.getvalue()
+
+
+def _job(db, note_id):
+    return transcription.jobs_for(db, [note_id])[note_id]
+
+
+def _transcript(db, note_id):
+    return db.fetchone("SELECT transcript FROM voice_notes WHERE id = ?", (note_id,))[0]
+
+
+def test_queued_notes_are_transcribed(db, store, pool):
+    note_id = services.add_voice_note(db, store, "Groceries", _recording(3))
+    assert _job(db, note_id).status == "queued"
+    assert transcription.pending_count(db) == 1
+
+    assert transcription.run_pending(db, store, pool, "stub") == 1
+    job = _job(db, note_id)
+    assert (job.status, job.chunks_done, job.chunks_total, job.error) == ("done", 1, 1, None)
+    assert _transcript(db, note_id) == "[3 seconds of audio]"
+    assert transcription.pending_count(db) == 0
+    assert db.fetchone("SELECT rowid FROM voice_notes_fts WHERE voice_notes_fts MATCH 'seconds'")[0] == note_id
+
+
+def test_failures_are_recorded_and_can_be_retried(db, store, pool):
+    undecodable = services.add_voice_note(db, store, "Garbled", b"not audio")
+    missing = services.add_voice_note(db, store, "Lost", _recording(1))
+    audio_hash = db.fetchone("SELECT audio_hash FROM voice_notes WHERE id = ?", (missing,))[0]
+    audio = store.read(audio_hash)
+    os.remove(store.path(audio_hash))
+
+    assert transcription.run_pending(db, store, pool, "stub") == 2
+    for note_id in (undecodable, missing):
+        job = _job(db, note_id)
+        assert job.status == "failed" and job.error
+        assert _transcript(db, note_id) is None
+    assert "decode" in _job(db, undecodable).error
+
+    store.put(audio)
+    transcription.retry(db, missing)
+    assert transcription.run_pending(db, store, pool, "stub") == 1
+    assert _job(db, missing).status == "done"
+    assert _transcript(db, missing) == "[1 seconds of audio]"
+
+
+def test_jobs_fail_without_an_engine(db, store, pool):
+    note_id = services.add_voice_note(db, store, "Groceries", _recording(1))
+    transcription.run_pending(db, store, pool, None)
+    assert _job(db, note_id).status == "failed"
+    assert "engine" in _job(db, note_id).error
@@ -0,0 +1,114 @@
+"""Receipt thumbnails.
+
+A receipt photo is stored as uploaded, plus a small JPEG thumbnail that
+the Expenses list renders instead, so the list never sends multi-megabyte
+originals to the browser. Receipts uploaded before thumbnails existed are
+backfilled by a batch job that decodes them in parallel on a process
+pool:
+
+    python thumbnails.py --db tasks.db
+"""
+import argparse
+import io
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+from PIL import Image, ImageOps
+
+from blobstore import BlobStore
+from db import Database
+from migrations import migrate
+
+
+# Twice the 200 px the list shows, for high-density screens
+THUMBNAIL_SIZE = (400, 400)
+JPEG_QUALITY = 80
+BATCH_SIZE = 64
+# thumbnail_hash of a receipt that couldn't be read as an image, so the
+# backfill doesn't retry it on every run
+UNREADABLE = ""
+
+_log = logging.getLogger(__name__)
+
+
+def make_thumbnail(fileobj):
+    """Return JPEG thumbnail bytes for an image file, or None if it isn't one."""
+    try:
+        with Image.open(fileobj) as image:
+            # JPEGs are decoded straight at a fraction of their size, which
+            # is most of the time saved on phone photos
+            image.draft("RGB", THUMBNAIL_SIZE)
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail(THUMBNAIL_SIZE)
+            out = io.BytesIO()
+            image.convert("RGB").save(out, "JPEG", quality=JPEG_QUALITY, optimize=True)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    return out.getvalue()
+
+
+def _thumbnail_from_path(path):
+    # Runs in a pool process; only the path and the thumbnail cross over
+    try:
+        with open(path, "rb") as f:
+            return make_thumbnail(f)
+    except OSError:
+        return None
+
+
+def process_pool(workers=None):
+    # Spawned rather than forked: the app process runs threads of its own
+    return ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"))
+
+
+def backfill_thumbnails(db, store, workers=None, batch_size=BATCH_SIZE, stop=None, pool=None):
+    """Make thumbnails for receipts that lack one. Returns how many were made.
+
+    Images are decoded on `pool`, or on a pool of `workers` processes made
+    for the run. Setting the `stop` event ends the backfill after the
+    current batch. A broken pool raises BrokenProcessPool.
+    """
+    if pool is None:
+        with process_pool(workers) as pool:
+            return backfill_thumbnails(db, store, batch_size=batch_size, stop=stop, pool=pool)
+    made, last_id = 0, 0
+    while stop is None or not stop.is_set():
+        rows = db.fetchall("""SELECT id, receipt_hash FROM expenses
+                              WHERE receipt_hash IS NOT NULL AND thumbnail_hash IS NULL AND id > ?
+                              ORDER BY id LIMIT ?""", (last_id, batch_size))
+        if not rows:
+            return made
+        # A failed batch is logged and left for the next run
+        try:
+            thumbnails = pool.map(_thumbnail_from_path, [store.path(receipt_hash) for _, receipt_hash in rows])
+            updates = []
+            for (expense_id, _), thumbnail in zip(rows, thumbnails):
+                updates.append((store.put(thumbnail)[0] if thumbnail else UNREADABLE, expense_id))
+            db.executemany("UPDATE expenses SET thumbnail_hash = ? WHERE id = ?", updates)
+            made += sum(digest != UNREADABLE for digest, _ in updates)
+        except BrokenProcessPool:
+            raise
+        except Exception:
+            _log.exception("Thumbnail batch after expense %s failed", last_id)
+        last_id = rows[-1][0]
+    return made
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Make thumbnails for receipts that lack one.")
+    parser.add_argument("--db", default="tasks.db", help="database file (default: tasks.db)")
+    parser.add_argument("--blobs", default="voice_notes", help="blob store directory (default: voice_notes)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    args = parser.parse_args(argv)
+
+    db = Database(args.db)
+    with db.connection() as conn:
+        migrate(conn)
+    print(f"{backfill_thumbnails(db, BlobStore(args.blobs), args.workers)} thumbnails made")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Gantt timeline data, filtered to a date window in SQL.
+
+Small windows are drawn as one bar per task. Once a window holds more
+than a threshold of tasks, they are counted per day or per week in SQL
+instead, so the chart stays responsive however many tasks are dated.
+Recurring occurrences are expanded once per window by occurrence_frame()
+and passed to the functions here, so the count and the chart agree.
+"""
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from recurrence import _chunks, expand
+
+
+# Above this many tasks in the window, show density bars instead
+DETAIL_LIMIT = 500
+# Windows longer than this are bucketed by week rather than by day
+DAILY_BUCKET_DAYS = 120
+_EPOCH = date(1970, 1, 1).toordinal()
+
+
+def occurrence_frame(db, start, end):
+    """Recurring occurrences in the window other than each series' current due date.
+
+    The current due date is a task row of its own. One row of (id,
+    due_date, title, category) per occurrence, with due_date a datetime.
+    """
+    ids, ordinals = [], []
+    for task_id, day in expand(db, start, end, skip_due=True):
+        ids.append(task_id)
+        ordinals.append(day.toordinal())
+    # Ordinals convert to datetime64 far faster than date objects or strings
+    days = (np.array(ordinals, dtype=np.int64) - _EPOCH).astype("datetime64[D]")
+    frame = pd.DataFrame({"id": np.array(ids, dtype=np.int64), "due_date": days.astype("datetime64[ns]")})
+    series = []
+    for chunk in _chunks(frame["id"].unique().tolist()):
+        series += db.fetchall(f"SELECT id, title, category FROM tasks WHERE id IN ({', '.join('?' * len(chunk))})",
+                              chunk)
+    return frame.merge(pd.DataFrame(series, columns=["id", "title", "category"]), on="id")
+
+
+def count_in_window(db, start, end, occurrences=None):
+    """The number of bars task_frame would draw for the window."""
+    if occurrences is None:
+        occurrences = occurrence_frame(db, start, end)
+    return db.fetchone("SELECT COUNT(*) FROM tasks WHERE due_date BETWEEN ? AND ?",
+                       (str(start), str(end)))[0] + len(occurrences)
+
+
+def task_frame(db, start, end, occurrences=None):
+    """One row per task due in the window, plus upcoming recurring occurrences."""
+    frame = pd.DataFrame(db.fetchall("""SELECT id, title, category, due_date, completed FROM tasks
+                                        WHERE due_date BETWEEN ? AND ? ORDER BY due_date, id""",
+                                     (str(start), str(end))),
+                         columns=["id", "title", "category", "due_date", "completed"])
+
+    if occurrences is None:
+        occurrences = occurrence_frame(db, start, end)
+    if not occurrences.empty:
+        due_dates = occurrences["due_date"].dt.strftime("%Y-%m-%d")
+        occurrences = occurrences.assign(due_date=due_dates, title=occurrences["title"] + " (" + due_dates + ")")
+        occurrences["completed"] = 0
+        frame = pd.concat([frame, occurrences], ignore_index=True)
+
+    frame["End"] = pd.to_datetime(frame["due_date"])
+    frame["Start"] = pd.Timestamp.today().normalize()
+    frame["completed"] = frame["completed"].astype(bool)
+    return frame
+
+
+def density_frame(db, start, end, occurrences=None):
+    """Task and occurrence counts per (bucket, category) for the window."""
+    weekly = (end - start).days > DAILY_BUCKET_DAYS
+    # Monday of the due date's week
+    bucket = "date(due_date, '-6 days', 'weekday 1')" if weekly else "due_date"
+    frame = pd.DataFrame(db.fetchall(f"""SELECT {bucket} AS bucket, category, COUNT(*) FROM tasks
+                                         WHERE due_date BETWEEN ? AND ?
+                                         GROUP BY bucket, category ORDER BY bucket""", (str(start), str(end))),
+                         columns=["bucket", "category", "tasks"])
+    frame["bucket"] = pd.to_datetime(frame["bucket"])
+
+    if occurrences is None:
+        occurrences = occurrence_frame(db, start, end)
+    if not occurrences.empty:
+        days = occurrences["due_date"]
+        if weekly:
+            days -= pd.to_timedelta(days.dt.weekday, unit="D")
+        counts = occurrences.groupby([days.rename("bucket"), "category"]).size().reset_index(name="tasks")
+        frame = pd.concat([frame, counts]).groupby(["bucket", "category"], as_index=False)["tasks"].sum()
+    return frame
+
+
+def timeline_figure(frame, categories, colors):
+    """A horizontal bar per task with one trace per category and state.
+
+    Splitting traces by completion lets completed tasks be faded with a
+    single marker setting rather than per-bar styling.
+    """
+    fig = go.Figure()
+    frame = frame.assign(label=frame["category"].map(categories).fillna("") + " " + frame["title"].fillna(""))
+    for (category, completed), group in frame.groupby(["category", "completed"], sort=False):
+        fig.add_trace(go.Bar(
+            base=group["Start"],
+            x=(group["End"] - group["Start"]).dt.total_seconds() * 1000,
+            y=group["label"],
+            orientation="h",
+            name=f"{category} (done)" if completed else category,
+            legendgroup=category,
+            marker=dict(color=colors.get(category), opacity=0.3 if completed else 0.7,
+                        line_width=0 if completed else 1),
+            customdata=group["due_date"],
+            hovertemplate="%{y}<br>Due %{customdata}<extra></extra>",
+        ))
+    fig.update_layout(title="Task Timeline", barmode="overlay", xaxis_type="date",
+                      height=max(400, 22 * frame["label"].nunique()))
+    fig.update_yaxes(autorange="reversed")
+    return fig
+
+
+def density_figure(frame, colors):
+    fig = go.Figure()
+    for category, group in frame.groupby("category", sort=False):
+        fig.add_trace(go.Bar(x=group["bucket"], y=group["tasks"], name=category,
+                             marker_color=colors.get(category)))
+    fig.update_layout(title="Tasks Due", barmode="stack", xaxis_type="date", yaxis_title="Tasks")
+    return fig
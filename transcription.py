@@ -0,0 +1,341 @@
+"""Offline speech-to-text for voice notes.
+
+Saving a voice note queues a transcription job. A TranscriptionWorker
+thread picks queued jobs up, splits each recording into chunks of about
+CHUNK_SECONDS and transcribes the chunks in parallel on a process pool,
+so a long recording takes roughly as long as its slowest chunk and the
+app never waits on any of it. The transcript is written to
+voice_notes.transcript, where the voice_notes_fts triggers index it for
+search.
+
+Recognition runs locally with whichever engine is installed: Vosk (with
+VOSK_MODEL pointing at a model directory) or faster-whisper (WHISPER_MODEL,
+default tiny.en). TRANSCRIBE_ENGINE picks one explicitly; "stub" needs
+nothing installed and writes a placeholder, for trying the pipeline out.
+
+    python transcription.py --once
+    python transcription.py --engine stub
+"""
+import argparse
+import importlib.util
+import io
+import json
+import logging
+import os
+import threading
+import wave
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from multiprocessing import get_context
+
+import numpy as np
+
+from audio import STORED_RATE, decode, resample
+from blobstore import BlobStore
+from db import Database
+from migrations import migrate
+from models import TranscriptionJob, columns, row_factory
+
+
+ENGINES = ["vosk", "whisper", "stub"]
+CHUNK_SECONDS = 30
+# Chunks are cut at the quietest 20 ms in the last few seconds before the
+# limit, so a boundary rarely falls in the middle of a word
+CUT_SEARCH_SECONDS = 3
+CUT_WINDOW_SECONDS = 0.02
+POLL_SECONDS = 5
+
+_log = logging.getLogger(__name__)
+
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def default_engine():
+    """The engine named by TRANSCRIBE_ENGINE, else the first one installed."""
+    engine = os.environ.get("TRANSCRIBE_ENGINE")
+    if engine:
+        if engine not in ENGINES:
+            raise ValueError(f"TRANSCRIBE_ENGINE must be one of {', '.join(ENGINES)}, not {engine!r}")
+        return engine
+    if os.environ.get("VOSK_MODEL") and importlib.util.find_spec("vosk"):
+        return "vosk"
+    if importlib.util.find_spec("faster_whisper"):
+        return "whisper"
+    return None
+
+
+# Audio
+
+def _to_wav(samples, rate):
+    out = io.BytesIO()
+    with wave.open(out, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(np.clip(samples * 32768, -32768, 32767).astype("<i2").tobytes())
+    return out.getvalue()
+
+
+def _cut_point(samples, start, limit, rate):
+    window = max(int(rate * CUT_WINDOW_SECONDS), 1)
+    search_from = max(limit - int(rate * CUT_SEARCH_SECONDS), start + window)
+    region = samples[search_from:limit]
+    windows = len(region) // window
+    if windows < 2:
+        return limit
+    energy = np.square(region[:windows * window]).reshape(windows, window).sum(axis=1)
+    return search_from + int(np.argmin(energy)) * window + window // 2
+
+
+def split_audio(data, chunk_seconds=CHUNK_SECONDS):
+    """Split a recording into 16 kHz mono WAV chunks of at most `chunk_seconds`.
+
+    Raises ValueError for audio that can't be decoded.
+    """
+    samples, rate = decode(data)
+    samples, rate = resample(samples, rate), STORED_RATE
+    size = int(rate * chunk_seconds)
+    chunks, start = [], 0
+    while start < len(samples):
+        end = len(samples) if len(samples) - start <= size else _cut_point(samples, start, start + size, rate)
+        chunks.append(_to_wav(samples[start:end], rate))
+        start = end
+    return chunks
+
+
+# Engines, loaded once per worker process
+
+_engines = {}
+
+
+def _load_engine(engine):
+    if engine == "vosk":
+        from vosk import KaldiRecognizer, Model
+
+        model = Model(os.environ["VOSK_MODEL"])
+
+        def transcribe(data):
+            with wave.open(io.BytesIO(data)) as w:
+                recognizer = KaldiRecognizer(model, w.getframerate())
+                recognizer.AcceptWaveform(w.readframes(w.getnframes()))
+            return json.loads(recognizer.FinalResult())["text"]
+    elif engine == "whisper":
+        from faster_whisper import WhisperModel
+
+        model = WhisperModel(os.environ.get("WHISPER_MODEL", "tiny.en"), device="cpu", compute_type="int8")
+
+        def transcribe(data):
+            segments, _ = model.transcribe(io.BytesIO(data))
+            return " ".join(segment.text.strip() for segment in segments)
+    elif engine == "stub":
+        def transcribe(data):
+            with wave.open(io.BytesIO(data)) as w:
+                return f"[{w.getnframes() / w.getframerate():.0f} seconds of audio]"
+    else:
+        raise ValueError(f"Unknown transcription engine {engine!r}")
+    return transcribe
+
+
+def transcribe_chunk(engine, data):
+    # Runs in a pool process; the model stays loaded for later chunks
+    if engine not in _engines:
+        _engines[engine] = _load_engine(engine)
+    return _engines[engine](data).strip()
+
+
+# Jobs
+
+def enqueue(conn, note_id):
+    """Queue (or requeue) a transcription of voice note `note_id`."""
+    conn.execute("""INSERT INTO transcription_jobs (note_id, status, queued_at) VALUES (?, 'queued', ?)
+                    ON CONFLICT (note_id) DO UPDATE SET status = 'queued', queued_at = excluded.queued_at,
+                    error = NULL, chunks_done = 0, chunks_total = NULL""", (note_id, _now()))
+
+
+def retry(db, note_id):
+    with db.transaction() as conn:
+        enqueue(conn, note_id)
+
+
+def requeue_interrupted(db):
+    # Jobs a stopped worker left running start over
+    db.execute("UPDATE transcription_jobs SET status = 'queued', chunks_done = 0 WHERE status = 'running'")
+
+
+def jobs_for(db, note_ids):
+    """Return {note_id: TranscriptionJob} for the notes that have a job."""
+    if not note_ids:
+        return {}
+    rows = db.fetchall(f"""SELECT {columns(TranscriptionJob)} FROM transcription_jobs
+                           WHERE note_id IN ({', '.join('?' * len(note_ids))})""", list(note_ids),
+                       row_factory(TranscriptionJob))
+    return {row.note_id: row for row in rows}
+
+
+def pending_count(db):
+    return db.fetchone("SELECT COUNT(*) FROM transcription_jobs WHERE status IN ('queued', 'running')")[0]
+
+
+def _claim(db):
+    with db.transaction() as conn:
+        row = conn.execute("""SELECT j.note_id, v.audio_hash FROM transcription_jobs j
+                              JOIN voice_notes v ON v.id = j.note_id
+                              WHERE j.status = 'queued' ORDER BY j.queued_at, j.note_id LIMIT 1""").fetchone()
+        if row:
+            conn.execute("UPDATE transcription_jobs SET status = 'running', started_at = ? WHERE note_id = ?",
+                         (_now(), row[0]))
+    return row
+
+
+def _fail(db, note_id, message):
+    db.execute("UPDATE transcription_jobs SET status = 'failed', error = ?, finished_at = ? WHERE note_id = ?",
+               (message, _now(), note_id))
+
+
+def run_job(db, store, pool, engine, note_id, audio_hash):
+    if engine is None:
+        _fail(db, note_id, "No speech-to-text engine is installed (install vosk or faster-whisper)")
+        return
+    try:
+        chunks = split_audio(store.read(audio_hash))
+    except (OSError, ValueError) as e:
+        _fail(db, note_id, str(e))
+        return
+    db.execute("UPDATE transcription_jobs SET chunks_total = ? WHERE note_id = ?", (len(chunks), note_id))
+    futures = {pool.submit(transcribe_chunk, engine, chunk): index for index, chunk in enumerate(chunks)}
+    texts = [None] * len(chunks)
+    try:
+        for done, future in enumerate(as_completed(futures), start=1):
+            texts[futures[future]] = future.result()
+            db.execute("UPDATE transcription_jobs SET chunks_done = ? WHERE note_id = ?", (done, note_id))
+    except Exception as e:
+        for future in futures:
+            future.cancel()
+        _fail(db, note_id, f"{type(e).__name__}: {e}")
+        if isinstance(e, BrokenProcessPool):
+            raise
+        return
+    with db.transaction() as conn:
+        conn.execute("UPDATE voice_notes SET transcript = ? WHERE id = ?",
+                     (" ".join(text for text in texts if text), note_id))
+        conn.execute("UPDATE transcription_jobs SET status = 'done', finished_at = ? WHERE note_id = ?",
+                     (_now(), note_id))
+
+
+def run_pending(db, store, pool, engine):
+    """Run queued jobs until none are left and return how many ran."""
+    ran = 0
+    while (job := _claim(db)) is not None:
+        run_job(db, store, pool, engine, *job)
+        ran += 1
+    return ran
+
+
+def process_pool(workers=None):
+    # Spawned rather than forked: the app process runs threads of its own
+    return ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"))
+
+
+class TranscriptionWorker(threading.Thread):
+    """Runs queued transcription jobs in the background.
+
+    One worker and its process pool serve every database add()ed to it, in
+    turn. Call notify() after queueing a job to start on it right away;
+    jobs queued by other processes are picked up within `poll` seconds.
+    """
+
+    def __init__(self, db=None, store=None, engine=None, workers=None, poll=POLL_SECONDS):
+        super().__init__(name="transcription", daemon=True)
+        self.engine = engine or default_engine()
+        self.workers = workers
+        self.poll = poll
+        self._sources = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        if db is not None:
+            self.add(db, store)
+
+    def add(self, db, store):
+        """Run the jobs queued in `db`, reading their audio from `store`."""
+        try:
+            requeue_interrupted(db)
+        except Exception:
+            _log.exception("Couldn't requeue interrupted transcriptions in %s", db.path)
+        with self._lock:
+            self._sources[db.path] = (db, store)
+        self.notify()
+
+    def remove(self, db):
+        with self._lock:
+            if self._sources.get(db.path, (None,))[0] is db:
+                del self._sources[db.path]
+
+    def notify(self):
+        self._wake.set()
+
+    def _run_sources(self, pool):
+        with self._lock:
+            sources = list(self._sources.values())
+        for db, store in sources:
+            if self._stop_event.is_set():
+                return
+            # Anything but a broken pool (a missing blob, a locked
+            # database) is logged and retried next poll
+            try:
+                run_pending(db, store, pool, self.engine)
+            except BrokenProcessPool:
+                raise
+            except Exception:
+                _log.exception("Transcription run for %s failed", db.path)
+
+    def run(self):
+        while not self._stop_event.is_set():
+            # Pool processes start on the first submitted chunk, not before.
+            # A worker process that dies (out of memory in a model, say)
+            # breaks the pool, so it is replaced for the next job.
+            with process_pool(self.workers) as pool:
+                try:
+                    while not self._stop_event.is_set():
+                        self._wake.clear()
+                        self._run_sources(pool)
+                        self._wake.wait(self.poll)
+                except BrokenProcessPool:
+                    continue
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake.set()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Transcribe queued voice notes.")
+    parser.add_argument("--db", default="tasks.db", help="database file (default: tasks.db)")
+    parser.add_argument("--blobs", default="voice_notes", help="blob store directory (default: voice_notes)")
+    parser.add_argument("--engine", choices=ENGINES, help="speech-to-text engine (default: the one installed)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument("--once", action="store_true", help="run the queued jobs and exit")
+    args = parser.parse_args(argv)
+
+    db = Database(args.db)
+    with db.connection() as conn:
+        migrate(conn)
+    store = BlobStore(args.blobs)
+    if args.once:
+        requeue_interrupted(db)
+        with process_pool(args.workers) as pool:
+            print(f"{run_pending(db, store, pool, args.engine or default_engine())} jobs run")
+        return
+    worker = TranscriptionWorker(db, store, args.engine, args.workers)
+    worker.start()
+    try:
+        worker.join()
+    except KeyboardInterrupt:
+        worker.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""Per-user workspaces, each with a SQLite database of its own.
+
+A deployment serving several users gives each one a workspace: a
+directory holding that user's database, blob store and snapshots. No two
+users share a database file, so each workspace has its own connection
+pool and write lock, and one user's writes never wait on another's.
+
+Workspace directories are routed into 256 buckets by a hash of the name
+(root/3f/alice/), so no directory grows without bound and a bucket can
+be moved to another volume and symlinked back without touching the rest.
+
+Background work is shared: one BackgroundJobs runs transcription for all
+open workspaces on a single process pool, backfills their receipt
+thumbnails on another, and has one maintenance thread record alerts and
+take snapshots for each in turn.
+
+Existing single-file data is moved into a workspace with
+
+    python workspaces.py --root workspaces import alice --db tasks.db --blobs voice_notes
+"""
+import argparse
+import glob
+import hashlib
+import logging
+import os
+import queue
+import re
+import shutil
+import threading
+from concurrent.futures.process import BrokenProcessPool
+
+import thumbnails
+import transcription
+from alerts import INTERVAL_SECONDS, run_tick
+from blobstore import BlobStore, collect_garbage, externalize_blobs, gc_due
+from db import Database
+from migrations import migrate
+from snapshots import list_snapshots, prune_snapshots, restore_snapshot, snapshot_due, take_snapshot
+
+
+ROOT_ENV = "TASKER_WORKSPACES"
+DB_FILE = "tasks.db"
+BLOB_DIR = "blobs"
+SNAPSHOT_DIR = "snapshots"
+# Workspaces the app keeps open at once; the least recently used is closed
+MAX_OPEN = 64
+# Lower case, so "Alice" and "alice" are one workspace. Email addresses fit.
+NAME_PATTERN = re.compile(r"[a-z0-9][a-z0-9@._+-]{0,127}")
+
+_log = logging.getLogger(__name__)
+
+
+def normalize_name(name):
+    """Return the canonical form of a workspace name. Raises ValueError if it isn't valid."""
+    name = (name or "").strip().lower()
+    if not NAME_PATTERN.fullmatch(name):
+        raise ValueError("Workspace names are letters, digits and @ . _ + -, starting with a letter or digit")
+    return name
+
+
+def workspace_dir(root, name):
+    name = normalize_name(name)
+    return os.path.join(root, hashlib.sha256(name.encode()).hexdigest()[:2], name)
+
+
+def list_workspaces(root):
+    return sorted(os.path.basename(os.path.dirname(path)) for path in glob.glob(os.path.join(root, "*", "*", DB_FILE)))
+
+
+class Workspace:
+    """One user's database, blobs and snapshots."""
+
+    def __init__(self, name, db_path, blob_dir, snapshot_dir):
+        self.name = name
+        self.db_path = db_path
+        self.blob_dir = blob_dir
+        self.snapshot_dir = snapshot_dir
+        self.db = None
+        self.store = None
+        self.transcriber = None
+        self._jobs = None
+        # Held while the shared backfill works on this workspace
+        self._backfill_lock = threading.Lock()
+        self._backfill_stop = threading.Event()
+
+    @classmethod
+    def in_root(cls, root, name):
+        directory = workspace_dir(root, name)
+        return cls(normalize_name(name), os.path.join(directory, DB_FILE), os.path.join(directory, BLOB_DIR),
+                   os.path.join(directory, SNAPSHOT_DIR))
+
+    def open(self):
+        """Create or upgrade the database and return the workspace."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self.store = BlobStore(self.blob_dir)
+        self.db = Database(self.db_path)
+        with self.db.connection() as conn:
+            migrate(conn)
+            externalize_blobs(conn, self.store)
+        return self
+
+    def start(self, jobs):
+        """Hand the workspace to the shared BackgroundJobs."""
+        self._jobs = jobs
+        self.transcriber = jobs.transcriber
+        jobs.add(self)
+        return self
+
+    def backfill_thumbnails(self, pool):
+        with self._backfill_lock:
+            if not self._backfill_stop.is_set():
+                thumbnails.backfill_thumbnails(self.db, self.store, stop=self._backfill_stop, pool=pool)
+
+    def maintain(self):
+        """Record due alerts, take a snapshot and collect unused blobs when due. Failures are logged."""
+        try:
+            run_tick(self.db)
+        except Exception:
+            _log.exception("Alert tick for %s failed", self.db_path)
+        try:
+            if snapshot_due(self.snapshot_dir):
+                take_snapshot(self.db_path, self.snapshot_dir)
+                prune_snapshots(self.snapshot_dir)
+        except Exception:
+            _log.exception("Snapshot of %s failed", self.db_path)
+        try:
+            with self.db.connection() as conn:
+                if gc_due(conn):
+                    collect_garbage(conn, self.store, list_snapshots(self.snapshot_dir))
+        except Exception:
+            _log.exception("Blob collection for %s failed", self.db_path)
+
+    def close(self):
+        if self._jobs is not None:
+            self._jobs.remove(self)
+            self._jobs = None
+        # Waits for a backfill batch in progress
+        self._backfill_stop.set()
+        with self._backfill_lock:
+            self.db.close()
+
+
+class BackgroundJobs:
+    """Transcription, thumbnails and maintenance shared by every open workspace.
+
+    A single TranscriptionWorker (and its process pool) runs the queued
+    jobs of all of them. One thumbnail thread backfills each workspace
+    once, as it is opened, on a pool of its own. A single thread calls
+    each one's maintain() every `interval` seconds. So the number of
+    threads and worker processes stays the same however many workspaces
+    are open.
+    """
+
+    def __init__(self, interval=INTERVAL_SECONDS):
+        self.interval = interval
+        self.transcriber = transcription.TranscriptionWorker()
+        self._workspaces = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._backfills = queue.Queue()
+        self._threads = [threading.Thread(target=self._run, name="maintenance", daemon=True),
+                         threading.Thread(target=self._run_backfills, name="thumbnails", daemon=True)]
+
+    def start(self):
+        self.transcriber.start()
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def add(self, workspace):
+        with self._lock:
+            self._workspaces[workspace.db_path] = workspace
+        self.transcriber.add(workspace.db, workspace.store)
+        self._backfills.put(workspace)
+
+    def remove(self, workspace):
+        self.transcriber.remove(workspace.db)
+        with self._lock:
+            if self._workspaces.get(workspace.db_path) is workspace:
+                del self._workspaces[workspace.db_path]
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            with self._lock:
+                open_now = list(self._workspaces.values())
+            for workspace in open_now:
+                if self._stop_event.is_set():
+                    return
+                workspace.maintain()
+            self._stop_event.wait(self.interval)
+
+    def _run_backfills(self):
+        # Pool processes start on the first receipt that needs one. A pool
+        # broken by a dying worker is replaced and the workspace retried.
+        while not self._stop_event.is_set():
+            with thumbnails.process_pool() as pool:
+                try:
+                    while (workspace := self._backfills.get()) is not None:
+                        try:
+                            workspace.backfill_thumbnails(pool)
+                        except BrokenProcessPool:
+                            self._backfills.put(workspace)
+                            raise
+                        except Exception:
+                            _log.exception("Thumbnail backfill of %s failed", workspace.db_path)
+                    return
+                except BrokenProcessPool:
+                    continue
+
+    def stop(self):
+        self._stop_event.set()
+        self._backfills.put(None)
+        self.transcriber.stop()
+
+
+def import_workspace(root, name, db_path, blob_dir, replace=False):
+    """Copy a single-file database and the blobs it refers to into a workspace.
+
+    The source is read from one snapshot, so the app can keep running on
+    it meanwhile, and is left as it was. With `replace`, an existing
+    workspace database is overwritten in place the way a snapshot restore
+    is, so it is safe while the workspace is open. Returns the workspace
+    and the number of blobs copied.
+    """
+    if not os.path.exists(db_path):
+        raise ValueError(f"No database at {db_path}")
+    workspace = Workspace.in_root(root, name)
+    directory = os.path.dirname(workspace.db_path)
+    if not os.path.exists(workspace.db_path):
+        os.makedirs(directory, exist_ok=True)
+        os.replace(take_snapshot(db_path, directory), workspace.db_path)
+    elif replace:
+        copy = take_snapshot(db_path, directory)
+        restore_snapshot(copy, workspace.db_path)
+        os.remove(copy)
+    else:
+        raise ValueError(f"Workspace {workspace.name} already has a database")
+    workspace.open()
+    source = BlobStore(blob_dir)
+    rows = workspace.db.fetchall("""SELECT receipt_hash FROM expenses UNION SELECT thumbnail_hash FROM expenses
+                                    UNION SELECT audio_hash FROM voice_notes""")
+    copied = 0
+    for (digest,) in rows:
+        # thumbnails.UNREADABLE marks receipts with no thumbnail
+        if not digest or workspace.store.exists(digest) or not source.exists(digest):
+            continue
+        os.makedirs(os.path.dirname(workspace.store.path(digest)), exist_ok=True)
+        try:
+            os.link(source.path(digest), workspace.store.path(digest))
+        except OSError:
+            shutil.copyfile(source.path(digest), workspace.store.path(digest))
+        copied += 1
+    workspace.db.close()
+    return workspace, copied
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage per-user workspaces.")
+    parser.add_argument("--root", default=os.environ.get(ROOT_ENV, "workspaces"),
+                        help=f"workspace root directory (default: ${ROOT_ENV} or workspaces)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="list workspaces")
+    path = commands.add_parser("path", help="print a workspace's database path")
+    path.add_argument("name")
+    imports = commands.add_parser("import", help="copy a single-file database into a workspace")
+    imports.add_argument("name")
+    imports.add_argument("--db", default="tasks.db", help="database file to copy (default: tasks.db)")
+    imports.add_argument("--blobs", default="voice_notes", help="blob store it uses (default: voice_notes)")
+    imports.add_argument("--replace", action="store_true", help="overwrite the workspace's database if it has one")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "list":
+            for name in list_workspaces(args.root):
+                print(name)
+        elif args.command == "path":
+            print(Workspace.in_root(args.root, args.name).db_path)
+        elif args.command == "import":
+            workspace, copied = import_workspace(args.root, args.name, args.db, args.blobs, args.replace)
+            print(f"Imported {args.db} into {workspace.db_path} ({copied} blobs copied)")
+    except ValueError as e:
+        parser.error(str(e))
+
+
+if __name__ == "__main__":
+    main()